@@ -4,11 +4,11 @@ from django.core import checks
 
 @checks.register
 def check_elasticsearch(app_configs, **kwargs):
-    import elasticsearch
     import elasticsearch_dsl
+    from search.client import get_client
 
     try:
-        client = elasticsearch.Elasticsearch(settings.ELASTIC_SEARCH_HOSTS)
+        client = get_client()
         es = elasticsearch_dsl.Search()
         es.using(client).query("match", all="x").execute()
         return []
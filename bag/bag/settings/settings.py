@@ -105,17 +105,88 @@ ELASTIC_INDICES = {
     'BRK_SUBJECT': os.getenv('BRK_SUBJECT', 'brk_v11_subject'),
     'NUMMERAANDUIDING': os.getenv('NUMMERAANDUIDING', 'v11_nummeraanduiding'),
     'BAG_PAND': os.getenv('BAG_PAND', 'bag_v11_pand'),
+    'BAG_SUGGEST': os.getenv('BAG_SUGGEST', 'bag_v11_suggest'),
+}
+
+# the shared client of search.client, maxsize is the pool size per elastic node
+ELASTIC_CLIENT = dict(
+    maxsize=int(os.getenv('ELASTIC_POOL_SIZE', 10)),
+    timeout=int(os.getenv('ELASTIC_TIMEOUT_SECONDS', 10)),
+    max_retries=int(os.getenv('ELASTIC_MAX_RETRIES', 3)),
+    retry_on_timeout=True,
+    # discover the other nodes of the cluster
+    sniff_on_start=os.getenv('ELASTIC_SNIFF', 'false').lower() == 'true',
+    sniff_on_connection_fail=os.getenv('ELASTIC_SNIFF', 'false').lower() == 'true',
+    sniffer_timeout=60 if os.getenv('ELASTIC_SNIFF', 'false').lower() == 'true' else None,
+)
+
+# search and typeahead responses, see search.cache
+SEARCH_CACHE = dict(
+    enabled=os.getenv('SEARCH_CACHE', 'true').lower() == 'true',
+    timeout=int(os.getenv('SEARCH_CACHE_TIMEOUT', 300)),
+    # seconds between the checks for new index generations
+    generation_check=int(os.getenv('SEARCH_CACHE_GENERATION_CHECK', 30)),
+)
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # a shared memcached can be used with SEARCH_CACHE_BACKEND=django.core.cache.backends.memcached.MemcachedCache
+    'search': {
+        'BACKEND': os.getenv('SEARCH_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('SEARCH_CACHE_LOCATION', 'search'),
+        'OPTIONS': {'MAX_ENTRIES': int(os.getenv('SEARCH_CACHE_MAX_ENTRIES', 10000))},
+    },
 }
 
 ELASTIC_INDEXING_TIMEOUT_SECONDS = int(os.getenv('ELASTIC_INDEXING_TIMEOUT_SECONDS', 60))
+# refresh and forcemerge of an index after a bulk load, these are not retried
+ELASTIC_MAINTENANCE_TIMEOUT_SECONDS = int(os.getenv('ELASTIC_MAINTENANCE_TIMEOUT_SECONDS', 3600))
+
+ELASTIC_BLUE_GREEN = dict(
+    # build new generations behind the ELASTIC_INDICES aliases and swap them when complete
+    enabled=os.getenv('ELASTIC_BLUE_GREEN', 'false').lower() == 'true',
+    # previous generations kept for a rollback
+    keep=int(os.getenv('ELASTIC_KEEP_GENERATIONS', 1)),
+    # a new generation needs at least this part of the documents of the live index
+    min_count_ratio=float(os.getenv('ELASTIC_MIN_COUNT_RATIO', 0.9)),
+)
+
+ELASTIC_BULK = dict(
+    # bulk requests sent in parallel per index task, 1 sends the batches one by one
+    threads=int(os.getenv('ELASTIC_BULK_THREADS', 1)),
+    # documents and bytes per bulk request
+    chunk_size=int(os.getenv('ELASTIC_BULK_CHUNK_SIZE', 500)),
+    max_chunk_bytes=int(os.getenv('ELASTIC_BULK_MAX_CHUNK_BYTES', 10 * 1024 * 1024)),
+    # converted batches waiting to be sent, conversion blocks when it is full
+    queue_size=int(os.getenv('ELASTIC_BULK_QUEUE_SIZE', 4)),
+    # retries of rejected (429) documents, with exponential backoff
+    max_retries=int(os.getenv('ELASTIC_BULK_MAX_RETRIES', 5)),
+    initial_backoff=2,
+    # fill new indexes without refreshes and replicas, see search.index.bulk_load
+    bulk_load=os.getenv('ELASTIC_BULK_LOAD', 'false').lower() == 'true',
+    # merge the index to one segment after a bulk load
+    forcemerge=os.getenv('ELASTIC_BULK_FORCEMERGE', 'false').lower() == 'true',
+    # only send the documents that changed since the previous incremental run
+    incremental=os.getenv('ELASTIC_INCREMENTAL', 'false').lower() == 'true',
+    # seconds between the progress lines of an index task
+    progress_interval=int(os.getenv('ELASTIC_PROGRESS_INTERVAL', 30)),
+)
 
 TESTING = 'pytest' in sys.modules or (len(sys.argv) > 1 and sys.argv[1] == 'test')
 if TESTING:
     for k, v in ELASTIC_INDICES.items():
         ELASTIC_INDICES[k] = f'test_{v}'
+    # the tests reload the indexes
+    SEARCH_CACHE['enabled'] = False
 
 BATCH_SETTINGS = dict(
-    batch_size=5000
+    batch_size=5000,
+    # processes converting rows of the large GOB csv files
+    csv_processes=int(os.getenv('CSV_PROCESSES', 4)),
+    # connections recreating the deferred indexes of a table
+    index_workers=int(os.getenv('INDEX_WORKERS', 4)),
 )
 
 
@@ -268,6 +339,10 @@ if SENTRY_DSN:
 # 1 was already user earlier and might still be in use by dataportaal
 ENABLE_WEESP_TYPEAHEAD = 2
 
+# serve the bag typeahead from the completion suggester index (BAG_SUGGEST),
+# the suggest query parameter overrides this per request
+TYPEAHEAD_SUGGEST = os.getenv('TYPEAHEAD_SUGGEST', 'false').lower() == 'true'
+
 APIKEY_MANDATORY = False
 APIKEY_ENDPOINT = os.getenv("APIKEY_ENDPOINT", "http://localhost:8001/signingkeys/")
 apikey_localkeys_env = os.getenv("APIKEY_LOCALKEYS", None)
@@ -0,0 +1,73 @@
+"""
+Benchmark the uva2 CSV readers on a synthetic GOB like CSV file
+"""
+
+import csv
+import os
+import tempfile
+import time
+
+from django.core.management import BaseCommand
+
+from datasets.generic import uva2
+
+# GOB files have around 40 columns, of which process_row uses a part
+USED_COLUMNS = [
+    'identificatie', 'huisnummer', 'huisletter', 'huisnummertoevoeging', 'postcode',
+    'documentdatum', 'documentnummer', 'typeAdresseerbaarObject', 'typeAdres', 'status',
+    'ligtAan:BAG.ORE.identificatie', 'adresseert:BAG.VOT.identificatie',
+    'beginGeldigheid', 'eindGeldigheid',
+]
+COLUMNS = USED_COLUMNS + [f'kolom{i}' for i in range(26)]
+
+
+def write_csv(path, rows):
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f, delimiter=';')
+        writer.writerow(COLUMNS)
+        for i in range(rows):
+            writer.writerow([
+                f'0363200000{i:06d}', str(i % 500), 'A', '', '1011AB',
+                '2018-01-01', f'GV00000{i}', 'Verblijfsobject', 'Hoofdadres', 'Naamgeving uitgegeven',
+                '0363300000000001', f'0363010000{i:06d}',
+                '2018-01-01T00:00:00', '',
+            ] + ['waarde'] * 26)
+
+
+def process_row(r):
+    # column lookups of a typical process_row
+    return (
+        r['identificatie'], r['huisnummer'], r['huisletter'], r['huisnummertoevoeging'],
+        r['postcode'], r['documentdatum'], r['documentnummer'], r['typeAdresseerbaarObject'],
+        r['typeAdres'], r['status'], r['ligtAan:BAG.ORE.identificatie'],
+        r['adresseert:BAG.VOT.identificatie'], r['beginGeldigheid'], r['eindGeldigheid'],
+    )
+
+
+class Command(BaseCommand):
+    """
+    Compare processing a CSV file with dict rows and with records
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rows',
+            type=int,
+            default=1_000_000,
+            help='Number of rows in the synthetic CSV file'
+        )
+
+    def handle(self, *args, **options):
+        fd, source = tempfile.mkstemp(suffix='.csv')
+        os.close(fd)
+
+        try:
+            write_csv(source, options['rows'])
+
+            for name, records in (('dict', False), ('records', True)):
+                start = time.time()
+                for _ in uva2.process_csv(None, None, process_row, source=source, encoding='utf-8', records=records):
+                    pass
+                self.stdout.write(f"{name:<10} {options['rows']} rows {time.time() - start:8.2f} seconds")
+        finally:
+            os.remove(source)
@@ -1,21 +1,26 @@
 import time
+from contextlib import ExitStack
 
 from django.conf import settings
-from django.core.management import BaseCommand
+from django.core.management import BaseCommand, CommandError
 
 import datasets.bag.batch
 import datasets.brk.batch
 from batch import batch
+from batch.report import RunReport
+from search import index
+from search.client import get_client, reset_client
 
 
 class Command(BaseCommand):
-    ordered = ['bag', 'brk', 'gebieden', 'pand']
+    ordered = ['bag', 'brk', 'gebieden', 'pand', 'suggest']
 
     indexes = {
         'bag': [datasets.bag.batch.BuildIndexBagJob],
         'brk': [datasets.brk.batch.BuildIndexKadasterJob],
         'gebieden': [datasets.bag.batch.IndexGebiedenJob],
         'pand': [datasets.bag.batch.IndexPandJob],
+        'suggest': [datasets.bag.batch.BuildIndexSuggestJob],
     }
 
     delete_indexes = {
@@ -23,6 +28,7 @@ class Command(BaseCommand):
         'brk': [datasets.brk.batch.DeleteIndexKadasterJob],
         'gebieden': [datasets.bag.batch.DeleteIndexGebiedJob],
         'pand': [datasets.bag.batch.DeleteIndexPandJob],
+        'suggest': [datasets.bag.batch.DeleteIndexSuggestJob],
     }
 
     def add_arguments(self, parser):
@@ -54,6 +60,64 @@ class Command(BaseCommand):
             default=0,
             help='Build X/Y parts 1/3, 2/3, 3/3')
 
+        parser.add_argument(
+            '--threads',
+            action='store',
+            dest='threads',
+            type=int,
+            default=None,
+            help='Send bulk requests on this many threads per index task')
+
+        parser.add_argument(
+            '--bulk-load',
+            action='store_true',
+            dest='bulk_load',
+            default=False,
+            help='Create and fill indexes without refreshes and replicas, restore them afterwards. '
+                 'Partial builds leave them in bulk load mode until --finish-bulk-load')
+
+        parser.add_argument(
+            '--finish-bulk-load',
+            action='store_true',
+            dest='finish_bulk_load',
+            default=False,
+            help='Restore the settings of the indexes filled by partial --bulk-load builds, before a --swap')
+
+        parser.add_argument(
+            '--blue-green',
+            action='store_true',
+            dest='blue_green',
+            default=False,
+            help='Build a new generation of the indexes next to the live ones and swap the aliases when done')
+
+        parser.add_argument(
+            '--swap',
+            action='store_true',
+            dest='swap',
+            default=False,
+            help='Swap the aliases to the generations built by partial --blue-green builds')
+
+        parser.add_argument(
+            '--rollback',
+            action='store_true',
+            dest='rollback',
+            default=False,
+            help='Point the aliases back to the previous generation')
+
+        parser.add_argument(
+            '--incremental',
+            action='store_true',
+            dest='incremental',
+            default=False,
+            help='Only index the documents that changed since the previous incremental build')
+
+        parser.add_argument(
+            '--report',
+            action='store',
+            dest='report',
+            default=None,
+            help='Write a JSON run report with per task statistics to this file')
+
     def set_partial_config(self, options):
         """
         Do partial configuration
@@ -69,6 +133,29 @@ class Command(BaseCommand):
             settings.PARTIAL_IMPORT['numerator'] = numerator
             settings.PARTIAL_IMPORT['denominator'] = denominator
 
+    def aliases(self, ds):
+        """The index names (aliases) of a dataset"""
+        return [task.index for job_class in self.delete_indexes[ds] for task in job_class().tasks()]
+
+    def targets(self, client, ds):
+        """The indexes the build of a dataset writes to"""
+        if not settings.ELASTIC_BLUE_GREEN['enabled']:
+            return self.aliases(ds)
+        return [index.building_index(client, alias) or alias for alias in self.aliases(ds)]
+
+    def bulk_loads(self, client, ds, options) -> ExitStack:
+        """
+        Bulk load settings for the indexes of a dataset around its whole
+        build, indexes filled by several tasks are restored and merged
+        only once. Partial builds run in parallel processes, their indexes
+        are restored with --finish-bulk-load when all parts are done.
+        """
+        stack = ExitStack()
+        if settings.ELASTIC_BULK['bulk_load'] and not options['partial_index']:
+            for target in self.targets(client, ds):
+                stack.enter_context(index.bulk_load(client, target))
+        return stack
+
     def handle(self, *args, **options):
 
         dataset = options['dataset']
@@ -87,17 +174,60 @@ class Command(BaseCommand):
 
         self.set_partial_config(options)
 
-        for ds in sets:
-
-            if options['delete_indexes']:
-                for job_class in self.delete_indexes[ds]:
-                    batch.execute(job_class())
-                # we do not run the other tasks
-                continue  # to next dataset please..
-
-            if options['build_index']:
-                for job_class in self.indexes[ds]:
-                    batch.execute(job_class())
+        if options['threads']:
+            settings.ELASTIC_BULK['threads'] = options['threads']
+        if settings.ELASTIC_BULK['threads'] > settings.ELASTIC_CLIENT['maxsize']:
+            # a pooled connection per sender thread
+            settings.ELASTIC_CLIENT['maxsize'] = settings.ELASTIC_BULK['threads']
+            reset_client()
+        if options['bulk_load']:
+            settings.ELASTIC_BULK['bulk_load'] = True
+        if options['blue_green']:
+            settings.ELASTIC_BLUE_GREEN['enabled'] = True
+        if options['incremental']:
+            if options['partial_index'] or options['delete_indexes'] or settings.ELASTIC_BLUE_GREEN['enabled']:
+                raise CommandError("--incremental updates the live indexes, it cannot be combined "
+                                   "with --partial, --delete or --blue-green")
+            settings.ELASTIC_BULK['incremental'] = True
+
+        client = get_client()
+
+        if options['rollback']:
+            for ds in sets:
+                for alias in self.aliases(ds):
+                    self.stdout.write("Rolled back {} to {}".format(alias, index.rollback_alias(client, alias)))
+            return
+
+        report = RunReport()
+
+        try:
+            for ds in sets:
+
+                if options['delete_indexes']:
+                    for job_class in self.delete_indexes[ds]:
+                        batch.execute(job_class(), report=report)
+                    # we do not run the other tasks
+                    continue  # to next dataset please..
+
+                if options['build_index']:
+                    with self.bulk_loads(client, ds, options):
+                        for job_class in self.indexes[ds]:
+                            batch.execute(job_class(), report=report)
+
+                if options['finish_bulk_load']:
+                    for target in self.targets(client, ds):
+                        index.restore_settings(client, target)
+
+                # partial builds are swapped with --swap when all parts are done
+                swap = (options['build_index'] and settings.ELASTIC_BLUE_GREEN['enabled']
+                        and not options['partial_index'])
+                if swap or options['swap']:
+                    for alias in self.aliases(ds):
+                        index.swap_alias(client, alias)
+        finally:
+            self.stdout.write(report.summary_table())
+            if options['report']:
+                report.write_json(options['report'])
 
         self.stdout.write(
             "Total Duration: %.2f seconds" % (time.time() - start))
@@ -4,13 +4,14 @@ Database import commands
 
 import sys
 
-from django.core.management import BaseCommand
-from django.db import connection
+from django.core.management import BaseCommand, CommandError
 
 import datasets.bag.batch
 import datasets.brk.batch
 from datasets import validate_tables
+from datasets.generic import shadow
 from batch import batch
+from batch.report import RunReport
 
 
 class Command(BaseCommand):
@@ -55,6 +56,46 @@ class Command(BaseCommand):
             help='Filter on the BasicTask.id_ attribute'
         )
 
+        parser.add_argument(
+            '--workers',
+            dest='workers',
+            type=int,
+            default=1,
+            help='Run independent tasks in parallel on this many workers'
+        )
+
+        parser.add_argument(
+            '--resume',
+            action='store_true',
+            dest='resume',
+            default=False,
+            help='Skip tasks whose input files did not change since their last successful run'
+        )
+
+        parser.add_argument(
+            '--delta',
+            action='store_true',
+            dest='delta',
+            default=False,
+            help='Only apply the rows changed since the previous import to the large tables'
+        )
+
+        parser.add_argument(
+            '--shadow',
+            dest='shadow',
+            nargs='?',
+            const='bag_import',
+            default=None,
+            help='Import into this schema (default bag_import) and swap it into public after validation'
+        )
+
+        parser.add_argument(
+            '--report',
+            dest='report',
+            default=None,
+            help='Write a JSON run report with per task statistics to this file'
+        )
+
     def handle(self, *args, **options):
         dataset = options["dataset"]
 
@@ -71,11 +112,34 @@ class Command(BaseCommand):
             validate_tables.check_table_targets()
             return
 
-        for one_ds in sets:
-            for job_class in self.imports[one_ds]:
-                batch.execute(job_class(), options["filter"])
-
-        # analyze database after job
-        with connection.cursor() as cur:
-            self.stdout.write("Analyzing database...")
-            cur.execute("VACUUM ANALYZE")
+        if options["shadow"]:
+            if sets != self.ordered or options["filter"] or options["delta"] or options["resume"]:
+                raise CommandError(
+                    "--shadow replaces all tables and needs a complete import, "
+                    "it cannot be combined with datasets, --task-filter, --delta or --resume")
+            shadow.create(options["shadow"])
+            shadow.activate(options["shadow"])
+
+        report = RunReport()
+
+        try:
+            for one_ds in sets:
+                for job_class in self.imports[one_ds]:
+                    batch.execute(
+                        job_class(delta=options["delta"]), options["filter"],
+                        workers=options["workers"], report=report, resume=options["resume"],
+                        analyze=True)
+
+            if options["shadow"]:
+                self.stdout.write("Building indexes...")
+                shadow.build_indexes(options["shadow"])
+                validate_tables.check_table_targets()
+                shadow.deactivate()
+                self.stdout.write("Swapping tables...")
+                shadow.swap(options["shadow"])
+        finally:
+            if options["shadow"] and shadow.is_active():
+                shadow.deactivate()
+            self.stdout.write(report.summary_table())
+            if options["report"]:
+                report.write_json(options["report"])
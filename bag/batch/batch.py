@@ -2,35 +2,257 @@ from __future__ import annotations
 
 import gc
 import logging
-from typing import Optional, List
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from contextlib import nullcontext
+from typing import Callable, Optional, List, Dict, Set
+
+from django.db import connection
+
+from batch import checkpoint
+from batch.report import RunReport, TaskStats, current_stats, phase
 
 log = logging.getLogger(__name__)
 
 
-def execute(job: BasicJob, filter: Optional[List[str]] = None):
+def execute(job: BasicJob, filter: Optional[List[str]] = None, workers: int = 1,
+            report: Optional[RunReport] = None, resume: bool = False, analyze: bool = False):
+    """
+    Execute the tasks of a job.
+
+    With ``workers`` > 1 the tasks are run as a dependency graph on a
+    bounded pool of worker threads, see ``BasicTask.requires``.
+
+    When a ``report`` is given the statistics of every task are added to it.
+
+    With ``resume`` tasks are skipped when their checkpoint is still
+    valid, see ``batch.checkpoint``.
+
+    With ``analyze`` the tables written by a task are analyzed right
+    after it, so the following tasks are planned with fresh statistics.
+    """
     log.info("Starting job: %s [%s]", job.name, job.__class__.__name__)
 
-    for task in job.tasks():
-        if not filter or getattr(task, "id_", None) in filter:
-            _execute_task(task)
+    tasks = [
+        task for task in job.tasks()
+        if not filter or getattr(task, "id_", None) in filter
+    ]
+
+    if report is None:
+        report = RunReport()
+
+    dependencies = _dependencies(tasks)
+    required = {
+        id(task): [tasks[j] for j in sorted(dependencies[i])]
+        for i, task in enumerate(tasks)
+    }
+
+    def run(task):
+        stats = TaskStats(job.name, _task_name(task))
+        report.add(stats)
+
+        if resume and checkpoint.is_done(task, required[id(task)]):
+            stats.status = 'skipped'
+            log.info("Skipping task, inputs unchanged: %s", stats.task)
+            return
+
+        with stats.activate(), connection.execute_wrapper(stats):
+            _execute_checkpointed(task)
+        log.info("Finished task: %s in %.2f seconds", stats.task, stats.wall)
+
+        if analyze and stats.tables:
+            start = time.time()
+            _analyze(stats.tables)
+            stats.phases['analyze'] = time.time() - start
+
+    if workers > 1:
+        _execute_parallel(tasks, dependencies, workers, run)
+    else:
+        for task in tasks:
+            run(task)
 
     log.info("Finished job: %s: [%s]", job.name, job.__class__.__name__)
 
 
+def _task_name(task) -> str:
+    if callable(task):
+        return task.__name__
+    return getattr(task, "name", "no name specified")
+
+
 def _execute_task(task):
 
     if callable(task):
-        task_name = task.__name__
         execute_func = task
     else:
-        task_name = getattr(task, "name", "no name specified")
         execute_func = task.execute
 
-    log.debug("Starting task: %s", task_name)
+    log.debug("Starting task: %s", _task_name(task))
 
     execute_func()
 
 
+def _execute_checkpointed(task):
+    """
+    The checkpoint of a task is removed before it runs and stored after
+    it succeeded, each in its own short transaction. A task that fails
+    halfway is never skipped when resuming.
+    """
+    inputs = checkpoint.task_inputs(task)
+
+    if inputs is None:
+        _execute_task(task)
+        return
+
+    task_id = checkpoint.task_id(task)
+    fingerprint = checkpoint.fingerprint(inputs)
+
+    checkpoint.clear(task_id)
+    _execute_task(task)
+    checkpoint.save(task_id, fingerprint)
+
+
+def _analyze(tables):
+    with connection.cursor() as c:
+        for table in sorted(tables):
+            log.debug("Analyzing %s", table)
+            c.execute(f"ANALYZE {connection.ops.quote_name(table)}")
+
+
+def _execute_in_worker(run, task):
+    try:
+        run(task)
+    finally:
+        # Django connections are per thread; do not leave
+        # the connection of this worker open between tasks
+        connection.close()
+
+
+def _dependencies(tasks: list) -> Dict[int, Set[int]]:
+    """
+    Map the position of each task to the positions of the tasks it requires.
+
+    Tasks without a ``requires`` declaration depend on every task
+    that precedes them in the job. Required tasks that are not part
+    of the (filtered) job are assumed to be done already.
+    """
+    dependencies = {}
+
+    for i, task in enumerate(tasks):
+        requires = getattr(task, "requires", None)
+
+        if requires is None:
+            dependencies[i] = set(range(i))
+        else:
+            dependencies[i] = {
+                j for j, other in enumerate(tasks)
+                if j != i and type(other).__name__ in requires
+            }
+
+    return dependencies
+
+
+def _execute_parallel(tasks: list, dependencies: Dict[int, Set[int]], workers: int, run: Callable):
+    """
+    Run tasks as soon as all their requirements are done, with at most
+    ``workers`` tasks running at the same time.
+
+    When a task fails no new tasks are started, running tasks are
+    allowed to finish and the exception is raised.
+    """
+    pending = set(range(len(tasks)))
+    done = set()
+    running = {}
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while pending or running:
+            ready = sorted(i for i in pending if dependencies[i] <= done)
+
+            for i in ready[:workers - len(running)]:
+                pending.remove(i)
+                running[pool.submit(_execute_in_worker, run, tasks[i])] = i
+
+            if not running:
+                raise ValueError("Circular task dependencies: {}".format(
+                    ", ".join(_task_name(tasks[i]) for i in sorted(pending))))
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+
+            for future in finished:
+                i = running.pop(future)
+                error = future.exception()
+                if error:
+                    log.error("Task failed: %s", _task_name(tasks[i]))
+                    pending.clear()
+                    wait(running)
+                    raise error
+
+                done.add(i)
+
+
+class SqlStep:
+    """
+    Named SQL statement with the tables it reads and writes, see
+    ``execute_sql_steps``
+    """
+
+    def __init__(self, name: str, sql: str, reads=(), writes=()):
+        self.__name__ = name
+        self.sql = sql
+        self.reads = set(reads)
+        self.writes = set(writes)
+
+    def conflicts(self, other: SqlStep) -> bool:
+        return bool(
+            self.writes & (other.reads | other.writes) or
+            self.reads & other.writes)
+
+    def __call__(self):
+        log.debug(self.sql)
+        with connection.cursor() as c:
+            c.execute(self.sql)
+
+
+def execute_sql_steps(steps: List[SqlStep], workers: int = 1):
+    """
+    Run SQL steps, concurrently on separate connections where their
+    read and write sets do not conflict. Conflicting steps run in the
+    given order. Every step is timed as a phase of the current task.
+
+    Inside a transaction the steps run in order on its connection,
+    other connections can not see what was written in it.
+    """
+    stats = current_stats()
+    dependencies = {
+        i: {j for j in range(i) if step.conflicts(steps[j])}
+        for i, step in enumerate(steps)
+    }
+
+    if workers > 1 and connection.in_atomic_block:
+        log.warning("Running SQL steps in a transaction, not concurrently")
+        workers = 1
+
+    def run(step):
+        start = time.time()
+        step()
+        wall = time.time() - start
+        if stats:
+            stats.phases[step.__name__] = wall
+            stats.tables.update(step.writes)
+        log.info("Finished step: %s in %.2f seconds", step.__name__, wall)
+
+    def run_in_worker(step):
+        # count the queries on the connection of the worker for the task
+        with connection.execute_wrapper(stats) if stats else nullcontext():
+            run(step)
+
+    if workers > 1:
+        _execute_parallel(steps, dependencies, workers, run_in_worker)
+    else:
+        for step in steps:
+            run(step)
+
+
 class BasicTask:
     """
     Abstract task that splits execution into three parts:
@@ -39,13 +261,28 @@ class BasicTask:
     * ``process``
     * ``after``
 
+    ``requires`` lists the class names of the tasks that must be
+    finished before this task can run. ``None`` means the task depends
+    on every task before it in the job.
+
+    ``inputs`` returns the files the task reads, these are used to
+    checkpoint the task. Tasks with ``database_only = True`` read no
+    files, only what their required tasks wrote, and are checkpointed
+    on those. Tasks with ``checkpoint = False`` are never skipped when
+    resuming a job.
     """
     name = "Basic Task"
+    requires = None
+    checkpoint = True
+    database_only = False
 
     def execute(self):
-        self.before()
-        self.process()
-        self.after()
+        with phase('before'):
+            self.before()
+        with phase('process'):
+            self.process()
+        with phase('after'):
+            self.after()
         gc.collect()
 
     def before(self):
@@ -57,6 +294,12 @@ class BasicTask:
     def process(self):
         pass
 
+    def inputs(self) -> Optional[List[str]]:
+        """
+        Files read by this task, None when unknown
+        """
+        return None
+
 
 class BasicJob:
     """Interface for jobs"""
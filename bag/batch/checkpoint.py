@@ -0,0 +1,97 @@
+"""
+Checkpoints for batch tasks
+
+After every successful run of a task that declares its input files
+(``BasicTask.inputs``) a checkpoint with the fingerprint of those files
+is stored, tasks that only read the database (``BasicTask.database_only``)
+get a checkpoint without files. When resuming a job, tasks whose inputs
+did not change and whose required tasks did not run after them are
+skipped.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+from typing import Dict, List, Optional
+
+from django.db import transaction
+from django.utils import timezone
+
+from batch.models import TaskCheckpoint
+
+log = logging.getLogger(__name__)
+
+
+def task_id(task) -> str:
+    cls = type(task)
+    return '{}.{}'.format(cls.__module__, cls.__qualname__)
+
+
+def task_inputs(task) -> Optional[List[str]]:
+    """
+    Input files of a task, or None when the task can not be checkpointed
+    """
+    if not getattr(task, 'checkpoint', True):
+        return None
+    if getattr(task, 'database_only', False):
+        return []
+    if not hasattr(task, 'inputs'):
+        return None
+    return task.inputs()
+
+
+def fingerprint(paths: List[str]) -> str:
+    """
+    Fingerprint of input files based on modification time and size.
+
+    GOB deliveries keep the modification time of the objectstore,
+    so this changes with every new delivery.
+    """
+    files = []
+    for path in sorted(paths):
+        stat = os.stat(path)
+        files.append([path, stat.st_mtime, stat.st_size])
+
+    return json.dumps(files)
+
+
+def load(task_ids: List[str]) -> Dict[str, TaskCheckpoint]:
+    return TaskCheckpoint.objects.in_bulk(task_ids)
+
+
+def save(task_id_: str, fingerprint_: str):
+    with transaction.atomic():
+        TaskCheckpoint.objects.update_or_create(
+            task_id=task_id_,
+            defaults=dict(fingerprint=fingerprint_, finished=timezone.now()))
+
+
+def clear(task_id_: str):
+    TaskCheckpoint.objects.filter(task_id=task_id_).delete()
+
+
+def is_done(task, required: list) -> bool:
+    """
+    A task is done when its inputs did not change since its checkpoint
+    and all its required (checkpointed) tasks finished before it.
+    """
+    inputs = task_inputs(task)
+    if inputs is None:
+        return False
+
+    checkpoints = load([task_id(t) for t in [task] + required])
+    current = checkpoints.get(task_id(task))
+
+    if not current or current.fingerprint != fingerprint(inputs):
+        return False
+
+    for other in required:
+        if not getattr(other, 'checkpoint', True):
+            # not checkpointed, runs whenever one of its dependants runs
+            continue
+        previous = checkpoints.get(task_id(other))
+        if not previous or previous.finished > current.finished:
+            return False
+
+    return True
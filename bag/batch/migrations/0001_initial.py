@@ -0,0 +1,22 @@
+# Generated by Django 2.2.28 on 2026-10-18 19:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaskCheckpoint',
+            fields=[
+                ('task_id', models.CharField(max_length=200, primary_key=True, serialize=False)),
+                ('fingerprint', models.TextField()),
+                ('finished', models.DateTimeField()),
+            ],
+        ),
+    ]
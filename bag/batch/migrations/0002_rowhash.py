@@ -0,0 +1,25 @@
+# Generated by Django 2.2.28 on 2026-10-18 19:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('batch', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RowHash',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=100)),
+                ('object_id', models.CharField(max_length=200)),
+                ('hash', models.CharField(max_length=16)),
+            ],
+            options={
+                'unique_together': {('source', 'object_id')},
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+from django.db import models
+
+
+class TaskCheckpoint(models.Model):
+    """
+    Last successful run of a batch task and the fingerprint
+    of the input files it was run with.
+    """
+    task_id = models.CharField(max_length=200, primary_key=True)
+    fingerprint = models.TextField()
+    finished = models.DateTimeField()
+
+    def __str__(self):
+        return "{} {}".format(self.task_id, self.finished)
+
+
+class RowHash(models.Model):
+    """
+    Hash of the source row an object was imported from,
+    used by delta imports to find the changed rows.
+    """
+    source = models.CharField(max_length=100)
+    object_id = models.CharField(max_length=200)
+    hash = models.CharField(max_length=16)
+
+    class Meta:
+        unique_together = ('source', 'object_id')
+
+    def __str__(self):
+        return "{} {}".format(self.source, self.object_id)
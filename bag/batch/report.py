@@ -0,0 +1,216 @@
+"""
+Run report for batch jobs
+
+Collects per task wall time per phase, rows read / written, database
+time and memory growth, and renders them as JSON and as a summary table.
+For delta imports the JSON also lists the changed object ids per task,
+for elastic index tasks their throughput.
+"""
+from __future__ import annotations
+
+import json
+import re
+import resource
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Optional
+
+_local = threading.local()
+
+WRITE_STATEMENTS = {'INSERT', 'UPDATE', 'DELETE', 'COPY'}
+
+WRITTEN_TABLE = re.compile(
+    r'^\s*(?:INSERT\s+INTO|UPDATE|DELETE\s+FROM|COPY|CREATE\s+TABLE)\s+(?:ONLY\s+)?"?(\w+)"?',
+    re.IGNORECASE)
+
+
+def current_stats() -> Optional[TaskStats]:
+    """Stats of the task running in this thread, if any"""
+    return getattr(_local, 'stats', None)
+
+
+def count_rows_read(count: int):
+    stats = current_stats()
+    if stats:
+        with stats._lock:
+            stats.rows_read += count
+
+
+def count_rows_written(count: int):
+    stats = current_stats()
+    if stats:
+        with stats._lock:
+            stats.rows_written += count
+
+
+def record_table_written(table: str):
+    """For writes that do not pass the execute wrapper (COPY)"""
+    stats = current_stats()
+    if stats:
+        with stats._lock:
+            stats.tables.add(table)
+
+
+def record_changes(**ids):
+    """Ids of the objects changed by a delta import, for downstream use"""
+    stats = current_stats()
+    if stats:
+        stats.changes = OrderedDict((k, sorted(v)) for k, v in ids.items())
+
+
+def record_index_metrics(metrics: dict):
+    """Throughput of an elastic index task"""
+    stats = current_stats()
+    if stats:
+        stats.index = metrics
+
+
+@contextmanager
+def phase(name: str):
+    """Time a phase of the task running in this thread"""
+    start = time.time()
+    try:
+        yield
+    finally:
+        stats = current_stats()
+        if stats:
+            stats.phases[name] = stats.phases.get(name, 0.0) + time.time() - start
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class TaskStats:
+    """
+    Statistics of one task run.
+
+    Is also a django database execute wrapper, that counts
+    the database time and the rows written by the task. The
+    wrapper is shared by the connections of the workers of a
+    task, the counters are updated under a lock.
+    """
+
+    def __init__(self, job: str, task: str):
+        self.job = job
+        self.task = task
+        self.wall = 0.0
+        self.phases = OrderedDict()
+        self.rows_read = 0
+        self.rows_written = 0
+        self.db_time = 0.0
+        self.db_queries = 0
+        # growth of the peak memory of the process while the task ran,
+        # tasks running concurrently can contribute to each others growth
+        self.rss_growth_mb = 0.0
+        self.status = 'running'
+        self.changes = None
+        self.index = None
+        # tables written by the task
+        self.tables = set()
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.time()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.time() - start
+            rowcount = context['cursor'].rowcount
+            written = rowcount if rowcount > 0 and sql.split(None, 1)[0].upper() in WRITE_STATEMENTS else 0
+            match = WRITTEN_TABLE.match(sql)
+            with self._lock:
+                self.db_time += duration
+                self.db_queries += 1
+                self.rows_written += written
+                if match:
+                    self.tables.add(match.group(1))
+
+    @contextmanager
+    def activate(self):
+        """Make these the stats of the task running in this thread"""
+        _local.stats = self
+        start = time.time()
+        rss_before = peak_rss_mb()
+        try:
+            yield self
+            self.status = 'ok'
+        except BaseException:
+            self.status = 'failed'
+            raise
+        finally:
+            _local.stats = None
+            self.wall = time.time() - start
+            self.rss_growth_mb = max(0.0, peak_rss_mb() - rss_before)
+
+    def to_dict(self) -> dict:
+        result = OrderedDict([
+            ('job', self.job),
+            ('task', self.task),
+            ('status', self.status),
+            ('wall', round(self.wall, 3)),
+            ('phases', OrderedDict((k, round(v, 3)) for k, v in self.phases.items())),
+            ('rows_read', self.rows_read),
+            ('rows_written', self.rows_written),
+            ('db_time', round(self.db_time, 3)),
+            ('db_queries', self.db_queries),
+            ('rss_growth_mb', round(self.rss_growth_mb, 1)),
+        ])
+        if self.changes is not None:
+            result['changes'] = self.changes
+        if self.index is not None:
+            result['index'] = self.index
+        return result
+
+
+class RunReport:
+    """
+    Collects the TaskStats of all tasks executed with this report
+
+    usage:
+
+        report = RunReport()
+        batch.execute(job, report=report)
+        report.write_json('report.json')
+        print(report.summary_table())
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self.tasks = []
+        self._lock = threading.Lock()
+
+    def add(self, stats: TaskStats):
+        with self._lock:
+            self.tasks.append(stats)
+
+    def to_dict(self) -> dict:
+        return OrderedDict([
+            ('started', time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.started))),
+            ('duration', round(time.time() - self.started, 3)),
+            ('peak_rss_mb', round(peak_rss_mb(), 1)),
+            ('tasks', [t.to_dict() for t in self.tasks]),
+        ])
+
+    def write_json(self, path: str):
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    def summary_table(self) -> str:
+        header = (
+            f"{'Task':<50} {'Status':<7} {'Wall(s)':>9} {'Before':>8} {'Process':>9} {'After':>8} "
+            f"{'Read':>9} {'Written':>9} {'DB(s)':>8} {'RSS+(MB)':>8}\n"
+        )
+        lines = [header]
+        for t in self.tasks:
+            lines.append(
+                f"{t.task[:50]:<50} {t.status:<7} {t.wall:>9.2f} "
+                f"{t.phases.get('before', 0.0):>8.2f} {t.phases.get('process', 0.0):>9.2f} "
+                f"{t.phases.get('after', 0.0):>8.2f} {t.rows_read:>9} {t.rows_written:>9} "
+                f"{t.db_time:>8.2f} {t.rss_growth_mb:>8.1f}\n"
+            )
+        lines.append(f"Total duration: {time.time() - self.started:.2f} seconds\n")
+        return ''.join(lines)
@@ -1,6 +1,13 @@
+import json
+import os
+import tempfile
+import threading
+from unittest import mock
+
+from django.db import transaction
 from django.test import TransactionTestCase
 
-from batch import batch
+from batch import batch, checkpoint, report
 
 
 class EmptyJob(batch.BasicJob):
@@ -55,3 +62,360 @@ class JobTest(TransactionTestCase):
 
         batch.execute(SimpleJob("simple", t))
         self.assertEqual(t.executed, True)
+
+
+class RecordingTask(object):
+    requires = ()
+
+    def __init__(self, log):
+        self.name = type(self).__name__
+        self.log = log
+
+    def execute(self):
+        self.log.append(self.name)
+
+
+class FirstTask(RecordingTask):
+    pass
+
+
+class SecondTask(RecordingTask):
+    requires = ('FirstTask',)
+
+
+class ThirdTask(RecordingTask):
+    requires = ('SecondTask', 'FirstTask')
+
+
+class CircularTask(RecordingTask):
+    requires = ('OtherCircularTask',)
+
+
+class OtherCircularTask(RecordingTask):
+    requires = ('CircularTask',)
+
+
+class ParallelJobTest(TransactionTestCase):
+
+    def test_requires_determine_order(self):
+        executed = []
+        job = SimpleJob(
+            "parallel", ThirdTask(executed), SecondTask(executed), FirstTask(executed))
+
+        batch.execute(job, workers=3)
+        self.assertEqual(executed, ['FirstTask', 'SecondTask', 'ThirdTask'])
+
+    def test_independent_tasks_run_concurrently(self):
+        barrier = threading.Barrier(2, timeout=5)
+
+        class WaitingTask(object):
+            name = "waiting"
+            requires = ()
+
+            def execute(self):
+                # only passes when both tasks are running at the same time
+                barrier.wait()
+
+        batch.execute(SimpleJob("parallel", WaitingTask(), WaitingTask()), workers=2)
+
+    def test_undeclared_requires_depends_on_previous_tasks(self):
+        executed = []
+
+        class LastTask(object):
+            name = "last"
+
+            def execute(self):
+                executed.append(self.name)
+
+        job = SimpleJob("parallel", FirstTask(executed), LastTask(), SecondTask(executed))
+        batch.execute(job, workers=3)
+        self.assertEqual(executed, ['FirstTask', 'last', 'SecondTask'])
+
+    def test_failing_task_stops_job(self):
+        executed = []
+
+        class FailingFirstTask(FailingTask):
+            requires = ()
+
+        class AfterFailureTask(RecordingTask):
+            requires = ('FailingFirstTask',)
+
+        job = SimpleJob("parallel", FailingFirstTask(), AfterFailureTask(executed))
+
+        with self.assertRaises(Exception):
+            batch.execute(job, workers=2)
+        self.assertEqual(executed, [])
+
+    def test_circular_requires(self):
+        executed = []
+        job = SimpleJob("parallel", CircularTask(executed), OtherCircularTask(executed))
+
+        with self.assertRaises(ValueError):
+            batch.execute(job, workers=2)
+
+
+class RecordingStep(batch.SqlStep):
+
+    def __init__(self, executed, name, reads=(), writes=(), barrier=None):
+        super().__init__(name, None, reads, writes)
+        self.executed = executed
+        self.barrier = barrier
+
+    def __call__(self):
+        if self.barrier:
+            # only passes when the steps run at the same time
+            self.barrier.wait()
+        self.executed.append(self.__name__)
+
+
+class SqlStepTest(TransactionTestCase):
+
+    def test_conflicts(self):
+        write_a = batch.SqlStep('write_a', '', reads=['b'], writes=['a'])
+
+        self.assertTrue(write_a.conflicts(batch.SqlStep('read_a', '', reads=['a'], writes=['c'])))
+        self.assertTrue(write_a.conflicts(batch.SqlStep('write_b', '', writes=['b'])))
+        self.assertFalse(write_a.conflicts(batch.SqlStep('read_b', '', reads=['b'], writes=['c'])))
+
+    def test_independent_steps_run_concurrently(self):
+        executed = []
+        barrier = threading.Barrier(2, timeout=5)
+
+        batch.execute_sql_steps([
+            RecordingStep(executed, 'num', writes=['num']),
+            RecordingStep(executed, 'vbo', reads=['num'], writes=['vbo'], barrier=barrier),
+            RecordingStep(executed, 'lig', reads=['num'], writes=['lig'], barrier=barrier),
+            RecordingStep(executed, 'geom', reads=['vbo', 'lig'], writes=['num']),
+        ], workers=3)
+
+        self.assertEqual(executed[0], 'num')
+        self.assertEqual(set(executed[1:3]), {'vbo', 'lig'})
+        self.assertEqual(executed[3], 'geom')
+
+    def test_sql_step(self):
+        batch.execute_sql_steps([batch.SqlStep('select', 'SELECT 1')])
+
+    def test_concurrent_steps_are_counted_for_the_task(self):
+        class StepsTask(batch.BasicTask):
+            name = "steps"
+
+            def process(self):
+                batch.execute_sql_steps([
+                    batch.SqlStep('one', 'SELECT 1', writes=['a']),
+                    batch.SqlStep('two', 'SELECT 2', writes=['b']),
+                ], workers=2)
+
+        run_report = report.RunReport()
+        batch.execute(SimpleJob("steps", StepsTask()), report=run_report)
+
+        stats = run_report.tasks[0]
+        self.assertEqual(stats.db_queries, 2)
+        self.assertIn('one', stats.phases)
+        self.assertEqual(stats.tables, {'a', 'b'})
+
+    def test_steps_in_transaction_run_in_order(self):
+        executed = []
+
+        with transaction.atomic():
+            batch.execute_sql_steps([
+                RecordingStep(executed, 'vbo', writes=['vbo']),
+                RecordingStep(executed, 'lig', writes=['lig']),
+            ], workers=2)
+
+        self.assertEqual(executed, ['vbo', 'lig'])
+
+
+class ReportTest(TransactionTestCase):
+
+    def test_task_statistics(self):
+        class ReadingTask(batch.BasicTask):
+            name = "reading"
+
+            def process(self):
+                report.count_rows_read(10)
+                report.count_rows_written(4)
+
+        run_report = report.RunReport()
+        batch.execute(SimpleJob("report", ReadingTask()), report=run_report)
+
+        stats = run_report.to_dict()['tasks'][0]
+        self.assertEqual(stats['job'], 'report')
+        self.assertEqual(stats['task'], 'reading')
+        self.assertEqual(stats['status'], 'ok')
+        self.assertEqual(list(stats['phases']), ['before', 'process', 'after'])
+        self.assertEqual(stats['rows_read'], 10)
+        self.assertEqual(stats['rows_written'], 4)
+        self.assertGreaterEqual(stats['rss_growth_mb'], 0)
+        self.assertIn('reading', run_report.summary_table())
+
+    def test_rows_written_by_statement(self):
+        stats = report.TaskStats('report', 'copy')
+
+        def execute(sql, params, many, context):
+            context['cursor'].rowcount = 3
+
+        statements = [
+            'COPY bag_pand (id) FROM STDIN',
+            '  insert into bag_pand values (1)',
+            'SELECT 1',
+            'CREATE TABLE x (id int)',
+        ]
+        for sql in statements:
+            stats(execute, sql, None, False, {'cursor': mock.Mock()})
+
+        self.assertEqual(stats.rows_written, 6)
+        self.assertEqual(stats.tables, {'bag_pand', 'x'})
+
+    def test_counts_of_concurrent_workers(self):
+        stats = report.TaskStats('report', 'workers')
+
+        def execute(sql, params, many, context):
+            context['cursor'].rowcount = 1
+
+        def worker():
+            for _ in range(1000):
+                stats(execute, 'UPDATE bag_pand SET id = 1', None, False, {'cursor': mock.Mock()})
+
+        workers = [threading.Thread(target=worker) for _ in range(4)]
+        for t in workers:
+            t.start()
+        for t in workers:
+            t.join()
+
+        self.assertEqual(stats.db_queries, 4000)
+        self.assertEqual(stats.rows_written, 4000)
+
+    def test_written_tables_are_analyzed(self):
+        class WritingTask(batch.BasicTask):
+            name = "writing"
+
+            def process(self):
+                checkpoint.save('writing', 'fingerprint')
+
+        run_report = report.RunReport()
+        batch.execute(SimpleJob("report", WritingTask()), report=run_report, analyze=True)
+
+        stats = run_report.tasks[0]
+        self.assertEqual(stats.tables, {'batch_taskcheckpoint'})
+        self.assertIn('analyze', stats.phases)
+
+    def test_changes(self):
+        class DeltaTask(batch.BasicTask):
+            name = "delta"
+
+            def process(self):
+                report.record_changes(inserted=['2', '1'], updated=[], deleted=['3'])
+
+        run_report = report.RunReport()
+        batch.execute(SimpleJob("report", DeltaTask(), FirstTask([])), report=run_report)
+
+        tasks = run_report.to_dict()['tasks']
+        self.assertEqual(tasks[0]['changes'], {'inserted': ['1', '2'], 'updated': [], 'deleted': ['3']})
+        self.assertNotIn('changes', tasks[1])
+
+    def test_failed_task_is_reported(self):
+        run_report = report.RunReport()
+
+        with self.assertRaises(Exception):
+            batch.execute(FailedJob(), report=run_report)
+
+        self.assertEqual(run_report.tasks[0].status, 'failed')
+
+    def test_write_json(self):
+        run_report = report.RunReport()
+        batch.execute(SimpleJob("report", FirstTask([])), report=run_report)
+
+        with tempfile.NamedTemporaryFile(suffix='.json') as f:
+            run_report.write_json(f.name)
+            data = json.load(open(f.name))
+
+        self.assertEqual(data['tasks'][0]['task'], 'FirstTask')
+
+
+class InputTask(batch.BasicTask):
+    requires = ()
+
+    def __init__(self, path, log):
+        self.name = type(self).__name__
+        self.path = path
+        self.log = log
+
+    def inputs(self):
+        return [self.path]
+
+    def process(self):
+        self.log.append(self.name)
+
+
+class DependentInputTask(InputTask):
+    requires = ('InputTask',)
+
+
+class CheckpointTest(TransactionTestCase):
+
+    def setUp(self):
+        self.source = tempfile.NamedTemporaryFile()
+        self.executed = []
+
+    def tearDown(self):
+        self.source.close()
+
+    def job(self):
+        return SimpleJob(
+            "checkpoint",
+            InputTask(self.source.name, self.executed),
+            DependentInputTask(self.source.name, self.executed))
+
+    def test_resume_skips_unchanged_tasks(self):
+        batch.execute(self.job())
+        run_report = report.RunReport()
+        batch.execute(self.job(), resume=True, report=run_report)
+
+        self.assertEqual(self.executed, ['InputTask', 'DependentInputTask'])
+        self.assertEqual([t.status for t in run_report.tasks], ['skipped', 'skipped'])
+
+    def test_resume_runs_changed_tasks_and_dependants(self):
+        batch.execute(self.job())
+        stat = os.stat(self.source.name)
+        os.utime(self.source.name, (stat.st_atime, stat.st_mtime + 10))
+
+        batch.execute(self.job(), resume=True)
+        self.assertEqual(self.executed, ['InputTask', 'DependentInputTask'] * 2)
+
+    def test_without_resume_all_tasks_run(self):
+        batch.execute(self.job())
+        batch.execute(self.job())
+        self.assertEqual(len(self.executed), 4)
+
+    def test_failed_task_is_not_checkpointed(self):
+        class FailingInputTask(InputTask):
+            def process(self):
+                raise Exception()
+
+        with self.assertRaises(Exception):
+            batch.execute(SimpleJob("checkpoint", FailingInputTask(self.source.name, [])))
+
+        self.assertEqual(checkpoint.load([checkpoint.task_id(FailingInputTask('', []))]), {})
+
+    def test_failed_task_loses_its_checkpoint(self):
+        batch.execute(self.job())
+
+        class FailingDependentTask(DependentInputTask):
+            def process(self):
+                raise Exception()
+
+        with self.assertRaises(Exception):
+            batch.execute(SimpleJob("checkpoint", FailingDependentTask(self.source.name, [])))
+
+        self.assertEqual(checkpoint.load([checkpoint.task_id(FailingDependentTask('', []))]), {})
+
+    def test_database_only_task(self):
+        class DatabaseTask(RecordingTask):
+            database_only = True
+            requires = ('InputTask',)
+
+        job = SimpleJob("checkpoint", InputTask(self.source.name, self.executed), DatabaseTask(self.executed))
+        batch.execute(job)
+        batch.execute(job, resume=True)
+
+        self.assertEqual(self.executed, ['InputTask', 'DatabaseTask'])
@@ -8,11 +8,12 @@ from collections import defaultdict
 
 from django.conf import settings
 from django.db import connection
+from django.db.models import Prefetch
 from django.utils.text import slugify
 # Project
 from search import index
 from batch import batch
-from datasets.generic import uva2, database, geo, metadata
+from datasets.generic import uva2, database, delta, geo, metadata
 from . import models, documents
 
 log = logging.getLogger(__name__)
@@ -26,6 +27,8 @@ class ImportGemeenteTask(batch.BasicTask):
     Gemeente is not delivered by GOB. So we hardcode gemeente Amsterdam data
     """
     name = "Import gemeente code / naam"
+    requires = ()
+    database_only = True
     data = [
         ('03630000000000','0363','Amsterdam','','J','','GVI','N','19000101',''),
         ('04570000000000','0457', 'Weesp', '', 'J', '', 'GVI', 'N', '20160101', ''),
@@ -61,6 +64,7 @@ class ImportGemeenteTask(batch.BasicTask):
 
 class ImportStadsdeelTask(batch.BasicTask, metadata.UpdateDatasetMixin):
     name = "Import stadsdeel"
+    requires = ('ImportGemeenteTask',)
     dataset_id = 'gebieden-stadsdeel'
 
     def __init__(self, bag_path):
@@ -69,6 +73,9 @@ class ImportStadsdeelTask(batch.BasicTask, metadata.UpdateDatasetMixin):
         self.stadsdelen = dict()
         self.source = os.path.join(self.bag_path, 'GBD_stadsdeel_Actueel.csv')
 
+    def inputs(self):
+        return [self.source]
+
     def before(self):
         self.gemeentes = dict(models.Gemeente.objects.values_list("code", "pk"))
         assert self.gemeentes
@@ -128,6 +135,7 @@ class ImportStadsdeelTask(batch.BasicTask, metadata.UpdateDatasetMixin):
 
 class ImportBuurtTask(batch.BasicTask, metadata.UpdateDatasetMixin):
     name = "Import BRT - BUURT"
+    requires = ('ImportStadsdeelTask', 'ImportWijkTask')
     dataset_id = 'gebieden-buurt'
 
     rx_code_2022 = re.compile("^[A-Z]{2}[0-9]{2}$")
@@ -139,6 +147,9 @@ class ImportBuurtTask(batch.BasicTask, metadata.UpdateDatasetMixin):
         self.buurtcombinaties = dict()
         self.source = os.path.join(self.uva_path, 'GBD_buurt_Actueel.csv')
 
+    def inputs(self):
+        return [self.source]
+
     def before(self):
         # database.clear_models(models.Buurt)
         self.stadsdelen = set(
@@ -221,6 +232,7 @@ class ImportBuurtTask(batch.BasicTask, metadata.UpdateDatasetMixin):
 
 class ImportBouwblokTask(batch.BasicTask, metadata.UpdateDatasetMixin):
     name = "Import BBK  - Bouwblok"
+    requires = ('ImportBuurtTask',)
     dataset_id = 'gebieden-bouwblok'
 
     def __init__(self, uva_path):
@@ -229,6 +241,9 @@ class ImportBouwblokTask(batch.BasicTask, metadata.UpdateDatasetMixin):
         self.bouwblokken = dict()
         self.source = os.path.join(self.uva_path, 'GBD_bouwblok_Actueel.csv')
 
+    def inputs(self):
+        return [self.source]
+
     def before(self):
         self.buurten = set(models.Buurt.objects.values_list("pk", flat=True))
         assert self.buurten
@@ -241,8 +256,9 @@ class ImportBouwblokTask(batch.BasicTask, metadata.UpdateDatasetMixin):
 
     def process(self):
         # loads the csv
-        for bb in uva2.process_csv(None, None, self.process_row, source=self.source, encoding=GOB_CSV_ENCODING):
-            bb.save()
+        with database.BulkWriter(models.Bouwblok) as bouwblokken:
+            bouwblokken.extend(
+                uva2.process_csv(None, None, self.process_row, source=self.source, encoding=GOB_CSV_ENCODING))
 
     def process_row(self, r):
         pk = r['identificatie']
@@ -282,10 +298,15 @@ class ImportBouwblokTask(batch.BasicTask, metadata.UpdateDatasetMixin):
 
 class ImportWoonplaatsTask(batch.BasicTask):
     name = "Import woonplaats"
+    requires = ('ImportGemeenteTask',)
 
     def __init__(self, path):
         self.path = path
         self.gemeentes = dict()
+        self.source = os.path.join(self.path, 'BAG_woonplaats_Actueel.csv')
+
+    def inputs(self):
+        return [self.source]
 
     def before(self):
         self.gemeentes = dict(models.Gemeente.objects.values_list("code", "pk"))
@@ -294,9 +315,8 @@ class ImportWoonplaatsTask(batch.BasicTask):
         self.gemeentes.clear()
 
     def process(self):
-
-        source = os.path.join(self.path, 'BAG_woonplaats_Actueel.csv')
-        woonplaatsen = uva2.process_csv(None, None, self.process_row, source=source, encoding=GOB_CSV_ENCODING)
+        woonplaatsen = uva2.process_csv(
+            None, None, self.process_row, source=self.source, encoding=GOB_CSV_ENCODING)
 
         models.Woonplaats.objects.bulk_create(
             woonplaatsen, batch_size=database.BATCH_SIZE)
@@ -340,6 +360,7 @@ class ImportWoonplaatsTask(batch.BasicTask):
 
 class ImportOpenbareRuimteTask(batch.BasicTask):
     name = "Import openbare ruimtes"
+    requires = ('ImportWoonplaatsTask',)
 
     def __init__(self, path):
         self.path = path
@@ -347,24 +368,27 @@ class ImportOpenbareRuimteTask(batch.BasicTask):
         self.woonplaatsen = set()
         self.openbare_ruimtes = dict()
         self.omschijvingen = set()
+        self.source = os.path.join(self.path, 'BAG_openbare_ruimte_Actueel.csv')
+        self.source_beschrijving = os.path.join(self.path, 'BAG_openbare_ruimte_beschrijving_Actueel.csv')
 
     def store_opr_omschrijving(self, row):
         return row['identificatie'], row['beschrijving']
 
+    def inputs(self):
+        return [self.source, self.source_beschrijving]
+
     def before(self):
         self.bronnen = set(models.Bron.objects.values_list("pk", flat=True))
         self.types = dict([(t[1], t[0]) for t in models.OpenbareRuimte.TYPE_CHOICES])
         self.woonplaatsen = set(
             models.Woonplaats.objects.values_list("pk", flat=True))
 
-        source = os.path.join(self.path, 'BAG_openbare_ruimte_beschrijving_Actueel.csv')
-
         self.omschrijvingen = dict(
             uva2.process_csv(
                 None,
                 None,
                 self.store_opr_omschrijving,
-                quotechar='"', source=source, encoding=GOB_CSV_ENCODING)
+                quotechar='"', source=self.source_beschrijving, encoding=GOB_CSV_ENCODING)
         )
 
     def after(self):
@@ -374,9 +398,8 @@ class ImportOpenbareRuimteTask(batch.BasicTask):
         self.types.clear()
 
     def process(self):
-        source = os.path.join(self.path, 'BAG_openbare_ruimte_Actueel.csv')
         self.openbare_ruimtes = dict(
-            uva2.process_csv(None, None, self.process_row, source=source, encoding=GOB_CSV_ENCODING))
+            uva2.process_csv(None, None, self.process_row, source=self.source, encoding=GOB_CSV_ENCODING))
 
         models.OpenbareRuimte.objects.bulk_create(
             self.openbare_ruimtes.values(), batch_size=database.BATCH_SIZE)
@@ -442,10 +465,18 @@ class ImportOpenbareRuimteTask(batch.BasicTask):
 
 class ImportNummeraanduidingTask(batch.BasicTask, metadata.UpdateDatasetMixin):
     name = "Import nummeraanduiding"
+    requires = (
+        'ImportOpenbareRuimteTask',
+        'ImportLigplaatsTask',
+        'ImportStandplaatsenTask',
+        'ImportVerblijfsobjectTask',
+    )
     dataset_id = 'BAG'
 
-    def __init__(self, path):
+    def __init__(self, path, delta=False):
         self.path = path
+        self.delta = delta
+        self.changes = None
         self.openbare_ruimtes = set()
         self.ligplaatsen = set()
         self.standplaatsen = set()
@@ -455,9 +486,16 @@ class ImportNummeraanduidingTask(batch.BasicTask, metadata.UpdateDatasetMixin):
         self.count = 0
         self.prev_time = time.time()
 
+    def inputs(self):
+        return [self.source]
+
     def before(self):
-        log.debug('Starting import nummeraanduidingen: delete old data')
-        models.Nummeraanduiding.objects.all().delete()
+        if not self.delta:
+            log.debug('Starting import nummeraanduidingen: delete old data')
+            models.Nummeraanduiding.objects.all().delete()
+        self.changes = delta.Delta(
+            models.Nummeraanduiding, 'bag.nummeraanduiding', delta=self.delta,
+            derived=('_openbare_ruimte_naam', '_geom'))
         self.openbare_ruimtes = set(
             models.OpenbareRuimte.objects.values_list("pk", flat=True))
         self.ligplaatsen = set(models.Ligplaats.objects.values_list("pk", flat=True))
@@ -471,15 +509,20 @@ class ImportNummeraanduidingTask(batch.BasicTask, metadata.UpdateDatasetMixin):
         self.openbare_ruimtes.clear()
         self.update_metadata_csv(self.source)
         self.type_lookup.clear()
+        self.changes = None
         log.info('%d Nummeraanduiding Imported', models.Nummeraanduiding.objects.count())
 
     def process(self):
-        nummeraanduidingen = uva2.process_csv(None, None, self.process_row, source=self.source, encoding=GOB_CSV_ENCODING, max_rows=None)
-        models.Nummeraanduiding.objects.bulk_create(
-            nummeraanduidingen, batch_size=database.BATCH_SIZE)
+        nummeraanduidingen = uva2.process_csv(
+            None, None, self.process_row, source=self.source, encoding=GOB_CSV_ENCODING, max_rows=None,
+            records=True)
+        with database.deferred_indexes(models.Nummeraanduiding, defer=not self.delta):
+            self.changes.apply(nummeraanduidingen)
 
     def process_row(self, r):
         pk = landelijk_id = r['identificatie']
+        if not self.changes.changed(pk, delta.row_hash(r)):
+            return None
 
         openbare_ruimte_id = r['ligtAan:BAG.ORE.identificatie'] or None
 
@@ -534,12 +577,17 @@ class ImportNummeraanduidingTask(batch.BasicTask, metadata.UpdateDatasetMixin):
 
 class ImportLigplaatsTask(batch.BasicTask):
     name = "Import ligplaatsen"
+    requires = ('ImportBuurtTask',)
 
     def __init__(self, bag_path):
         self.bag_path = bag_path
         self.bronnen = set()
         self.buurten = set()
         self.ligplaatsen = dict()
+        self.source = os.path.join(self.bag_path, 'BAG_ligplaats_Actueel.csv')
+
+    def inputs(self):
+        return [self.source]
 
     def before(self):
         log.debug('Starting import ligplaats: delete old data')
@@ -553,8 +601,8 @@ class ImportLigplaatsTask(batch.BasicTask):
         self.ligplaatsen.clear()
 
     def process(self):
-        source = os.path.join(self.bag_path, 'BAG_ligplaats_Actueel.csv')
-        self.ligplaatsen = dict(uva2.process_csv(None, None, self.process_row, source=source, encoding=GOB_CSV_ENCODING))
+        self.ligplaatsen = dict(
+            uva2.process_csv(None, None, self.process_row, source=self.source, encoding=GOB_CSV_ENCODING))
 
         models.Ligplaats.objects.bulk_create(self.ligplaatsen.values(), batch_size=database.BATCH_SIZE)
 
@@ -606,11 +654,16 @@ class ImportLigplaatsTask(batch.BasicTask):
 
 class ImportStandplaatsenTask(batch.BasicTask):
     name = "Import standplaatsen"
+    requires = ('ImportBuurtTask',)
 
     def __init__(self, bag_path):
         self.bag_path = bag_path
         self.bronnen = set()
         self.buurten = set()
+        self.source = os.path.join(self.bag_path, 'BAG_standplaats_Actueel.csv')
+
+    def inputs(self):
+        return [self.source]
 
     def before(self):
         log.info('Starting import standplaatsen: delete old data')
@@ -629,8 +682,8 @@ class ImportStandplaatsenTask(batch.BasicTask):
         log.info('%s Standplaatsen', models.Standplaats.objects.count())
 
     def process(self):
-        source = os.path.join(self.bag_path, 'BAG_standplaats_Actueel.csv')
-        standplaatsen = uva2.process_csv(None, None, self.process_row, source=source, encoding=GOB_CSV_ENCODING)
+        standplaatsen = uva2.process_csv(
+            None, None, self.process_row, source=self.source, encoding=GOB_CSV_ENCODING)
 
         models.Standplaats.objects.bulk_create(standplaatsen, batch_size=database.BATCH_SIZE)
 
@@ -672,24 +725,109 @@ class ImportStandplaatsenTask(batch.BasicTask):
         return models.Standplaats(**values)
 
 
+VERBLIJFSOBJECT_FIELDS = (
+    'pk', 'landelijk_id', 'geometrie', 'oppervlakte', 'document_mutatie', 'document_nummer',
+    'verdieping_toegang', 'aantal_eenheden_complex', 'bouwlagen', 'hoogste_bouwlaag', 'laagste_bouwlaag',
+    'aantal_kamers', 'reden_afvoer', 'reden_opvoer', 'eigendomsverhouding', 'gebruik', 'toegang',
+    'gebruiksdoel', 'status', 'buurt_id', 'begin_geldigheid', 'einde_geldigheid', 'indicatie_in_onderzoek',
+    'indicatie_geconstateerd', 'gebruiksdoel_woonfunctie', 'gebruiksdoel_gezondheidszorgfunctie',
+)
+
+
+def convert_verblijfsobject_row(r):
+    """
+    Parses a verblijfsobject row, runs in the csv worker processes
+
+    :returns: (values in VERBLIJFSOBJECT_FIELDS order, pand ids, row hash) or None
+    """
+    pk = landelijk_id = r['identificatie']
+    wkt_geometrie = r['geometrie']
+    if wkt_geometrie:
+        geometrie = geo.get_point(wkt_geometrie)
+        if not geometrie:
+            log.error(f"Verblijfsobject {landelijk_id} has no valid geometry; skipping")
+            return None
+    else:
+        log.warning(f"Verblijfsobject {landelijk_id} has no geometry")
+        geometrie = None
+
+    toegang = r['toegang'].split('|') if r['toegang'] else []
+    gebruiksdoel = r['gebruiksdoel'].split('|')
+    gebruiksdoel_woonfunctie = r['gebruiksdoelWoonfunctie'] or None
+    gebruiksdoel_gezondheidszorgfunctie = r['gebruiksdoelGezondheidszorgfunctie'] or None
+    aantalEenhedenComplex = r['aantalEenhedenComplex'] or None
+    if aantalEenhedenComplex and int(aantalEenhedenComplex) == -1:
+        aantalEenhedenComplex = None
+
+    values = {
+        'pk': pk,
+        'landelijk_id': landelijk_id,
+        'geometrie': geometrie,
+        'oppervlakte': uva2.uva_nummer(r['oppervlakte']),
+        'document_mutatie': uva2.iso_datum(r['documentdatum']),
+        'document_nummer': r['documentnummer'][:20],
+        'verdieping_toegang': uva2.uva_nummer(r['verdiepingToegang']),
+        'aantal_eenheden_complex': aantalEenhedenComplex,
+        'bouwlagen': uva2.uva_nummer(r['aantalBouwlagen']),
+        'hoogste_bouwlaag': uva2.uva_nummer(r['hoogsteBouwlaag']),
+        'laagste_bouwlaag': uva2.uva_nummer(r['laagsteBouwlaag']),
+        'aantal_kamers': uva2.uva_nummer(r['aantalKamers']),
+        'reden_afvoer': r['redenafvoer'],
+        'reden_opvoer': r['redenopvoer'],
+        'eigendomsverhouding': r['eigendomsverhouding'],
+        'gebruik': r['is:WOZ.WOB.soortObject'],
+        'toegang': toegang,
+        'gebruiksdoel': gebruiksdoel,
+        'status': (r['status']),
+        'buurt_id': r['ligtIn:GBD.BRT.identificatie'] or None,
+        'begin_geldigheid': uva2.iso_datum_tijd(r['beginGeldigheid']),
+        'einde_geldigheid': uva2.iso_datum_tijd(r['eindGeldigheid']),
+        'indicatie_in_onderzoek': uva2.get_janee_boolean(r['aanduidingInOnderzoek']),
+        'indicatie_geconstateerd': uva2.get_janee_boolean(r['geconstateerd']),
+        'gebruiksdoel_woonfunctie': gebruiksdoel_woonfunctie,
+        'gebruiksdoel_gezondheidszorgfunctie': gebruiksdoel_gezondheidszorgfunctie,
+
+    }
+
+    if not uva2.datum_geldig(values['begin_geldigheid'], values['einde_geldigheid']):
+        return None
+
+    pand_ids = r['ligtIn:BAG.PND.identificatie']
+    pand_ids = pand_ids.split('|') if pand_ids else []
+
+    return tuple(values[f] for f in VERBLIJFSOBJECT_FIELDS), pand_ids, delta.row_hash(r)
+
+
 class ImportVerblijfsobjectTask(batch.BasicTask):
     name = "Import Verblijfsobjecten"
+    requires = ('ImportBuurtTask', 'ImportPandTask')
 
-    def __init__(self, path):
+    def __init__(self, path, delta=False):
         self.path = path
+        self.delta = delta
+        self.changes = None
         self.bronnen = set()
         self.locaties_ingang = set()
         self.buurten = set()
         self.panden = set()
         self.pandrelatie = defaultdict(list)
+        self.source = os.path.join(self.path, 'BAG_verblijfsobject_Actueel.csv')
 
         self.count = 0
         self.prev_time = time.time()
 
+    def inputs(self):
+        return [self.source]
+
     def before(self):
-        log.debug('Starting import verblijfsobject: delete old data')
-        models.VerblijfsobjectPandRelatie.objects.all().delete()
-        models.Verblijfsobject.objects.all().delete()
+        if not self.delta:
+            log.debug('Starting import verblijfsobject: delete old data')
+            models.VerblijfsobjectPandRelatie.objects.all().delete()
+            models.Verblijfsobject.objects.all().delete()
+        self.changes = delta.Delta(
+            models.Verblijfsobject, 'bag.verblijfsobject', delta=self.delta,
+            derived=('_gebiedsgerichtwerken', '_grootstedelijkgebied', '_openbare_ruimte_naam',
+                     '_huisnummer', '_huisletter', '_huisnummer_toevoeging'))
         self.buurten = set(models.Buurt.objects.values_list("pk", flat=True))
         self.panden = set(models.Pand.objects.values_list("pk", flat=True))
 
@@ -705,78 +843,36 @@ class ImportVerblijfsobjectTask(batch.BasicTask):
                     yield models.VerblijfsobjectPandRelatie(verblijfsobject_id=vbo_id, pand_id=pand_id)
 
         log.debug('Create pandrelaties...')
+        if self.delta:
+            models.VerblijfsobjectPandRelatie.objects.filter(
+                verblijfsobject_id__in=self.changes.updated).delete()
         pand_vbo_objects = gen_pand_vbo_objects(self.pandrelatie)
-        models.VerblijfsobjectPandRelatie.objects.bulk_create(pand_vbo_objects, batch_size=database.BATCH_SIZE)
+        database.copy_from(models.VerblijfsobjectPandRelatie, pand_vbo_objects)
         self.pandrelatie.clear()
+        self.changes = None
 
         log.info('%d Verblijfsobjecten Imported', models.Verblijfsobject.objects.count())
 
     def process(self):
-        source = os.path.join(self.path, 'BAG_verblijfsobject_Actueel.csv')
-        verblijfsobjecten = uva2.process_csv(None, None, self.process_row, source=source, encoding=GOB_CSV_ENCODING, max_rows=None)
+        verblijfsobjecten = uva2.process_csv(
+            None, None, self.process_row, source=self.source, encoding=GOB_CSV_ENCODING, max_rows=None,
+            convert_row=convert_verblijfsobject_row, processes=settings.BATCH_SETTINGS['csv_processes'])
         log.debug('Create verblijfsobjecten...')
-        models.Verblijfsobject.objects.bulk_create(verblijfsobjecten, batch_size=database.BATCH_SIZE)
+        with database.deferred_indexes(models.Verblijfsobject, defer=not self.delta):
+            self.changes.apply(verblijfsobjecten)
         validate_geometry(models.Verblijfsobject)
 
-    def process_row(self, r):
-        pk = landelijk_id = r['identificatie']
-        wkt_geometrie = r['geometrie']
-        if wkt_geometrie:
-            geometrie = geo.get_point(wkt_geometrie)
-            if not geometrie:
-                log.error(f"Verblijfsobject {landelijk_id} has no valid geometry; skipping")
-                return None
-        else:
-            log.warning(f"Verblijfsobject {landelijk_id} has no geometry")
-            geometrie = None
-
-        toegang = r['toegang'].split('|') if r['toegang'] else []
-        gebruiksdoel = r['gebruiksdoel'].split('|')
-        gebruiksdoel_woonfunctie = r['gebruiksdoelWoonfunctie'] or None
-        gebruiksdoel_gezondheidszorgfunctie = r['gebruiksdoelGezondheidszorgfunctie'] or None
-        aantalEenhedenComplex = r['aantalEenhedenComplex'] or None
-        if aantalEenhedenComplex and int(aantalEenhedenComplex) == -1:
-            aantalEenhedenComplex = None
-
-        values = {
-            'pk': pk,
-            'landelijk_id': landelijk_id,
-            'geometrie': geometrie,
-            'oppervlakte': uva2.uva_nummer(r['oppervlakte']),
-            'document_mutatie': uva2.iso_datum(r['documentdatum']),
-            'document_nummer': r['documentnummer'][:20],
-            'verdieping_toegang': uva2.uva_nummer(r['verdiepingToegang']),
-            'aantal_eenheden_complex': aantalEenhedenComplex,
-            'bouwlagen': uva2.uva_nummer(r['aantalBouwlagen']),
-            'hoogste_bouwlaag': uva2.uva_nummer(r['hoogsteBouwlaag']),
-            'laagste_bouwlaag': uva2.uva_nummer(r['laagsteBouwlaag']),
-            'aantal_kamers': uva2.uva_nummer(r['aantalKamers']),
-            'reden_afvoer': r['redenafvoer'],
-            'reden_opvoer': r['redenopvoer'],
-            'eigendomsverhouding': r['eigendomsverhouding'],
-            'gebruik': r['is:WOZ.WOB.soortObject'],
-            'toegang': toegang,
-            'gebruiksdoel': gebruiksdoel,
-            'status': (r['status']),
-            'buurt_id': r['ligtIn:GBD.BRT.identificatie'] or None,
-            'begin_geldigheid': uva2.iso_datum_tijd(r['beginGeldigheid']),
-            'einde_geldigheid': uva2.iso_datum_tijd(r['eindGeldigheid']),
-            'indicatie_in_onderzoek': uva2.get_janee_boolean(r['aanduidingInOnderzoek']),
-            'indicatie_geconstateerd': uva2.get_janee_boolean(r['geconstateerd']),
-            'gebruiksdoel_woonfunctie': gebruiksdoel_woonfunctie,
-            'gebruiksdoel_gezondheidszorgfunctie': gebruiksdoel_gezondheidszorgfunctie,
+    def process_row(self, converted):
+        values, pand_ids, row_hash = converted
+        values = dict(zip(VERBLIJFSOBJECT_FIELDS, values))
+        pk = values['pk']
 
-        }
-
-        if not uva2.datum_geldig(values['begin_geldigheid'], values['einde_geldigheid']):
+        if not self.changes.changed(pk, row_hash):
             return None
 
-        pand_ids = r['ligtIn:BAG.PND.identificatie'] or None
-        if pand_ids:
-            pand_ids = pand_ids.split('|')
-            for pand_id in pand_ids:
-                if pand_id in self.panden:
-                    self.pandrelatie[pand_id].append(pk)
+        for pand_id in pand_ids:
+            if pand_id in self.panden:
+                self.pandrelatie[pand_id].append(pk)
 
         if values['buurt_id'] and values['buurt_id'] not in self.buurten:
             log.warning('Verblijfsobject {} references non-existing buurt {}; ignoring'.format(pk, values['buurt_id']))
@@ -792,9 +888,12 @@ class ImportVerblijfsobjectTask(batch.BasicTask):
 
 class ImportPandTask(batch.BasicTask):
     name = "Import pand"
+    requires = ('ImportBouwblokTask',)
 
-    def __init__(self, path):
+    def __init__(self, path, delta=False):
         self.path = path
+        self.delta = delta
+        self.changes = None
         self.bouwblokken = set()
         self.verblijfsobjecten = set()
         self.panden = dict()
@@ -802,9 +901,14 @@ class ImportPandTask(batch.BasicTask):
         self.count = 0
         self.prev_time = time.time()
 
+    def inputs(self):
+        return [self.source]
+
     def before(self):
-        log.debug('Starting import pand: delete old data')
-        models.Pand.objects.all().delete()
+        if not self.delta:
+            log.debug('Starting import pand: delete old data')
+            models.Pand.objects.all().delete()
+        self.changes = delta.Delta(models.Pand, 'bag.pand', delta=self.delta)
         self.bouwblokken = set(models.Bouwblok.objects.values_list("pk", flat=True))
         self.verblijfsobjecten = set(models.Verblijfsobject.objects.values_list("pk", flat=True))
 
@@ -812,15 +916,22 @@ class ImportPandTask(batch.BasicTask):
         self.verblijfsobjecten.clear()
         self.panden.clear()
         self.bouwblokken.clear()
+        self.changes = None
 
     def process(self):
         self.panden = dict(
-            uva2.process_csv(None, None, self.process_row, source=self.source, encoding=GOB_CSV_ENCODING, max_rows=None))
-        models.Pand.objects.bulk_create(self.panden.values(), batch_size=database.BATCH_SIZE)
+            uva2.process_csv(
+                None, None, self.process_row, source=self.source, encoding=GOB_CSV_ENCODING, max_rows=None,
+                records=True))
+        with database.deferred_indexes(models.Pand, defer=not self.delta):
+            self.changes.apply(self.panden.values())
 
     def process_row(self, r):
 
         pk = landelijk_id = r['identificatie']
+        if not self.changes.changed(pk, delta.row_hash(r)):
+            return None
+
         wkt_geometrie = r['geometrie']
         if wkt_geometrie:
             geometrie = geo.get_poly(wkt_geometrie)
@@ -888,6 +999,11 @@ class DeletePandTask(index.DeleteIndexTask):
     doc_types = [documents.Pand]
 
 
+class DeleteSuggestIndexTask(index.DeleteIndexTask):
+    index = settings.ELASTIC_INDICES['BAG_SUGGEST']
+    doc_types = [documents.Suggestion]
+
+
 class IndexOpenbareRuimteTask(index.ImportIndexTask):
     name = "index openbare ruimtes"
     queryset = models.OpenbareRuimte.objects.prefetch_related('adressen')
@@ -971,19 +1087,41 @@ class IndexWoonplaatsTask(index.ImportIndexTask):
 
 class IndexNummerAanduidingTask(index.ImportIndexTask):
     name = "index nummer aanduidingen"
+    # only the columns documents.from_nummeraanduiding_ruimte reads, a
+    # missing (or deferred) relation costs a query per address
     queryset = models.Nummeraanduiding.objects.\
+        select_related('bron').\
         prefetch_related(
-            'verblijfsobject',
-            'standplaats',
-            'ligplaats',
-            'openbare_ruimte',
-            'openbare_ruimte__woonplaats',
+            Prefetch('verblijfsobject', queryset=models.Verblijfsobject.objects.only(
+                'id', 'landelijk_id', 'status', 'geometrie')),
+            Prefetch('standplaats', queryset=models.Standplaats.objects.only(
+                'id', 'landelijk_id', 'status', 'geometrie')),
+            Prefetch('ligplaats', queryset=models.Ligplaats.objects.only(
+                'id', 'landelijk_id', 'status', 'geometrie')),
+            Prefetch('openbare_ruimte', queryset=models.OpenbareRuimte.objects.only(
+                'id', 'naam', 'naam_nen', 'woonplaats_id')),
+            Prefetch('openbare_ruimte__woonplaats', queryset=models.Woonplaats.objects.only(
+                'id', 'naam')),
         )
 
     def convert(self, obj):
         return documents.from_nummeraanduiding_ruimte(obj)
 
 
+class IndexNummerAanduidingSuggestTask(IndexNummerAanduidingTask):
+    name = "index nummer aanduiding suggestions"
+
+    def convert(self, obj):
+        return documents.to_suggestion(super().convert(obj))
+
+
+class IndexOpenbareRuimteSuggestTask(IndexOpenbareRuimteTask):
+    name = "index openbare ruimte suggestions"
+
+    def convert(self, obj):
+        return documents.to_suggestion(super().convert(obj))
+
+
 class IndexPandTask(index.ImportIndexTask):
     name = "index pand"
 
@@ -1011,11 +1149,16 @@ class ImportWijkTask(batch.BasicTask):
     """
 
     name = "Import GBD Wijk"
+    requires = ('ImportStadsdeelTask',)
     rx_code_2022 = re.compile("^[A-Z]{2}$")
 
     def __init__(self, shp_path):
         self.shp_path = shp_path
         self.stadsdelen = dict()
+        self.wijken = None
+
+    def inputs(self):
+        return [os.path.join(self.shp_path, 'GBD_wijk.shp')]
 
     def before(self):
         self.stadsdelen = dict(
@@ -1027,8 +1170,9 @@ class ImportWijkTask(batch.BasicTask):
 
     def process(self):
         shp_file = "GBD_wijk.shp"
-        geo.process_shp(
-            self.shp_path, shp_file, self.process_feature, GOB_SHAPE_ENCODING)
+        with database.BulkWriter(models.Buurtcombinatie) as self.wijken:
+            geo.process_shp(
+                self.shp_path, shp_file, self.process_feature, GOB_SHAPE_ENCODING)
 
     def process_feature(self, feat):
         vollcode = feat.get('code')
@@ -1047,7 +1191,7 @@ class ImportWijkTask(batch.BasicTask):
             begin_geldigheid=feat.get('begindatum') or None,
             einde_geldigheid=feat.get('einddatum') or None,
         )
-        wijk.save()
+        self.wijken.add(wijk)
 
 
 def log_details_wrong_geometry(model):
@@ -1116,10 +1260,15 @@ class ImportGebiedsgerichtwerkenTask(batch.BasicTask):
     """
 
     name = "Import GBD Gebiedsgerichtwerken"
+    requires = ('ImportStadsdeelTask',)
 
     def __init__(self, shp_path):
         self.shp_path = shp_path
         self.stadsdelen = dict()
+        self.gebieden = None
+
+    def inputs(self):
+        return [os.path.join(self.shp_path, 'GBD_ggw_gebied.shp')]
 
     def before(self):
         self.stadsdelen = dict(
@@ -1137,10 +1286,11 @@ class ImportGebiedsgerichtwerkenTask(batch.BasicTask):
 
     def process(self):
         shp_file = "GBD_ggw_gebied.shp"
-        geo.process_shp(
-            self.shp_path, shp_file,
-            self.process_feature,
-            GOB_SHAPE_ENCODING)
+        with database.BulkWriter(models.Gebiedsgerichtwerken) as self.gebieden:
+            geo.process_shp(
+                self.shp_path, shp_file,
+                self.process_feature,
+                GOB_SHAPE_ENCODING)
 
     def process_feature(self, feat):
         sdl = feat.get('sdl_code')
@@ -1159,7 +1309,7 @@ class ImportGebiedsgerichtwerkenTask(batch.BasicTask):
             geometrie=geo.get_multipoly(feat.geom.wkt),
         )
 
-        ggw.save()
+        self.gebieden.add(ggw)
 
 
 class ImportGrootstedelijkgebiedTask(batch.BasicTask):
@@ -1171,9 +1321,14 @@ class ImportGrootstedelijkgebiedTask(batch.BasicTask):
     """
 
     name = "Import GBD Grootstedelijkgebied"
+    requires = ()
 
     def __init__(self, shp_path):
         self.shp_path = shp_path
+        self.gebieden = dict()
+
+    def inputs(self):
+        return [os.path.join(self.shp_path, 'GBD_grootstedelijke_projecten.shp')]
 
     def before(self):
         pass
@@ -1183,23 +1338,26 @@ class ImportGrootstedelijkgebiedTask(batch.BasicTask):
         Validate geometry
         """
         validate_geometry(models.Grootstedelijkgebied)
+        self.gebieden.clear()
 
     def process(self):
         geo.process_shp(
             self.shp_path,
             "GBD_grootstedelijke_projecten.shp", self.process_feature, GOB_SHAPE_ENCODING)
+        models.Grootstedelijkgebied.objects.bulk_create(self.gebieden.values(), batch_size=database.BATCH_SIZE)
 
     def process_feature(self, feat):
         naam = feat.get('NAAM')
         gsg_type = feat.get('TYPE')
         # Primary key should be a combination of naam and gsg_type
         id1 = slugify(naam + "_" + gsg_type)
-        models.Grootstedelijkgebied(
+        # the last feature with a key wins
+        self.gebieden[id1] = models.Grootstedelijkgebied(
             id=id1,
             naam=naam,
             gsg_type=gsg_type,
             geometrie=geo.get_multipoly(feat.geom.wkt),
-        ).save()
+        )
 
 
 class ImportUnescoTask(batch.BasicTask):
@@ -1210,9 +1368,14 @@ class ImportUnescoTask(batch.BasicTask):
     """
 
     name = "Import GBD unesco"
+    requires = ()
 
     def __init__(self, shp_path):
         self.shp_path = shp_path
+        self.unesco = dict()
+
+    def inputs(self):
+        return [os.path.join(self.shp_path, 'GBD_unesco.shp')]
 
     def before(self):
         pass
@@ -1222,22 +1385,30 @@ class ImportUnescoTask(batch.BasicTask):
         Validate geometry
         """
         validate_geometry(models.Unesco)
+        self.unesco.clear()
 
     def process(self):
         geo.process_shp(self.shp_path, "GBD_unesco.shp", self.process_feature, GOB_SHAPE_ENCODING)
+        models.Unesco.objects.bulk_create(self.unesco.values(), batch_size=database.BATCH_SIZE)
 
     def process_feature(self, feat):
         naam = feat.get('NAAM')
-        models.Unesco(
-            id=slugify(naam),
+        pk = slugify(naam)
+        # the last feature with a key wins
+        self.unesco[pk] = models.Unesco(
+            id=pk,
             naam=naam,
             geometrie=geo.get_multipoly(feat.geom.wkt),
-        ).save()
+        )
 
 
 class DenormalizeDataTask(batch.BasicTask):
     name = "Denormalize BAG vbo / standplaats / ligplaats data"
+    requires = ('ImportNummeraanduidingTask',)
     id_ = "denormalize_vbo_standplaats_ligplaats"
+    # the vbo, ligplaats and standplaats steps do not conflict
+    workers = 3
+    database_only = True
 
     def before(self):
         pass
@@ -1246,6 +1417,9 @@ class DenormalizeDataTask(batch.BasicTask):
         pass
 
     def process(self):
+        batch.execute_sql_steps(self.steps(), workers=self.workers)
+
+    def steps(self):
 
         # If type_adres voor Weesp is not set we set it by selecting the lowest
         # id for the same nummeraanduiding for a verblijfsobject, lisgplaats or standplaats
@@ -1266,21 +1440,6 @@ FROM (
 WHERE bag_nummeraanduiding.id = row_results.id;
         """
 
-        update_type_adres_weesp_vbo = update_type_adres_weesp.replace('{type_id}', 'verblijfsobject_id')
-        log.debug(update_type_adres_weesp_vbo)
-        with connection.cursor() as c:
-            c.execute(update_type_adres_weesp_vbo)
-
-        update_type_adres_weesp_lpa = update_type_adres_weesp.replace('{type_id}', 'ligplaats_id')
-        log.debug(update_type_adres_weesp_lpa)
-        with connection.cursor() as c:
-            c.execute(update_type_adres_weesp_lpa)
-
-        update_type_adres_weesp_spa = update_type_adres_weesp.replace('{type_id}', 'standplaats_id')
-        log.debug(update_type_adres_weesp_spa)
-        with connection.cursor() as c:
-            c.execute(update_type_adres_weesp_spa)
-
         update_vbo_sql = """
 UPDATE bag_verblijfsobject vbo
 SET _openbare_ruimte_naam = t.naam,
@@ -1301,12 +1460,7 @@ FROM (
 WHERE vbo.id = t.vbo_id;
         """
 
-        log.debug(update_vbo_sql)
-
-        with connection.cursor() as c:
-            c.execute(update_vbo_sql)
-
-            update_ligplaats_sql = """
+        update_ligplaats_sql = """
 UPDATE bag_ligplaats lig
 SET _openbare_ruimte_naam = t.naam,
   _huisnummer             = t.huisnummer,
@@ -1324,12 +1478,9 @@ FROM (
        WHERE num.type_adres = 'Hoofdadres' AND num.ligplaats_id IS NOT NULL
      ) t
 WHERE lig.id = t.lig_id;
-            """
-            log.debug(update_ligplaats_sql)
-
-            c.execute(update_ligplaats_sql)
+        """
 
-            update_standplaats_sql = """
+        update_standplaats_sql = """
 UPDATE bag_standplaats sta
 SET _openbare_ruimte_naam = t.naam,
   _huisnummer             = t.huisnummer,
@@ -1347,48 +1498,54 @@ FROM (
        WHERE num.type_adres = 'Hoofdadres' AND num.standplaats_id IS NOT NULL
      ) t
 WHERE sta.id = t.sta_id;
-            """
-
-            log.debug(update_standplaats_sql)
-            c.execute(update_standplaats_sql)
+        """
 
-            update_nummeraanduiding_sql = """
+        update_nummeraanduiding_sql = """
 UPDATE bag_nummeraanduiding num
 SET _openbare_ruimte_naam = opr.naam
 FROM bag_openbareruimte opr
 WHERE opr.id = num.openbare_ruimte_id
-            """
-
-            log.debug(update_nummeraanduiding_sql)
-            c.execute(update_nummeraanduiding_sql)
+        """
 
-            update_geom_num_vbo_sql = """
+        update_geom_num_vbo_sql = """
 UPDATE bag_nummeraanduiding num
 SET _geom = vbo.geometrie
 FROM bag_verblijfsobject vbo
 WHERE num.verblijfsobject_id = vbo.id
-            """
-
-            log.debug(update_geom_num_vbo_sql)
-            c.execute(update_geom_num_vbo_sql)
+        """
 
-            update_geom_num_standplaats_sql = """
+        update_geom_num_standplaats_sql = """
 UPDATE bag_nummeraanduiding num
 SET _geom = std.geometrie
 FROM bag_standplaats std
 WHERE num.standplaats_id = std.id
-            """
-            log.debug(update_geom_num_standplaats_sql)
-            c.execute(update_geom_num_standplaats_sql)
+        """
 
-            update_geom_num_ligplaats_sql = """
+        update_geom_num_ligplaats_sql = """
 UPDATE bag_nummeraanduiding num
 SET _geom = lig.geometrie
 FROM bag_ligplaats lig
 WHERE num.ligplaats_id = lig.id
         """
-            log.debug(update_geom_num_ligplaats_sql)
-            c.execute(update_geom_num_ligplaats_sql)
+
+        num, opr = 'bag_nummeraanduiding', 'bag_openbareruimte'
+        vbo, lig, sta = 'bag_verblijfsobject', 'bag_ligplaats', 'bag_standplaats'
+
+        return [
+            batch.SqlStep('type_adres_weesp_vbo', update_type_adres_weesp.replace('{type_id}', 'verblijfsobject_id'),
+                          reads=[num], writes=[num]),
+            batch.SqlStep('type_adres_weesp_lpa', update_type_adres_weesp.replace('{type_id}', 'ligplaats_id'),
+                          reads=[num], writes=[num]),
+            batch.SqlStep('type_adres_weesp_spa', update_type_adres_weesp.replace('{type_id}', 'standplaats_id'),
+                          reads=[num], writes=[num]),
+            batch.SqlStep('adres_vbo', update_vbo_sql, reads=[num, opr], writes=[vbo]),
+            batch.SqlStep('adres_ligplaats', update_ligplaats_sql, reads=[num, opr], writes=[lig]),
+            batch.SqlStep('adres_standplaats', update_standplaats_sql, reads=[num, opr], writes=[sta]),
+            batch.SqlStep('openbare_ruimte_naam_num', update_nummeraanduiding_sql, reads=[opr], writes=[num]),
+            batch.SqlStep('geom_num_vbo', update_geom_num_vbo_sql, reads=[vbo], writes=[num]),
+            batch.SqlStep('geom_num_standplaats', update_geom_num_standplaats_sql, reads=[sta], writes=[num]),
+            batch.SqlStep('geom_num_ligplaats', update_geom_num_ligplaats_sql, reads=[lig], writes=[num]),
+        ]
 
 
 class UpdateGebiedenAttributenTask(batch.BasicTask):
@@ -1399,6 +1556,8 @@ class UpdateGebiedenAttributenTask(batch.BasicTask):
     """
 
     name = "Denormalize gebiedsgericht werken data"
+    requires = ('ImportGebiedsgerichtwerkenTask', 'DenormalizeDataTask')
+    database_only = True
 
     def before(self):
         pass
@@ -1407,38 +1566,13 @@ class UpdateGebiedenAttributenTask(batch.BasicTask):
         pass
 
     def process(self):
-        for ggw in models.Gebiedsgerichtwerken.objects.all():
-
-            # add buurten to GGW
-            buurten = models.Buurt.objects.filter(
-                geometrie__within=ggw.geometrie)
-
-            for b in buurten:
-                ggw.buurten.add(b)
-
-            vbos = models.Verblijfsobject.objects.filter(
-                geometrie__within=ggw.geometrie)
-
-            log.debug('Update Gebiedsgerichtwerken %s key %s VBO',
-                      ggw.naam, len(vbos))
-
-            vbos.update(_gebiedsgerichtwerken=ggw.id)
-
-            standplaatsen = models.Standplaats.objects.filter(
-                geometrie__within=ggw.geometrie)
-
-            log.debug('Update Gebiedsgerichtwerken %s key %s Standplaats',
-                      ggw.naam, len(standplaatsen))
-
-            standplaatsen.update(_gebiedsgerichtwerken=ggw.id)
-
-            ligplaatsen = models.Ligplaats.objects.filter(
-                geometrie__within=ggw.geometrie)
-
-            log.debug('Update Gebiedsgerichtwerken %s key %s Ligplaats',
-                      ggw.naam, len(ligplaatsen))
-
-            ligplaatsen.update(_gebiedsgerichtwerken=ggw.id)
+        for model, field in (
+                (models.Buurt, 'gebiedsgerichtwerken'),
+                (models.Verblijfsobject, '_gebiedsgerichtwerken'),
+                (models.Standplaats, '_gebiedsgerichtwerken'),
+                (models.Ligplaats, '_gebiedsgerichtwerken')):
+            count = database.update_within(model, field, models.Gebiedsgerichtwerken)
+            log.info("Update Gebiedsgerichtwerken key %s %s", count, model.__name__)
 
 
 class UpdateGrootstedelijkAttributenTask(batch.BasicTask):
@@ -1447,6 +1581,8 @@ class UpdateGrootstedelijkAttributenTask(batch.BasicTask):
     """
 
     name = "Denormalize grootstedelijke gebieden data"
+    requires = ('ImportGrootstedelijkgebiedTask', 'UpdateGebiedenAttributenTask')
+    database_only = True
 
     def before(self):
         pass
@@ -1455,37 +1591,17 @@ class UpdateGrootstedelijkAttributenTask(batch.BasicTask):
         pass
 
     def process(self):
-        for gsg in models.Grootstedelijkgebied.objects.all():
-            vbos = models.Verblijfsobject.objects.filter(
-                geometrie__within=gsg.geometrie)
-
-            log.debug('Update Grootstedelijk %s key %s VBO',
-                      gsg.naam, len(vbos))
-
-            vbos.update(_grootstedelijkgebied=gsg.id)
-
-            standplaatsen = models.Standplaats.objects.filter(
-                geometrie__within=gsg.geometrie)
-
-            log.debug('Update Grootstedelijk %s key %s Standplaats',
-                      gsg.naam, len(standplaatsen))
-
-            standplaatsen.update(_grootstedelijkgebied=gsg.id)
-
-            ligplaatsen = models.Ligplaats.objects.filter(
-                geometrie__within=gsg.geometrie)
-
-            log.debug('Update Grootstedelijk %s key %s Ligplaats',
-                      gsg.naam, len(ligplaatsen))
-
-            ligplaatsen.update(_grootstedelijkgebied=gsg.id)
+        for model in (models.Verblijfsobject, models.Standplaats, models.Ligplaats):
+            count = database.update_within(model, '_grootstedelijkgebied', models.Grootstedelijkgebied)
+            log.info("Update Grootstedelijk key %s %s", count, model.__name__)
 
 
 class ImportBagJob(batch.BasicJob):
     name = "Import BAG"
 
-    def __init__(self, **kwargs):
+    def __init__(self, delta=False, **kwargs):
         gob_dir = settings.GOB_DIR
+        self.delta = delta
 
         self.gob_gebieden_path = os.path.join(gob_dir, 'gebieden/CSV_Actueel')
         self.gob_gebieden_shp_path = os.path.join(gob_dir, 'gebieden/SHP')
@@ -1502,6 +1618,17 @@ class ImportBagJob(batch.BasicJob):
 
     def tasks(self):
 
+        if self.delta:
+            # only the large tables, other tables need a full import
+            return [
+                ImportPandTask(self.gob_bag_path, delta=True),
+                ImportVerblijfsobjectTask(self.gob_bag_path, delta=True),
+                ImportNummeraanduidingTask(self.gob_bag_path, delta=True),
+                DenormalizeDataTask(),
+                UpdateGebiedenAttributenTask(),
+                UpdateGrootstedelijkAttributenTask(),
+            ]
+
         return [
             # no-dependencies.
             ImportGemeenteTask(self.gob_gebieden_path),  # TODO : nog niet geleverd door GOB, manually added in GOB Objectstore
@@ -1579,6 +1706,36 @@ class DeleteIndexBagJob(batch.BasicJob):
         ]
 
 
+class IndexSuggestJob(batch.BasicJob):
+    name = "Delete and Fill typeahead suggestion index"
+
+    def tasks(self):
+        return [
+            DeleteSuggestIndexTask(),
+            IndexOpenbareRuimteSuggestTask(),
+            IndexNummerAanduidingSuggestTask(),
+        ]
+
+
+class BuildIndexSuggestJob(batch.BasicJob):
+    name = "Fill typeahead suggestion index"
+
+    def tasks(self):
+        return [
+            IndexOpenbareRuimteSuggestTask(),
+            IndexNummerAanduidingSuggestTask(),
+        ]
+
+
+class DeleteIndexSuggestJob(batch.BasicJob):
+    name = "Delete typeahead suggestion index"
+
+    def tasks(self):
+        return [
+            DeleteSuggestIndexTask(),
+        ]
+
+
 class IndexPandJob(batch.BasicJob):
     name = "Delete and Fill Pand search-index"
 
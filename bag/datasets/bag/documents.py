@@ -102,6 +102,8 @@ class Nummeraanduiding(es.DocType):
     subtype = es.Keyword()
     _display = es.Keyword()
 
+    id = es.Keyword()
+
     landelijk_id = es.Text(
         analyzer=analyzers.autocomplete,
         fields={
@@ -125,6 +127,8 @@ class Bouwblok(es.DocType):
     """
     Bouwblok searchable fields.
     """
+    id = es.Keyword()
+
     code = es.Text(
         analyzer=analyzers.bouwblokid,
         fields={
@@ -228,6 +232,33 @@ class Pand(es.DocType):
         name = settings.ELASTIC_INDICES['BAG_PAND']
 
 
+class Suggestion(es.DocType):
+    """
+    Typeahead suggestion of an adres or openbare ruimte, looked up with
+    the completion suggester. The other fields are only returned, to
+    build the display and the link of a suggestion.
+    """
+    suggest = es.Completion(
+        analyzer=analyzers.suggest,
+        contexts=[
+            {'name': 'subtype', 'type': 'category', 'path': 'subtype'},
+            {'name': 'weesp', 'type': 'category', 'path': 'weesp'},
+        ],
+    )
+
+    subtype = es.Keyword()
+    weesp = es.Keyword()
+
+    type = es.Keyword(index=False)
+    subtype_id = es.Keyword(index=False)
+    landelijk_id = es.Keyword(index=False)
+    adresseerbaar_object_id = es.Keyword(index=False)
+    _display = es.Keyword(index=False)
+
+    class Index:
+        name = settings.ELASTIC_INDICES['BAG_SUGGEST']
+
+
 def get_centroid(geom, transform=None):
     """
     Finds the centroid of a geometrie object
@@ -480,3 +511,30 @@ def from_pand(l):
     d.pandnaam = l.pandnaam
     d._display = '{}'.format(l.pandnaam if l.pandnaam else l.landelijk_id)
     return d
+
+
+def to_suggestion(doc) -> Suggestion:
+    """
+    Suggestion of a converted nummeraanduiding or openbare ruimte
+    document, addresses can also be found by postcode and huisnummer
+    """
+    s = Suggestion(_id=doc.meta.id)
+    s.type = getattr(doc, 'type', None) or 'nummeraanduiding'
+    s.subtype = doc.subtype
+    s.subtype_id = getattr(doc, 'subtype_id', None)
+    s.landelijk_id = doc.landelijk_id
+    s.adresseerbaar_object_id = getattr(doc, 'adresseerbaar_object_id', None)
+    s._display = doc._display
+    s.weesp = 'true' if doc.landelijk_id.startswith("0457") else 'false'
+
+    inputs = [doc._display]
+    if isinstance(doc, Nummeraanduiding):
+        if doc.straatnaam_nen and doc.straatnaam_nen != doc.straatnaam:
+            inputs.append(f'{doc.straatnaam_nen} {doc.toevoeging}')
+        if doc.postcode:
+            inputs.append(f'{doc.postcode} {doc.toevoeging}')
+            inputs.append(f'{doc.postcode[:4]} {doc.postcode[4:]} {doc.toevoeging}')
+
+    # streets before addresses
+    s.suggest = {'input': inputs, 'weight': 1000 - (doc.order or 0)}
+    return s
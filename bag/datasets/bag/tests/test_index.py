@@ -0,0 +1,64 @@
+from django.test import SimpleTestCase, TestCase
+
+from search.test import IndexTaskMixin
+from datasets.bag.tests import factories
+from .. import documents, models, batch
+
+
+class IndexNummeraanduidingQueriesTest(IndexTaskMixin, TestCase):
+
+    def task(self):
+        return batch.IndexNummerAanduidingTask()
+
+    def create(self, count):
+        bron = models.Bron.objects.get_or_create(code='1', omschrijving='Bron')[0]
+
+        factories.NummeraanduidingFactory.create_batch(count, bron=bron)
+        factories.NummeraanduidingFactory.create(
+            bron=bron, verblijfsobject=None, standplaats=factories.StandplaatsFactory.create(),
+            type=models.Nummeraanduiding.OBJECT_TYPE_STANDPLAATS)
+        factories.NummeraanduidingFactory.create(
+            bron=bron, verblijfsobject=None, ligplaats=factories.LigplaatsFactory.create(),
+            type=models.Nummeraanduiding.OBJECT_TYPE_LIGPLAATS)
+
+
+class IndexPandQueriesTest(IndexTaskMixin, TestCase):
+
+    def task(self):
+        return batch.IndexPandTask()
+
+    def create(self, count):
+        factories.PandFactory.create_batch(count)
+
+
+class SuggestionTest(SimpleTestCase):
+
+    def test_adres(self):
+        doc = documents.Nummeraanduiding(
+            _id='1', straatnaam='Rozenstraat', straatnaam_nen='Rozenstr', toevoeging='228 A',
+            postcode='1016SZ', subtype='verblijfsobject', landelijk_id='0363200000425131',
+            adresseerbaar_object_id='0363010000000001', order=50, _display='Rozenstraat 228 A')
+
+        suggestion = documents.to_suggestion(doc)
+
+        self.assertEqual(suggestion.meta.id, '1')
+        self.assertEqual(suggestion.type, 'nummeraanduiding')
+        self.assertEqual(suggestion.weesp, 'false')
+        self.assertEqual(suggestion.suggest['input'], [
+            'Rozenstraat 228 A', 'Rozenstr 228 A', '1016SZ 228 A', '1016 SZ 228 A'])
+        self.assertGreater(suggestion.suggest['weight'], 0)
+
+    def test_openbare_ruimte_before_adres(self):
+        street = documents.Gebied(
+            _id='opr_1', type='openbare_ruimte', subtype='weg', subtype_id='1', naam='Weesperstraat',
+            landelijk_id='0457300000000001', order=10, _display='Weesperstraat (Weesp)')
+        adres = documents.Nummeraanduiding(
+            _id='2', subtype='verblijfsobject', landelijk_id='0363200000000002', order=50,
+            _display='Weesperstraat 1')
+
+        street, adres = documents.to_suggestion(street), documents.to_suggestion(adres)
+
+        self.assertEqual(street.type, 'openbare_ruimte')
+        self.assertEqual(street.weesp, 'true')
+        self.assertEqual(street.suggest['input'], ['Weesperstraat (Weesp)'])
+        self.assertGreater(street.suggest['weight'], adres.suggest['weight'])
@@ -14,7 +14,7 @@ from batch import batch
 from search import index
 from datasets.bag import models as bag
 from datasets.brk import models, documents
-from datasets.generic import geo, database, uva2, kadaster, metadata
+from datasets.generic import geo, database, delta, uva2, kadaster, metadata
 from datasets.bag.batch import GOB_CSV_ENCODING
 from datasets.brk import batch_eigendom_sql, batch_fix_kadastraalobject_sql
 
@@ -38,10 +38,14 @@ def _get_related(code, omschrijving, cache, model):
 
 class ImportGemeenteTask(batch.BasicTask):
     name = "Import Gemeente"
+    requires = ()
 
     def __init__(self, path):
         self.path = path
 
+    def inputs(self):
+        return [os.path.join(self.path, 'BRK_GEMEENTE.shp')]
+
     def before(self):
         pass
 
@@ -60,6 +64,8 @@ class ImportGemeenteTask(batch.BasicTask):
 
 class ImportKadastraleGemeenteTaskLines(batch.BasicTask):
     name = "Import Kadastrale Gemeente Lines"
+    requires = ()
+    checkpoint = False
 
     def __init__(self, path, stash):
         self.path = path
@@ -82,12 +88,16 @@ class ImportKadastraleGemeenteTaskLines(batch.BasicTask):
 
 class ImportKadastraleGemeenteTask(batch.BasicTask):
     name = "Import Kadastrale Gemeente"
+    requires = ('ImportGemeenteTask', 'ImportKadastraleGemeenteTaskLines')
 
     def __init__(self, path, stash):
         self.path = path
         self.stash = stash
         self.gemeentes = set()
 
+    def inputs(self):
+        return [os.path.join(self.path, 'BRK_KAD_GEMEENTE.shp')]
+
     def before(self):
         self.gemeentes = set(
             models.Gemeente.objects.values_list('gemeente', flat=True))
@@ -125,6 +135,8 @@ class ImportKadastraleGemeenteTask(batch.BasicTask):
 
 class ImportKadastraleSectieTaskLines(batch.BasicTask):
     name = "Import Kadastrale Sectie Lines"
+    requires = ()
+    checkpoint = False
 
     def __init__(self, path, stash):
         self.path = path
@@ -149,12 +161,16 @@ class ImportKadastraleSectieTaskLines(batch.BasicTask):
 
 class ImportKadastraleSectieTask(batch.BasicTask):
     name = "Import Kadastrale Sectie"
+    requires = ('ImportKadastraleGemeenteTask', 'ImportKadastraleSectieTaskLines')
 
     def __init__(self, path, stash):
         self.path = path
         self.stash = stash
         self.gemeentes = set()
 
+    def inputs(self):
+        return [os.path.join(self.path, 'BRK_KAD_SECTIE.shp')]
+
     def before(self):
         self.gemeentes = set(
             models.KadastraleGemeente.objects.values_list('pk', flat=True))
@@ -193,35 +209,62 @@ class ImportKadastraleSectieTask(batch.BasicTask):
 
 class ImportKadastraalSubjectTask(batch.BasicTask):
     name = "Import Kadastraal Subject"
+    requires = ()
 
-    def __init__(self, path):
+    def __init__(self, path, delta=False):
         self.path = path
+        self.delta = delta
+        self.changes = None
         self.geslacht = dict()
         self.beschikkingsbevoegdheid = dict()
         self.aanduiding_naam = dict()
         self.land = dict()
-        # self.adressen = dict()
+        self.adressen = None
+        self.adres_ids = set()
         self.rechtsvorm = dict()
 
+    def inputs(self):
+        return [uva2.resolve_file(self.path, 'BRK_kadastraal_subject', extension='csv')]
+
     def before(self):
-        pass
+        # lookup tables are filled by previous (delta) imports
+        self.geslacht = {o.code: o for o in models.Geslacht.objects.all()}
+        self.beschikkingsbevoegdheid = {o.code: o for o in models.Beschikkingsbevoegdheid.objects.all()}
+        self.aanduiding_naam = {o.code: o for o in models.AanduidingNaam.objects.all()}
+        self.land = {o.code: o for o in models.Land.objects.all()}
+        self.rechtsvorm = {o.code: o for o in models.Rechtsvorm.objects.all()}
+
+        self.changes = delta.Delta(models.KadastraalSubject, 'brk.kadastraal_subject', delta=self.delta)
 
     def after(self):
+        self.changes = None
         self.geslacht.clear()
         self.beschikkingsbevoegdheid.clear()
         self.aanduiding_naam.clear()
         self.land.clear()
-        # self.adressen.clear()
+        self.adres_ids.clear()
         self.rechtsvorm.clear()
 
     def process(self):
-        subjects = uva2.process_csv(
-            self.path, 'BRK_kadastraal_subject', self.process_subject, encoding=GOB_CSV_ENCODING)
+        if self.delta:
+            # only the changed subjects are kept, they are applied once all their addresses are written
+            with database.BulkWriter(models.Adres, ignore_conflicts=True) as self.adressen:
+                subjects = [s for s in uva2.process_csv(
+                    self.path, 'BRK_kadastraal_subject', self.process_subject, encoding=GOB_CSV_ENCODING) if s]
+            self.changes.apply(subjects)
+            return
+
+        # subjects share addresses, the addresses a batch of subjects refers to are written first
+        with database.BulkWriter(models.Adres, ignore_conflicts=True) as self.adressen, \
+                database.BulkWriter(models.KadastraalSubject, before_flush=self.adressen.flush) as subjects:
+            subjects.extend(uva2.process_csv(
+                self.path, 'BRK_kadastraal_subject', self.process_subject, encoding=GOB_CSV_ENCODING))
 
-        models.KadastraalSubject.objects.bulk_create(
-            subjects, batch_size=database.BATCH_SIZE)
+        delta.save_hashes(self.changes.source, self.changes.hashes, replace=True)
 
     def process_subject(self, row):
+        if not self.changes.changed(row['BRK_SJT_ID'], delta.row_hash(row)):
+            return
 
         subject_type = row['SJT_TYPE']
 
@@ -340,12 +383,17 @@ class ImportKadastraalSubjectTask(batch.BasicTask):
 
         adres_id = m.hexdigest()
 
+        # most subjects share their address with other subjects
+        if adres_id in self.adres_ids:
+            return adres_id
+        self.adres_ids.add(adres_id)
+
         try:
             huisnummer_int = int(huisnummer) if huisnummer else None
         except ValueError:
             huisnummer_int = None
 
-        models.Adres(
+        self.adressen.add(models.Adres(
             id=adres_id,
             openbareruimte_naam=openbareruimte_naam,
             huisnummer=huisnummer_int,
@@ -362,22 +410,109 @@ class ImportKadastraalSubjectTask(batch.BasicTask):
             buitenland_naam=buitenland_naam,
             buitenland_land=self.get_land(
                 buitenland_code, buitenland_omschrijving)
-        ).save()
+        ))
 
         return adres_id
 
 
+KADASTRAAL_OBJECT_FIELDS = (
+    'id', 'kadastrale_gemeente_id', 'aanduiding', 'perceelnummer', 'indexletter', 'indexnummer', 'grootte',
+    'koopsom', 'koopsom_valuta_code', 'koopjaar', 'meer_objecten', 'register9_tekst', 'status_code',
+    'toestandsdatum', 'voorlopige_kadastrale_grens', 'in_onderzoek', 'poly_geom', 'point_geom',
+    'voornaamste_gerechtigde_id',
+)
+
+
+def convert_kadastraal_object_row(row):
+    """
+    Parses a kadastraal object row, runs in the csv worker processes
+
+    :returns: (values in KADASTRAAL_OBJECT_FIELDS order, (gemeente, sectie), (code, omschrijving) of
+        soort grootte, cultuurcode onbebouwd and cultuurcode bebouwd, row hash)
+    """
+    kot_id = row['BRK_KOT_ID']
+
+    kg_id = row['KOT_KADASTRALEGEMEENTE_CODE']
+    sectie = row['KOT_SECTIE']
+
+    perceelnummer = row['KOT_PERCEELNUMMER']
+    indexletter = row['KOT_INDEX_LETTER']
+    indexnummer = row['KOT_INDEX_NUMMER']
+    aanduiding = kadaster.get_aanduiding(
+        kg_id, sectie, perceelnummer, indexletter, indexnummer)
+
+    grootte = row['KOT_KADGROOTTE']
+    koopsom = row['KOT_KOOPSOM']
+
+    toestands_datum_str = row['KOT_TOESTANDSDATUM']
+    toestands_datum = None
+
+    # Determining geometrie
+    poly_geom = None
+    point_geom = None
+    if row['GEOMETRIE']:
+        geom = GEOSGeometry(row['GEOMETRIE'])
+        if isinstance(geom, Polygon):
+            poly_geom = MultiPolygon(geom)
+        elif isinstance(geom, Point):  # Point is the other option. Otherwise None
+            point_geom = geom
+
+    try:
+        toestands_datum = datetime.datetime.strptime(toestands_datum_str, "%Y%m%d%H%M%S").date()
+    except ValueError:
+        log.warning("Could not parse toestandsdatum {} for Kadastraal Object {}; ignoring".format(toestands_datum_str,
+                                                                                                  kot_id))
+        pass
+
+    vrlpg = row['KOT_IND_VOORLOPIGE_KADGRENS'].lower() != 'definitieve grens'
+
+    values = (
+        kot_id,
+        kg_id,
+        aanduiding,
+        perceelnummer,
+        indexletter,
+        indexnummer,
+        uva2.uva_decimal(grootte),
+        int(koopsom) if koopsom else None,
+        row['KOT_KOOPSOM_VALUTA'],
+        row['KOT_KOOPJAAR'],
+        uva2.uva_indicatie(row['KOT_INDICATIE_MEER_OBJECTEN']),
+        row['KOT_AKRREGISTER9TEKST'],
+        row['KOT_STATUS_CODE'],
+        toestands_datum,
+        vrlpg,
+        row['KOT_INONDERZOEK'],
+        poly_geom,
+        point_geom,
+        row['BRK_SJT_ID'] or None,
+    )
+    codes = (
+        (row['KOT_SOORTGROOTTE_CODE'], row['KOT_SOORTGROOTTE_OMS']),
+        (row['KOT_CULTUURCODEONBEBOUWD_CODE'], row['KOT_CULTUURCODEONBEBOUWD_OMS']),
+        (row['KOT_CULTUURCODEBEBOUWD_CODE'], row['KOT_CULTUURCODEBEBOUWD_OMS']),
+    )
+
+    return values, (kg_id, sectie), codes, delta.row_hash(row)
+
+
 class ImportKadastraalObjectTask(batch.BasicTask):
     name = "Import Kadastraal Object"
+    requires = ('ImportKadastraleSectieTask', 'ImportKadastraalSubjectTask')
 
-    def __init__(self, path):
+    def __init__(self, path, delta=False):
         self.path = path
+        self.delta = delta
+        self.changes = None
         self.secties = dict()
         self.soort_grootte = dict()
         self.cultuur_code_onbebouwd = dict()
         self.cultuur_code_bebouwd = dict()
         self.subjects = set()
 
+    def inputs(self):
+        return [uva2.resolve_file(self.path, 'BRK_kadastraal_object', extension='csv')]
+
     def before(self):
 
         secties = models.KadastraleSectie.objects.select_related(
@@ -395,102 +530,56 @@ class ImportKadastraalObjectTask(batch.BasicTask):
         if not self.subjects:
             raise ValueError('Sections are missing..')
 
+        # lookup tables are filled by previous (delta) imports
+        self.soort_grootte = {o.code: o for o in models.SoortGrootte.objects.all()}
+        self.cultuur_code_onbebouwd = {o.code: o for o in models.CultuurCodeOnbebouwd.objects.all()}
+        self.cultuur_code_bebouwd = {o.code: o for o in models.CultuurCodeBebouwd.objects.all()}
+
+        self.changes = delta.Delta(models.KadastraalObject, 'brk.kadastraal_object', delta=self.delta)
+
     def after(self):
         self.secties.clear()
         self.soort_grootte.clear()
         self.cultuur_code_onbebouwd.clear()
         self.cultuur_code_bebouwd.clear()
         self.subjects.clear()
+        self.changes = None
 
     def process(self):
         objects = uva2.process_csv(
-            self.path, 'BRK_kadastraal_object', self.process_object, encoding=GOB_CSV_ENCODING)
+            self.path, 'BRK_kadastraal_object', self.process_object, encoding=GOB_CSV_ENCODING,
+            convert_row=convert_kadastraal_object_row, processes=settings.BATCH_SETTINGS['csv_processes'])
 
-        models.KadastraalObject.objects.bulk_create(
-            objects, batch_size=database.BATCH_SIZE)
+        with database.deferred_indexes(models.KadastraalObject, defer=not self.delta):
+            self.changes.apply(objects)
 
-    def process_object(self, row):
-        kot_id = row['BRK_KOT_ID']
+    def process_object(self, converted):
+        values, sectie, codes, row_hash = converted
+        values = dict(zip(KADASTRAAL_OBJECT_FIELDS, values))
+        kot_id = values['id']
 
-        kg_id = row['KOT_KADASTRALEGEMEENTE_CODE']
-        sectie = row['KOT_SECTIE']
-        if (kg_id, sectie) not in self.secties:
+        if not self.changes.changed(kot_id, row_hash):
+            return
+
+        if sectie not in self.secties:
             log.warning(
                 "Kadastraal Object {} references non-existing Kadastrale Gemeente {}, Sectie {}; skipping".format(
-                    kot_id, kg_id, sectie))
+                    kot_id, *sectie))
             return
 
-        s_id = self.secties[(kg_id, sectie)]
-
-        perceelnummer = row['KOT_PERCEELNUMMER']
-        indexletter = row['KOT_INDEX_LETTER']
-        indexnummer = row['KOT_INDEX_NUMMER']
-        aanduiding = kadaster.get_aanduiding(
-            kg_id, sectie, perceelnummer, indexletter, indexnummer)
-
-        grootte = row['KOT_KADGROOTTE']
-        koopsom = row['KOT_KOOPSOM']
-
-        toestands_datum_str = row['KOT_TOESTANDSDATUM']
-        toestands_datum = None
-
-        # Determining geometrie
-        poly_geom = None
-        point_geom = None
-        if row['GEOMETRIE']:
-            geom = GEOSGeometry(row['GEOMETRIE'])
-            if isinstance(geom, Polygon):
-                poly_geom = MultiPolygon(geom)
-            elif isinstance(geom, Point):  # Point is the other option. Otherwise None
-                point_geom = geom
-
-        try:
-            toestands_datum = datetime.datetime.strptime(toestands_datum_str, "%Y%m%d%H%M%S").date()
-        except ValueError:
-            log.warning("Could not parse toestandsdatum {} for Kadastraal Object {}; ignoring".format(toestands_datum_str,
-                                                                                                      kot_id))
-            pass
-
-        subject_id = row['BRK_SJT_ID'] or None
-
+        subject_id = values['voornaamste_gerechtigde_id']
         if subject_id and subject_id not in self.subjects:
             log.warning("Kadastraal Object {} references non-existing Subject {}; ignoring".format(kot_id, subject_id))
-            subject_id = None
+            values['voornaamste_gerechtigde_id'] = None
 
-        vrlpg = row['KOT_IND_VOORLOPIGE_KADGRENS'].lower() != 'definitieve grens'
+        soort_grootte, cultuurcode_onbebouwd, cultuurcode_bebouwd = codes
 
         return models.KadastraalObject(
-            id=kot_id,
-            kadastrale_gemeente_id=kg_id,
-            aanduiding=aanduiding,
-            sectie_id=s_id,
-            perceelnummer=perceelnummer,
-            indexletter=indexletter,
-            indexnummer=indexnummer,
-            soort_grootte=self.get_soort_grootte(
-                row['KOT_SOORTGROOTTE_CODE'], row['KOT_SOORTGROOTTE_OMS']),
-            grootte=uva2.uva_decimal(grootte),
-            koopsom=int(koopsom) if koopsom else None,
-            koopsom_valuta_code=row['KOT_KOOPSOM_VALUTA'],
-            koopjaar=row['KOT_KOOPJAAR'],
-            meer_objecten=uva2.uva_indicatie(
-                row['KOT_INDICATIE_MEER_OBJECTEN']),
-            cultuurcode_onbebouwd=self.get_cultuur_code_onbebouwd(
-                row['KOT_CULTUURCODEONBEBOUWD_CODE'],
-                row['KOT_CULTUURCODEONBEBOUWD_OMS']),
-
-            cultuurcode_bebouwd=self.get_cultuur_code_bebouwd(
-                row['KOT_CULTUURCODEBEBOUWD_CODE'],
-                row['KOT_CULTUURCODEBEBOUWD_OMS']),
-
-            register9_tekst=row['KOT_AKRREGISTER9TEKST'],
-            status_code=row['KOT_STATUS_CODE'],
-            toestandsdatum=toestands_datum,
-            voorlopige_kadastrale_grens=vrlpg,
-            in_onderzoek=row['KOT_INONDERZOEK'],
-            poly_geom=poly_geom,
-            point_geom=point_geom,
-            voornaamste_gerechtigde_id=subject_id,
+            sectie_id=self.secties[sectie],
+            soort_grootte=self.get_soort_grootte(*soort_grootte),
+            cultuurcode_onbebouwd=self.get_cultuur_code_onbebouwd(*cultuurcode_onbebouwd),
+            cultuurcode_bebouwd=self.get_cultuur_code_bebouwd(*cultuurcode_bebouwd),
+            **values
         )
 
     def get_soort_grootte(self, code, omschrijving):
@@ -510,23 +599,36 @@ class ImportKadastraalObjectTask(batch.BasicTask):
 
 class ImportZakelijkRechtTask(batch.BasicTask, metadata.UpdateDatasetMixin):
     name = "Import Zakelijk Recht"
+    requires = ('ImportKadastraalSubjectTask', 'ImportKadastraalObjectTask')
     dataset_id = 'BRK'
 
-    def __init__(self, path):
+    def __init__(self, path, delta=False):
         self.path = path
+        self.delta = delta
+        self.changes = None
         self.aard_zakelijk_recht = dict()
         self.splits_type = dict()
         self.kst = set()
         self.kot = set()
         self.warnings = Counter()
 
+    def inputs(self):
+        return [uva2.resolve_file(self.path, 'BRK_zakelijk_recht', extension='csv')]
+
     def before(self):
         self.kst = set(
             models.KadastraalSubject.objects.values_list("id", flat=True))
         self.kot = set(
             models.KadastraalObject.objects.values_list("id", flat=True))
 
+        # lookup tables are filled by previous (delta) imports
+        self.aard_zakelijk_recht = {o.code: o for o in models.AardZakelijkRecht.objects.all()}
+        self.splits_type = {o.code: o for o in models.AppartementsrechtsSplitsType.objects.all()}
+
+        self.changes = delta.Delta(models.ZakelijkRecht, 'brk.zakelijk_recht', delta=self.delta)
+
     def after(self):
+        self.changes = None
         self.aard_zakelijk_recht.clear()
         self.kst.clear()
         self.kot.clear()
@@ -539,10 +641,11 @@ class ImportZakelijkRechtTask(batch.BasicTask, metadata.UpdateDatasetMixin):
     def process(self):
         zrts = dict(
             uva2.process_csv(
-                self.path, 'BRK_zakelijk_recht', self.process_subject, encoding=GOB_CSV_ENCODING))
+                self.path, 'BRK_zakelijk_recht', self.process_subject, encoding=GOB_CSV_ENCODING,
+                records=True))
 
-        models.ZakelijkRecht.objects.bulk_create(
-            zrts.values(), batch_size=database.BATCH_SIZE)
+        with database.deferred_indexes(models.ZakelijkRecht, defer=not self.delta):
+            self.changes.apply(zrts.values())
 
     def process_subject(self, row):
         zrt_id = row['BRK_ZRT_ID']
@@ -561,6 +664,9 @@ class ImportZakelijkRechtTask(batch.BasicTask, metadata.UpdateDatasetMixin):
 
         pk = zrt_id + "-" + kot_id + "-" + (tng_id or betrokken_bij)
 
+        if not self.changes.changed(pk, delta.row_hash(row)):
+            return
+
         kst_id = row['BRK_SJT_ID']
         if kst_id and kst_id not in self.kst:
             self.warnings["Zakelijk recht references non-existing subject {}; skipping".format(kst_id)] += 1
@@ -609,18 +715,29 @@ class ImportZakelijkRechtTask(batch.BasicTask, metadata.UpdateDatasetMixin):
 
 class ImportAantekeningTask(batch.BasicTask):
     name = "Import Aantekeningen"
+    requires = ('ImportKadastraalSubjectTask', 'ImportKadastraalObjectTask')
 
-    def __init__(self, path):
+    def __init__(self, path, delta=False):
         self.path = path
+        self.delta = delta
         self.aard_aantekening = dict()
         self.kst = set()
         self.kot = set()
         self.warnings = Counter()
 
+    def inputs(self):
+        return [uva2.resolve_file(self.path, 'BRK_aantekening', extension='csv')]
+
     def before(self):
         self.kst = set(models.KadastraalSubject.objects.values_list("id", flat=True))
         self.kot = set(models.KadastraalObject.objects.values_list("id", flat=True))
 
+        if self.delta:
+            # aantekeningen have no unique source id and are removed with deleted objects,
+            # they are reloaded completely
+            models.Aantekening.objects.all().delete()
+            self.aard_aantekening = {o.code: o for o in models.AardAantekening.objects.all()}
+
     def after(self):
         self.aard_aantekening.clear()
         self.kst.clear()
@@ -671,6 +788,7 @@ class ImportAantekeningTask(batch.BasicTask):
 
 class ImportKadastraalObjectVerblijfsobjectTask(batch.BasicTask):
     name = "Import Kadaster - KOT-VBO"
+    requires = ('ImportKadastraalObjectTask',)
 
     def __init__(self, path):
         super().__init__()
@@ -678,7 +796,13 @@ class ImportKadastraalObjectVerblijfsobjectTask(batch.BasicTask):
         self.kot = set()
         self.vbo = set()
 
+    def inputs(self):
+        return [uva2.resolve_file(self.path, 'BRK_BRK_BAG', extension='csv')]
+
     def before(self):
+        # rebuilt completely, also after a delta import
+        models.KadastraalObjectVerblijfsobjectRelatie.objects.all().delete()
+
         self.kot = set(
             models.KadastraalObject.objects.values_list("id", flat=True))
 
@@ -727,6 +851,8 @@ class ImportKadastraalObjectVerblijfsobjectTask(batch.BasicTask):
 
 class ImportKadastraalObjectRelatiesTask(batch.BasicTask):
     name = "Import Kadaster - KOT-KOT"
+    requires = ('ImportZakelijkRechtTask',)
+    database_only = True
 
     def before(self):
         pass
@@ -736,6 +862,7 @@ class ImportKadastraalObjectRelatiesTask(batch.BasicTask):
 
     def process(self):
         with db.connection.cursor() as c:
+            c.execute("DELETE FROM brk_aperceelgperceelrelatie")
             c.execute("""
             INSERT INTO brk_aperceelgperceelrelatie(id, g_perceel_id, a_perceel_id)
             SELECT DISTINCT
@@ -754,6 +881,8 @@ class ImportKadastraalObjectRelatiesTask(batch.BasicTask):
 
 class ImportZakelijkRechtVerblijfsobjectTask(batch.BasicTask):
     name = "Import Kadaster - ZRT-VBO"
+    requires = ('ImportZakelijkRechtTask', 'ImportKadastraalObjectVerblijfsobjectTask')
+    database_only = True
 
     def before(self):
         pass
@@ -763,6 +892,7 @@ class ImportZakelijkRechtVerblijfsobjectTask(batch.BasicTask):
 
     def process(self):
         with db.connection.cursor() as c:
+            c.execute("DELETE FROM brk_zakelijkrechtverblijfsobjectrelatie")
             c.execute("""
             INSERT INTO brk_zakelijkrechtverblijfsobjectrelatie(verblijfsobject_id, zakelijk_recht_id)
             SELECT
@@ -782,7 +912,9 @@ class ImportEigendommenTask(batch.BasicTask):
     that combines already loaded tables into a new tables.
     """
     name = "Create eigendommen informatiemodel"
+    requires = ('ImportZakelijkRechtTask', 'ImportKadastraalObjectVerblijfsobjectTask')
     id_ = "create_eigendommen_tables"
+    database_only = True
 
     def before(self):
         pass
@@ -798,6 +930,7 @@ class ImportEigendommenTask(batch.BasicTask):
 
 class FixKadastraalObjectAppartementGeometrie(batch.BasicTask):
     name = "If geometrie for apartments is not correct, use geometrie from related verblijfsobject"
+    database_only = True
 
     def before(self):
         pass
@@ -817,14 +950,29 @@ class FixKadastraalObjectAppartementGeometrie(batch.BasicTask):
 class ImportKadasterJob(object):
     name = "Import Kadaster - BRK"
 
-    def __init__(self):
+    def __init__(self, delta=False):
         gob_dir = settings.GOB_DIR
+        self.delta = delta
         self.brk = os.path.join(gob_dir, 'brk2/AmsterdamRegio/CSV_Actueel')
         self.brk_with_subj = os.path.join(gob_dir, 'brk2/AmsterdamRegio/CSV_ActueelMetSubj')
         self.brk_shp = os.path.join(gob_dir, 'brk2/AmsterdamRegio/SHP_Actueel')
         self.stash = {}
 
     def tasks(self):
+        if self.delta:
+            # only the subjects, objects and rechten and the tables derived from them,
+            # other tables need a full import
+            return [
+                ImportKadastraalSubjectTask(self.brk_with_subj, delta=True),
+                ImportKadastraalObjectTask(self.brk_with_subj, delta=True),
+                ImportZakelijkRechtTask(self.brk_with_subj, delta=True),
+                ImportAantekeningTask(self.brk_with_subj, delta=True),
+                ImportKadastraalObjectVerblijfsobjectTask(self.brk),
+                ImportKadastraalObjectRelatiesTask(),
+                ImportZakelijkRechtVerblijfsobjectTask(),
+                ImportEigendommenTask(),
+            ]
+
         return [
             ImportGemeenteTask(self.brk_shp),
             ImportKadastraleGemeenteTaskLines(self.brk_shp, self.stash),
@@ -867,7 +1015,8 @@ class DeleteSubjectIndexTask(index.DeleteIndexTask):
 class IndexSubjectTask(index.ImportIndexTask):
 
     name = "index kadastraal subject"
-    queryset = models.KadastraalSubject.objects.all().order_by('id')
+    queryset = models.KadastraalSubject.objects.only(
+        'id', 'statutaire_naam', 'voornamen', 'voorvoegsels', 'naam').order_by('id')
     sequential = True
 
     def convert(self, obj):
@@ -879,7 +1028,14 @@ class IndexObjectTask(index.ImportIndexTask):
     name = "index kadastraal object"
     sequential = True
 
-    queryset = models.KadastraalObject.objects.all().order_by('id')
+    # the gemeente and sectie geometries are not needed for the documents
+    queryset = models.KadastraalObject.objects.select_related(
+        'kadastrale_gemeente', 'sectie'
+    ).only(
+        'id', 'perceelnummer', 'indexletter', 'indexnummer', 'point_geom', 'poly_geom',
+        'kadastrale_gemeente__id', 'kadastrale_gemeente__naam',
+        'sectie__id', 'sectie__sectie',
+    ).order_by('id')
 
     def convert(self, obj):
         return documents.from_kadastraal_object(obj)
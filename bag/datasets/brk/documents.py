@@ -19,6 +19,8 @@ kad_int_fields = {
 
 
 class KadastraalObject(es.DocType):
+    id = es.Keyword()
+
     aanduiding = es.Text(
         fielddata=True,
         analyzer=analyzers.postcode,
@@ -65,6 +67,8 @@ class KadastraalObject(es.DocType):
 
 
 class KadastraalSubject(es.DocType):
+    id = es.Keyword()
+
     naam = es.Text(
         analyzer=analyzers.naam,
         fields={
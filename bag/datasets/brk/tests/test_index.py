@@ -0,0 +1,24 @@
+from django.test import TestCase
+
+from search.test import IndexTaskMixin
+from datasets.brk.tests import factories
+from .. import batch
+
+
+class IndexKadastraalObjectQueriesTest(IndexTaskMixin, TestCase):
+
+    def task(self):
+        return batch.IndexObjectTask()
+
+    def create(self, count):
+        factories.KadastraalObjectFactory.create_batch(count)
+
+
+class IndexKadastraalSubjectQueriesTest(IndexTaskMixin, TestCase):
+
+    def task(self):
+        return batch.IndexSubjectTask()
+
+    def create(self, count):
+        factories.NatuurlijkPersoonFactory.create_batch(count)
+        factories.NietNatuurlijkPersoonFactory.create_batch(count)
@@ -1,10 +1,29 @@
+import datetime
+import io
+import logging
+from contextlib import contextmanager
+from itertools import islice
+from typing import Iterable, Type
+
+from django.conf import settings
+from django.contrib.gis.db.models import GeometryField
+from django.contrib.gis.geos import GEOSGeometry
 from django.db import connection
-from django.db.models import QuerySet
+from django.db.models import AutoField, Model, QuerySet
 from django.db.utils import InternalError as DjangoInternalError
 from psycopg2 import InternalError as Psycopg2InternalError
 
+from batch import batch
+from batch.report import count_rows_written, record_table_written
+from datasets.generic import shadow
+
+log = logging.getLogger(__name__)
+
 BATCH_SIZE = 50_000
 
+COPY_NULL = '\\N'
+COPY_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+
 
 def count_qs(qs: QuerySet) -> int:
     """Workaround count(*) issue in postgresql/django by falling back to count(first_column)."""
@@ -38,3 +57,269 @@ def count_sql(table: str, param=None, quote: bool = True) -> int:
         row = cursor.fetchone()
 
     return row[0] if row else 0
+
+
+def update_within(model: Type[Model], field: str, area_model: Type[Model]) -> int:
+    """
+    Set the foreign key `field` of every model instance to the area (of
+    area_model) its geometrie lies within, in one spatial join UPDATE.
+
+    Both tables have a GiST index on geometrie. When areas overlap the
+    area with the highest primary key wins. Rows that already refer to
+    that area are not rewritten.
+
+    :returns: number of updated rows
+    """
+    table = connection.ops.quote_name(model._meta.db_table)
+    pk = connection.ops.quote_name(model._meta.pk.column)
+    column = connection.ops.quote_name(model._meta.get_field(field).column)
+    area_table = connection.ops.quote_name(area_model._meta.db_table)
+    area_pk = connection.ops.quote_name(area_model._meta.pk.column)
+
+    sql = f"""
+UPDATE {table} t
+SET {column} = m.area_id
+FROM (
+    SELECT DISTINCT ON (o.{pk}) o.{pk} AS object_id, a.{area_pk} AS area_id
+    FROM {table} o
+    JOIN {area_table} a ON ST_Within(o.geometrie, a.geometrie)
+    ORDER BY o.{pk}, a.{area_pk} DESC
+) m
+WHERE t.{pk} = m.object_id AND t.{column} IS DISTINCT FROM m.area_id
+    """
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql)
+        count_rows_written(cursor.rowcount)
+        return cursor.rowcount
+
+
+@contextmanager
+def deferred_indexes(model: Type[Model], defer: bool = True):
+    """
+    Drop the secondary and spatial indexes of the table of model during a
+    bulk load and create them again afterwards, which is much faster than
+    maintaining them for every inserted row.
+
+    Indexes of primary keys and unique constraints are kept. The indexes
+    are only dropped when loading into the shadow schema or outside a
+    transaction, dropping them locks the table until the transaction
+    ends. They are recreated when the load fails too, concurrently on
+    BATCH_SETTINGS['index_workers'] connections.
+
+    Usage:
+
+        with database.deferred_indexes(models.Pand, defer=not self.delta):
+            database.copy_from(models.Pand, panden)
+    """
+    if not defer or (connection.in_atomic_block and not shadow.is_active()):
+        yield
+        return
+
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            SELECT format('%%I.%%I', n.nspname, i.relname), pg_get_indexdef(i.oid)
+            FROM pg_index x
+            JOIN pg_class i ON i.oid = x.indexrelid
+            JOIN pg_namespace n ON n.oid = i.relnamespace
+            WHERE x.indrelid = %s::regclass
+              AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conindid = x.indexrelid)
+        """, [connection.ops.quote_name(model._meta.db_table)])
+        indexes = cursor.fetchall()
+
+        for name, _ in indexes:
+            cursor.execute(f'DROP INDEX {name}')
+
+    try:
+        yield
+    finally:
+        # indexes of one table do not conflict, each is its own step
+        batch.execute_sql_steps(
+            [batch.SqlStep(name, definition) for name, definition in indexes],
+            workers=settings.BATCH_SETTINGS['index_workers'])
+
+
+def copy_from(model: Type[Model], objects: Iterable[Model], batch_size: int = BATCH_SIZE) -> int:
+    """
+    Insert model instances using postgresql COPY FROM STDIN.
+
+    Drop in replacement for `model.objects.bulk_create(objects, batch_size=BATCH_SIZE)`
+    for large imports: rows are written in the COPY text format, geometries
+    as EWKB, so no INSERT statements are compiled and no parameters are adapted.
+    `None` objects (skipped rows from process_row) are ignored, AutoField
+    columns are left to the database. Signals and save() are not called.
+
+    :param model: model to insert into
+    :param objects: model instances, can be a generator
+    :param batch_size: number of rows sent per COPY statement
+    :returns: number of rows inserted
+    """
+    fields = [f for f in model._meta.local_concrete_fields if not isinstance(f, AutoField)]
+    table = connection.ops.quote_name(model._meta.db_table)
+    columns = ', '.join(connection.ops.quote_name(f.column) for f in fields)
+    sql = f'COPY {table} ({columns}) FROM STDIN'
+
+    objects = (obj for obj in objects if obj is not None)
+    total = 0
+    record_table_written(model._meta.db_table)
+
+    with connection.cursor() as cursor:
+        while True:
+            rows = [_copy_row(fields, obj) for obj in islice(objects, batch_size)]
+            if not rows:
+                break
+
+            cursor.copy_expert(sql, io.StringIO(''.join(rows)))
+            total += len(rows)
+            count_rows_written(len(rows))
+
+    return total
+
+
+def copy_update(model: Type[Model], objects: Iterable[Model], fields: Iterable[str],
+                batch_size: int = BATCH_SIZE) -> int:
+    """
+    Update model instances with one UPDATE from a temporary table that
+    is filled using COPY FROM STDIN.
+
+    Only the given fields are written, the other columns of the updated
+    rows keep their values. Signals and save() are not called.
+
+    :param model: model to update
+    :param objects: model instances, can be a generator
+    :param fields: names of the fields to update
+    :param batch_size: number of rows sent per COPY statement
+    :returns: number of rows updated
+    """
+    pk = model._meta.pk
+    fields = [pk] + [model._meta.get_field(name) for name in fields if name != pk.name]
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    temp = quote(f'{model._meta.db_table}_update')
+    columns = ', '.join(quote(f.column) for f in fields)
+    assignments = ', '.join(f'{quote(f.column)} = u.{quote(f.column)}' for f in fields[1:])
+
+    objects = (obj for obj in objects if obj is not None)
+
+    with connection.cursor() as cursor:
+        cursor.execute(f'CREATE TEMPORARY TABLE {temp} AS SELECT {columns} FROM {table} WITH NO DATA')
+        try:
+            while True:
+                rows = [_copy_row(fields, obj) for obj in islice(objects, batch_size)]
+                if not rows:
+                    break
+                cursor.copy_expert(f'COPY {temp} ({columns}) FROM STDIN', io.StringIO(''.join(rows)))
+
+            cursor.execute(
+                f'UPDATE {table} SET {assignments} FROM {temp} u '
+                f'WHERE {table}.{quote(pk.column)} = u.{quote(pk.column)}')
+            return cursor.rowcount
+        finally:
+            cursor.execute(f'DROP TABLE IF EXISTS {temp}')
+
+
+def _copy_row(fields, obj: Model) -> str:
+    return '\t'.join(_copy_value(f, f.pre_save(obj, True)) for f in fields) + '\n'
+
+
+def _copy_value(field, value) -> str:
+    if value is None:
+        return COPY_NULL
+
+    if isinstance(field, GeometryField):
+        if isinstance(value, str):
+            value = GEOSGeometry(value)
+        if value.srid is None:
+            value = value.clone()
+            value.srid = field.srid
+        elif value.srid != field.srid:
+            value = value.transform(field.srid, clone=True)
+        return value.hexewkb.decode()
+
+    value = field.get_db_prep_save(value, connection)
+    if value is None:
+        return COPY_NULL
+
+    return _copy_text(value).translate(COPY_ESCAPES)
+
+
+def _copy_text(value) -> str:
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, (list, tuple)):
+        return _copy_array(value)
+    return str(value)
+
+
+def _copy_array(values) -> str:
+    items = []
+    for value in values:
+        if value is None:
+            items.append('NULL')
+        elif isinstance(value, (list, tuple)):
+            items.append(_copy_array(value))
+        else:
+            text = _copy_text(value).replace('\\', '\\\\').replace('"', '\\"')
+            items.append(f'"{text}"')
+    return '{' + ','.join(items) + '}'
+
+
+class BulkWriter(object):
+    """
+    Buffers model instances and inserts them with one bulk_create per batch.
+
+    Replaces `obj.save()` per row in the importers. With ignore_conflicts
+    rows whose key already exists are skipped (ON CONFLICT DO NOTHING), for
+    models with content based keys that are written more than once.
+    `before_flush` is called before every insert, e.g. to flush the writer
+    of the rows the buffered objects refer to.
+
+    Usage:
+
+        with database.BulkWriter(models.Gebiedsgerichtwerken) as self.gebieden:
+            geo.process_shp(..., self.process_feature)
+
+        def process_feature(self, feat):
+            self.gebieden.add(models.Gebiedsgerichtwerken(...))
+    """
+
+    def __init__(self, model: Type[Model], batch_size: int = BATCH_SIZE,
+                 ignore_conflicts: bool = False, before_flush=None):
+        self.model = model
+        self.batch_size = batch_size
+        self.ignore_conflicts = ignore_conflicts
+        self.before_flush = before_flush
+        self.buffer = []
+        self.total = 0
+
+    def add(self, obj: Model):
+        """Buffer obj, `None` (a skipped row) is ignored"""
+        if obj is None:
+            return
+        self.buffer.append(obj)
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def extend(self, objects: Iterable[Model]):
+        for obj in objects:
+            self.add(obj)
+
+    def flush(self):
+        if not self.buffer:
+            return
+        if self.before_flush:
+            self.before_flush()
+
+        self.model.objects.bulk_create(self.buffer, ignore_conflicts=self.ignore_conflicts)
+        self.total += len(self.buffer)
+        count_rows_written(len(self.buffer))
+        self.buffer = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.flush()
@@ -0,0 +1,156 @@
+"""
+Delta imports
+
+Instead of reloading a complete table only the rows that changed since
+the previous import are applied. Changes are found by comparing a hash
+of every source row with the hash stored (in batch.RowHash) when the
+object was imported.
+
+Usage in a task:
+
+    def before(self):
+        if not self.delta:
+            models.Pand.objects.all().delete()
+        self.changes = delta.Delta(models.Pand, 'bag.pand', delta=self.delta)
+
+    def process(self):
+        self.changes.apply(uva2.process_csv(..., self.process_row))
+
+    def process_row(self, r):
+        pk = r['identificatie']
+        if not self.changes.changed(pk, delta.row_hash(r)):
+            return None
+        ...
+
+Objects are compared with the source rows only, so an object whose
+geldigheid ends without a new delivery of its row stays until the next
+full import.
+"""
+import hashlib
+import logging
+from typing import Iterable, Type
+
+from django.db.models import Model
+
+from batch.models import RowHash
+from batch.report import record_changes
+from datasets.generic import database
+
+log = logging.getLogger(__name__)
+
+DELETE_BATCH_SIZE = 10_000
+
+
+def row_hash(row) -> str:
+    """Stable hash of a CSV row (dict or uva2.Record)"""
+    h = hashlib.blake2b(digest_size=8)
+    for key, value in sorted(row.items()):
+        h.update(f'{key}\x1f{value}\x1e'.encode())
+    return h.hexdigest()
+
+
+def load_hashes(source: str) -> dict:
+    """Stored hash per object id of source"""
+    return dict(RowHash.objects.filter(source=source).values_list('object_id', 'hash'))
+
+
+def save_hashes(source: str, hashes: dict, removed=(), replace=False):
+    """
+    Store the hashes of source, dropping the stored hashes of these
+    and of the removed object ids first, or of all objects with replace.
+    """
+    stored = RowHash.objects.filter(source=source)
+
+    if replace:
+        stored.delete()
+    else:
+        stale = list(set(hashes) | set(removed))
+        for i in range(0, len(stale), DELETE_BATCH_SIZE):
+            stored.filter(object_id__in=stale[i:i + DELETE_BATCH_SIZE]).delete()
+
+    database.copy_from(RowHash, (
+        RowHash(source=source, object_id=object_id, hash=hash_)
+        for object_id, hash_ in hashes.items()))
+
+
+class Delta(object):
+    """
+    Changes of one source (table) compared to the previous import
+
+    With delta=False the table is expected to be empty, all rows are
+    inserted and only the hashes are stored for the next delta import.
+
+    `derived` are the fields that are not filled from the source but by
+    later tasks (denormalized columns), they keep their value when an
+    object is updated.
+    """
+
+    def __init__(self, model: Type[Model], source: str, delta: bool = True, derived: Iterable[str] = ()):
+        self.model = model
+        self.source = source
+        self.delta = delta
+        self.fields = [
+            f.name for f in model._meta.local_concrete_fields
+            if not f.primary_key and f.name not in derived]
+
+        self.existing = set()
+        self.previous = dict()
+        if delta:
+            self.existing = set(model.objects.values_list('pk', flat=True))
+            self.previous = load_hashes(source)
+
+        self.hashes = dict()
+        self.unchanged = set()
+        self.inserted = []
+        self.updated = []
+        self.deleted = []
+
+    def changed(self, object_id, hash_: str) -> bool:
+        """
+        Registers the hash of a source row, returns if the row has to be processed
+        """
+        if object_id in self.existing and self.previous.get(object_id) == hash_:
+            self.unchanged.add(object_id)
+            return False
+
+        self.unchanged.discard(object_id)
+        self.hashes[object_id] = hash_
+        return True
+
+    def apply(self, objects: Iterable[Model]):
+        """
+        Inserts the new and updates the changed objects, deletes the
+        objects that are no longer in the source, and stores the hashes.
+        """
+        updates = []
+
+        def inserts():
+            for obj in objects:
+                if obj is None:
+                    continue
+                if obj.pk in self.existing:
+                    updates.append(obj)
+                else:
+                    self.inserted.append(obj.pk)
+                    yield obj
+
+        database.copy_from(self.model, inserts())
+
+        if updates:
+            database.copy_update(self.model, updates, self.fields)
+            self.updated = [obj.pk for obj in updates]
+
+        applied = set(self.inserted) | set(self.updated)
+        self.deleted = list(self.existing - self.unchanged - applied)
+        for i in range(0, len(self.deleted), DELETE_BATCH_SIZE):
+            self.model.objects.filter(pk__in=self.deleted[i:i + DELETE_BATCH_SIZE]).delete()
+
+        save_hashes(
+            self.source, {object_id: self.hashes[object_id] for object_id in applied},
+            removed=self.deleted, replace=not self.delta)
+
+        log.info(
+            '%s: %d inserted, %d updated, %d deleted, %d unchanged',
+            self.source, len(self.inserted), len(self.updated), len(self.deleted), len(self.unchanged))
+        if self.delta:
+            record_changes(inserted=self.inserted, updated=self.updated, deleted=self.deleted)
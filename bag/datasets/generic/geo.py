@@ -6,6 +6,8 @@ from django.contrib.gis.gdal import DataSource
 
 from django.contrib.gis.geos import GEOSGeometry, Polygon, MultiPolygon, Point, MultiLineString, LineString
 
+from batch.report import count_rows_read
+
 # sommige WKT-velden zijn best wel groot
 csv.field_size_limit(sys.maxsize)
 
@@ -21,9 +23,13 @@ def process_wkt(path, filename, callback):
     source = os.path.join(path, filename)
     with open(source) as f:
         rows = csv.reader(f, delimiter='|')
+        count = 0
         for row in rows:
+            count += 1
             callback(row[0], GEOSGeometry(row[1]))
 
+    count_rows_read(count)
+
 
 def process_shp(path, filename, callback, encoding='ISO-8859-1'):
     """
@@ -41,6 +47,8 @@ def process_shp(path, filename, callback, encoding='ISO-8859-1'):
     for feature in lyr:
         callback(feature)
 
+    count_rows_read(len(lyr))
+
 
 def get_multipoly(wkt):
     if not wkt:
@@ -0,0 +1,322 @@
+"""
+Shadow schema imports
+
+The import writes into a separate (shadow) schema while the API keeps
+serving the complete tables in the public schema. When the import is
+done and validated the tables are swapped into the public schema in one
+short transaction.
+
+Usage:
+
+    shadow.create(schema)
+    shadow.activate(schema)
+    ... run the import jobs ...
+    shadow.build_indexes(schema)
+    validate_tables.check_table_targets()
+    shadow.deactivate()
+    shadow.swap(schema)
+
+Every bag_/brk_ table and view of the public schema gets an (empty)
+counterpart in the shadow schema, with its keys and indexes. With the
+shadow schema first on the search_path unqualified statements of the
+tasks, including the `DROP ... IF EXISTS` statements of the eigendommen
+sql, only touch the shadow schema. The batch_ tables (checkpoints and
+row hashes) are copied with their rows, so they only change in public
+when the import is swapped in.
+"""
+import logging
+import re
+
+from django.db import connection, transaction
+from django.db.backends.signals import connection_created
+
+log = logging.getLogger(__name__)
+
+PUBLIC = 'public'
+PREFIXES = ('bag_', 'brk_', 'batch_')
+# tables whose rows are copied into the shadow schema
+COPY_PREFIXES = ('batch_',)
+
+_active_schema = None
+
+
+def _quote(name: str) -> str:
+    return connection.ops.quote_name(name)
+
+
+def _fetch(sql: str, params=None) -> list:
+    with connection.cursor() as c:
+        c.execute(sql, params)
+        return c.fetchall()
+
+
+def _execute(*statements: str):
+    with connection.cursor() as c:
+        for sql in statements:
+            c.execute(sql)
+
+
+def _relations(schema: str, prefixes=PREFIXES) -> dict:
+    """Tables and views of schema with a name starting with one of the prefixes"""
+    patterns = [prefix.replace('_', '\\_') + '%' for prefix in prefixes]
+    return dict(_fetch("""
+        SELECT c.relname, c.relkind
+        FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = %s AND c.relkind IN ('r', 'v') AND c.relname LIKE ANY(%s)
+        ORDER BY c.relname
+    """, [schema, patterns]))
+
+
+def _serial_columns(schema: str, table: str) -> list:
+    """(column, sequence) of the columns that own a sequence"""
+    return _fetch("""
+        SELECT a.attname, s.relname
+        FROM pg_depend d
+        JOIN pg_class s ON s.oid = d.objid AND s.relkind = 'S'
+        JOIN pg_attribute a ON a.attrelid = d.refobjid AND a.attnum = d.refobjsubid
+        WHERE d.refobjid = %s::regclass AND d.deptype = 'a'
+    """, [f'{_quote(schema)}.{_quote(table)}'])
+
+
+def _kind(relkind: str) -> str:
+    return {'v': 'VIEW', 'm': 'MATERIALIZED VIEW'}.get(relkind, 'TABLE')
+
+
+def create(schema: str, prefixes=PREFIXES):
+    """
+    (Re)create the shadow schema with an empty copy of the public tables.
+
+    Columns, defaults, keys, unique constraints and indexes are copied,
+    so conflicts are detected while loading and the queries of the
+    denormalizing tasks can use the indexes. Foreign keys are added by
+    `build_indexes` after loading the data.
+    """
+    log.info('Creating shadow schema %s', schema)
+    s = _quote(schema)
+    _execute(f'DROP SCHEMA IF EXISTS {s} CASCADE', f'CREATE SCHEMA {s}')
+
+    tables = []
+    for name, relkind in _relations(PUBLIC, prefixes).items():
+        t = _quote(name)
+        if relkind == 'v':
+            # placeholder, the import (re)creates its views
+            _execute(f'CREATE VIEW {s}.{t} AS SELECT NULL AS placeholder')
+            continue
+
+        _execute(f'CREATE TABLE {s}.{t} (LIKE public.{t} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+
+        # LIKE copies the defaults, which still point to the public sequences
+        for column, sequence in _serial_columns(PUBLIC, name):
+            c, q = _quote(column), _quote(sequence)
+            _execute(
+                f'CREATE SEQUENCE {s}.{q} OWNED BY {s}.{t}.{c}',
+                f"ALTER TABLE {s}.{t} ALTER COLUMN {c} SET DEFAULT nextval('{s}.{q}'::regclass)",
+            )
+
+        if name.startswith(COPY_PREFIXES):
+            _execute(f'INSERT INTO {s}.{t} SELECT * FROM public.{t}')
+        tables.append(name)
+
+    _add_keys_and_indexes(schema, tables, ('p', 'u'))
+
+
+def _set_search_path(sender, connection, **kwargs):
+    if _active_schema:
+        with connection.cursor() as c:
+            c.execute(f'SET search_path TO {connection.ops.quote_name(_active_schema)}, public')
+
+
+def activate(schema: str):
+    """
+    Put the shadow schema first on the search_path of this and of every
+    new connection (the batch workers open their own connections)
+    """
+    global _active_schema
+    _active_schema = schema
+    connection_created.connect(_set_search_path)
+    _set_search_path(None, connection)
+
+
+def is_active() -> bool:
+    return _active_schema is not None
+
+
+def deactivate():
+    global _active_schema
+    _active_schema = None
+    connection_created.disconnect(_set_search_path)
+    _execute('RESET search_path')
+
+
+def build_indexes(schema: str, prefixes=PREFIXES):
+    """
+    Add the foreign keys of the public tables, and the keys and indexes
+    missing after the import, to the loaded shadow tables. Indexes the
+    import created itself are kept.
+    """
+    tables = [name for name, relkind in _relations(schema, prefixes).items() if relkind == 'r']
+    _add_keys_and_indexes(schema, tables, ('p', 'u', 'f'))
+
+
+def _add_keys_and_indexes(schema: str, tables: list, contypes: tuple):
+    """
+    Add the constraints of the contypes and the indexes of the public
+    tables to the shadow tables, when the shadow table has no constraint
+    or index of that name yet
+    """
+    tables = set(tables)
+    public = _relations(PUBLIC, PREFIXES)
+    s = _quote(schema)
+
+    def to_shadow(match):
+        return f'{match.group(1)}{s}.{match.group(2)}' if match.group(2) in tables else match.group(0)
+
+    constraints, indexes = [], []
+    with connection.cursor() as c:
+        # qualify all names in the definitions
+        c.execute('SET search_path TO pg_catalog')
+        for table in sorted(tables & set(public)):
+            regclass = f'public.{_quote(table)}'
+            c.execute("""
+                SELECT conname, pg_get_constraintdef(oid)
+                FROM pg_constraint
+                WHERE conrelid = %s::regclass AND contype::text = ANY(%s)
+                  AND conname NOT IN (SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass)
+                ORDER BY contype = 'f', conname
+            """, [regclass, list(contypes), f'{s}.{_quote(table)}'])
+            constraints += [(table, name, definition) for name, definition in c.fetchall()]
+
+            c.execute("""
+                SELECT i.relname, pg_get_indexdef(i.oid)
+                FROM pg_index x JOIN pg_class i ON i.oid = x.indexrelid
+                WHERE x.indrelid = %s::regclass
+                  AND NOT EXISTS (SELECT 1 FROM pg_constraint k WHERE k.conindid = x.indexrelid)
+                  AND NOT EXISTS (
+                      SELECT 1 FROM pg_class e
+                      WHERE e.relname = i.relname AND e.relnamespace = %s::regnamespace)
+            """, [regclass, schema])
+            indexes += c.fetchall()
+    _set_search_path(None, connection)
+
+    # keys first, the foreign keys need them
+    constraints.sort(key=lambda constraint: constraint[2].startswith('FOREIGN KEY'))
+    for table, name, definition in constraints:
+        definition = re.sub(r'(REFERENCES )public\.(\w+)', to_shadow, definition)
+        log.info('Adding %s to %s.%s', name, schema, table)
+        _execute(f'ALTER TABLE {s}.{_quote(table)} ADD CONSTRAINT {_quote(name)} {definition}')
+
+    for name, definition in indexes:
+        log.info('Creating index %s.%s', schema, name)
+        _execute(re.sub(r'( ON (?:ONLY )?)public\.(\w+)', to_shadow, definition))
+
+
+def _dependent_views(names: set) -> list:
+    """
+    Public views and materialized views outside names that (indirectly)
+    depend on the public relations in names, with their kind and
+    definition, in creation order
+    """
+    views = []
+    found = set(names)
+    while True:
+        rows = _fetch("""
+            SELECT DISTINCT v.relname, v.relkind, pg_get_viewdef(v.oid)
+            FROM pg_depend d
+            JOIN pg_rewrite r ON r.oid = d.objid
+            JOIN pg_class v ON v.oid = r.ev_class AND v.relkind IN ('v', 'm')
+            JOIN pg_class t ON t.oid = d.refobjid AND t.oid <> v.oid
+            WHERE v.relnamespace = 'public'::regnamespace
+              AND t.relnamespace = 'public'::regnamespace
+              AND t.relname = ANY(%s) AND NOT v.relname = ANY(%s)
+        """, [list(found), list(found)])
+        if not rows:
+            return views
+        views += rows
+        found.update(name for name, _, _ in rows)
+
+
+def _create_views(schema: str, views: list):
+    """
+    Create the views in the shadow schema on the shadow tables. The
+    materialized views are filled and get the indexes of their public
+    counterparts.
+    """
+    s = _quote(schema)
+
+    def to_shadow(match):
+        return f'{match.group(1)}{s}.'
+
+    with connection.cursor() as c:
+        # qualify all names in the index definitions
+        c.execute('SET search_path TO pg_catalog')
+        c.execute("""
+            SELECT pg_get_indexdef(x.indexrelid)
+            FROM pg_index x JOIN pg_class t ON t.oid = x.indrelid
+            WHERE t.relnamespace = 'public'::regnamespace AND t.relkind = 'm' AND t.relname = ANY(%s)
+        """, [[name for name, _, _ in views]])
+        indexes = [re.sub(r'( ON (?:ONLY )?)public\.', to_shadow, definition) for definition, in c.fetchall()]
+
+        # the definitions refer to the tables unqualified, they resolve to the shadow tables
+        c.execute(f'SET search_path TO {s}, public')
+        for name, relkind, definition in views:
+            log.info('Creating %s %s.%s', _kind(relkind).lower(), schema, name)
+            c.execute(f'CREATE {_kind(relkind)} {s}.{_quote(name)} AS {definition}')
+        for definition in indexes:
+            c.execute(definition)
+        c.execute('RESET search_path')
+
+
+def _dependent_foreign_keys(names: set) -> list:
+    """Foreign keys of public tables outside names that refer to a table in names"""
+    return _fetch("""
+        SELECT t.relname, k.conname, pg_get_constraintdef(k.oid)
+        FROM pg_constraint k
+        JOIN pg_class t ON t.oid = k.conrelid
+        JOIN pg_class r ON r.oid = k.confrelid
+        WHERE k.contype = 'f'
+          AND t.relnamespace = 'public'::regnamespace AND NOT t.relname = ANY(%s)
+          AND r.relnamespace = 'public'::regnamespace AND r.relname = ANY(%s)
+    """, [list(names), list(names)])
+
+
+def swap(schema: str, prefixes=PREFIXES):
+    """
+    Replace the public tables and views with those of the shadow schema.
+
+    The previous tables are moved to a backup schema that is dropped
+    after the swap. Views and materialized views that refer to the
+    replaced tables are created on the new tables before the swap, so the
+    materialized views are filled outside the swap transaction, and
+    replace the public ones. Foreign keys of other tables that refer to
+    the replaced tables are recreated on the new tables.
+    """
+    relations = _relations(schema, prefixes)
+    public = _relations(PUBLIC, prefixes)
+    s, old = _quote(schema), _quote(f'{schema}_old')
+
+    views = _dependent_views(set(public))
+    foreign_keys = _dependent_foreign_keys(set(public))
+    _create_views(schema, views)
+
+    log.info('Swapping %d relations of schema %s into public', len(relations), schema)
+    with transaction.atomic():
+        _execute(f'DROP SCHEMA IF EXISTS {old} CASCADE', f'CREATE SCHEMA {old}')
+
+        for name, relkind, _ in reversed(views):
+            _execute(f'DROP {_kind(relkind)} public.{_quote(name)}')
+        for table, name, _ in foreign_keys:
+            _execute(f'ALTER TABLE public.{_quote(table)} DROP CONSTRAINT {_quote(name)}')
+
+        for name, relkind in public.items():
+            _execute(f'ALTER {_kind(relkind)} public.{_quote(name)} SET SCHEMA {old}')
+        for name, relkind in relations.items():
+            _execute(f'ALTER {_kind(relkind)} {s}.{_quote(name)} SET SCHEMA public')
+
+        for name, relkind, _ in views:
+            _execute(f'ALTER {_kind(relkind)} {s}.{_quote(name)} SET SCHEMA public')
+        for table, name, definition in foreign_keys:
+            # existing rows were valid against the previous data
+            _execute(f'ALTER TABLE public.{_quote(table)} ADD CONSTRAINT {_quote(name)} {definition} NOT VALID')
+
+    _execute(f'DROP SCHEMA {old} CASCADE', f'DROP SCHEMA {s} CASCADE')
+    log.info('Swapped schema %s into public', schema)
@@ -0,0 +1,107 @@
+import datetime
+
+from django.contrib.gis.geos import MultiPolygon, Point, Polygon
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase
+
+from datasets.bag import models
+from datasets.bag.tests import factories
+from .. import database
+
+
+class CopyFromTest(TestCase):
+
+    def test_copy_text(self):
+        self.assertEqual(database._copy_text(True), 't')
+        self.assertEqual(database._copy_text(datetime.date(2020, 1, 31)), '2020-01-31')
+        self.assertEqual(database._copy_text(['a', 'b "c"', None]), '{"a","b \\"c\\"",NULL}')
+
+    def test_copy_from(self):
+        geometrie = Polygon(((0, 0), (0, 10), (10, 10), (0, 0)), srid=28992)
+        panden = [
+            models.Pand(id='1', landelijk_id='1', pandnaam='tab\there', geometrie=geometrie),
+            None,
+            models.Pand(id='2', landelijk_id='2', bouwjaar=1900, vervallen=False),
+        ]
+
+        self.assertEqual(database.copy_from(models.Pand, panden, batch_size=1), 2)
+
+        pand = models.Pand.objects.get(pk='1')
+        self.assertEqual(pand.pandnaam, 'tab\there')
+        self.assertEqual(pand.geometrie, geometrie)
+        self.assertIsNotNone(pand.date_modified)
+
+        pand = models.Pand.objects.get(pk='2')
+        self.assertEqual(pand.bouwjaar, 1900)
+        self.assertIs(pand.vervallen, False)
+        self.assertIsNone(pand.geometrie)
+
+
+def pand_indexes():
+    with connection.cursor() as c:
+        c.execute("SELECT indexname FROM pg_indexes WHERE tablename = 'bag_pand'")
+        return {name for name, in c.fetchall()}
+
+
+class DeferredIndexesTest(TransactionTestCase):
+
+    def test_indexes_are_recreated(self):
+        indexes = pand_indexes()
+
+        with self.assertRaises(ValueError):
+            with database.deferred_indexes(models.Pand):
+                self.assertLess(pand_indexes(), indexes)
+                raise ValueError()
+
+        self.assertEqual(pand_indexes(), indexes)
+
+    def test_indexes_are_kept_in_transaction(self):
+        indexes = pand_indexes()
+
+        with transaction.atomic(), database.deferred_indexes(models.Pand):
+            self.assertEqual(pand_indexes(), indexes)
+
+
+class BulkWriterTest(TestCase):
+
+    def test_bulk_writer(self):
+        flushed = []
+
+        with database.BulkWriter(models.Pand, batch_size=2, ignore_conflicts=True,
+                                 before_flush=lambda: flushed.append(models.Pand.objects.count())) as writer:
+            writer.extend([
+                models.Pand(id='1', landelijk_id='1'),
+                None,
+                models.Pand(id='2', landelijk_id='2'),
+                models.Pand(id='1', landelijk_id='1'),
+            ])
+            self.assertEqual(models.Pand.objects.count(), 2)
+
+        self.assertEqual(flushed, [0, 2])
+        self.assertEqual(writer.total, 3)
+        self.assertEqual(models.Pand.objects.count(), 2)
+
+
+class UpdateWithinTest(TestCase):
+
+    def test_update_within(self):
+        def square(x, y, size):
+            return MultiPolygon(Polygon.from_bbox((x, y, x + size, y + size)), srid=28992)
+
+        factories.GrootstedelijkGebiedFactory(id='a', geometrie=square(0, 0, 100))
+        factories.GrootstedelijkGebiedFactory(id='b', geometrie=square(50, 50, 100))
+        inside_a = factories.VerblijfsobjectFactory(geometrie=Point(10, 10, srid=28992))
+        inside_both = factories.VerblijfsobjectFactory(geometrie=Point(60, 60, srid=28992))
+        outside = factories.VerblijfsobjectFactory(geometrie=Point(500, 500, srid=28992))
+
+        self.assertEqual(
+            database.update_within(models.Verblijfsobject, '_grootstedelijkgebied', models.Grootstedelijkgebied), 2)
+
+        gebieden = dict(models.Verblijfsobject.objects.values_list('id', '_grootstedelijkgebied'))
+        self.assertEqual(gebieden[inside_a.id], 'a')
+        self.assertEqual(gebieden[inside_both.id], 'b')
+        self.assertIsNone(gebieden[outside.id])
+
+        # nothing changed, nothing is written
+        self.assertEqual(
+            database.update_within(models.Verblijfsobject, '_grootstedelijkgebied', models.Grootstedelijkgebied), 0)
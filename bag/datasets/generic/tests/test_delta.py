@@ -0,0 +1,63 @@
+from django.test import TestCase
+
+from batch.models import RowHash
+from datasets.bag import models
+from .. import delta
+
+
+def import_panden(rows, full=False):
+    changes = delta.Delta(models.Pand, 'test.pand', delta=not full, derived=('bouwjaar',))
+
+    def process_row(r):
+        if not changes.changed(r['id'], delta.row_hash(r)):
+            return None
+        return models.Pand(id=r['id'], landelijk_id=r['id'], pandnaam=r['naam'])
+
+    changes.apply(map(process_row, rows))
+    return changes
+
+
+class DeltaTest(TestCase):
+
+    def setUp(self):
+        import_panden([{'id': '1', 'naam': 'a'}, {'id': '2', 'naam': 'b'}], full=True)
+
+    def test_row_hash(self):
+        self.assertEqual(delta.row_hash({'a': '1', 'b': '2'}), delta.row_hash({'b': '2', 'a': '1'}))
+        self.assertNotEqual(delta.row_hash({'a': '1', 'b': '2'}), delta.row_hash({'a': '12', 'b': ''}))
+
+    def test_full_import_stores_hashes(self):
+        self.assertEqual(RowHash.objects.filter(source='test.pand').count(), 2)
+
+    def test_unchanged(self):
+        changes = import_panden([{'id': '1', 'naam': 'a'}, {'id': '2', 'naam': 'b'}])
+
+        self.assertEqual((changes.inserted, changes.updated, changes.deleted), ([], [], []))
+        self.assertEqual(changes.unchanged, {'1', '2'})
+
+    def test_changes(self):
+        changes = import_panden([{'id': '1', 'naam': 'c'}, {'id': '3', 'naam': 'd'}])
+
+        self.assertEqual(changes.inserted, ['3'])
+        self.assertEqual(changes.updated, ['1'])
+        self.assertEqual(changes.deleted, ['2'])
+        self.assertEqual(
+            dict(models.Pand.objects.values_list('id', 'pandnaam')), {'1': 'c', '3': 'd'})
+
+        changes = import_panden([{'id': '1', 'naam': 'c'}, {'id': '3', 'naam': 'd'}])
+        self.assertEqual(changes.unchanged, {'1', '3'})
+
+    def test_update_keeps_derived_fields(self):
+        models.Pand.objects.filter(pk='1').update(bouwjaar=1900)
+
+        changes = import_panden([{'id': '1', 'naam': 'c'}, {'id': '2', 'naam': 'b'}])
+
+        self.assertEqual(changes.updated, ['1'])
+        self.assertEqual(
+            models.Pand.objects.values_list('pandnaam', 'bouwjaar').get(pk='1'), ('c', 1900))
+
+    def test_deleted_object_is_inserted_again(self):
+        models.Pand.objects.filter(pk='2').delete()
+
+        changes = import_panden([{'id': '1', 'naam': 'a'}, {'id': '2', 'naam': 'b'}])
+        self.assertEqual(changes.inserted, ['2'])
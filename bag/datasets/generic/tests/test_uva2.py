@@ -1,6 +1,15 @@
 import datetime
+import tempfile
+from unittest import mock
+
 from django.test import TestCase
-from .. import uva2
+from .. import delta, uva2
+
+
+def convert_row(r):
+    if r['id'] == '3':
+        return None
+    return int(r['id']), r['naam']
 
 
 class UvaHelperTest(TestCase):
@@ -22,3 +31,69 @@ class UvaHelperTest(TestCase):
         self.assertFalse(uva2.uva_geldig("19000101", "19801101"))
         self.assertFalse(uva2.uva_geldig("20301113", "20311113"))
 
+
+class ProcessCsvTest(TestCase):
+
+    def test_records_match_dict_rows(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv') as f:
+            f.write('id;naam;naam\n1;"a;b";c\n2;d;e\n')
+            f.flush()
+
+            rows = list(uva2.process_csv(None, None, dict, source=f.name))
+            records = list(uva2.process_csv(None, None, lambda r: r, source=f.name, records=True))
+
+        self.assertEqual([dict(r.items()) for r in records], rows)
+        self.assertEqual(records[0]['naam'], 'c')
+        self.assertEqual(records[1]['id'], '2')
+        self.assertIn('naam', records[0])
+        self.assertIsNone(records[0].get('onbekend'))
+        with self.assertRaises(KeyError):
+            records[0]['onbekend']
+
+    def test_short_records_match_dict_rows(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv') as f:
+            f.write('id;naam;type;naam\n1;a;b\n2\n3;c;d;e;f\n')
+            f.flush()
+
+            rows = list(uva2.process_csv(None, None, dict, source=f.name))
+            records = list(uva2.process_csv(None, None, lambda r: r, source=f.name, records=True))
+
+        self.assertEqual([dict(r.items()) for r in records], rows)
+        self.assertEqual([len(r) for r in records], [len(r) for r in rows])
+        self.assertEqual(records[0]['naam'], 'a')
+        self.assertNotIn('type', records[1])
+        self.assertEqual(records[1].get('naam', 'x'), 'x')
+        self.assertEqual([delta.row_hash(r) for r in records], [delta.row_hash(r) for r in rows])
+
+    def test_convert_rows_in_processes(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', encoding='utf-8-sig') as f:
+            f.write('id;naam\n' + ''.join(f'{i};"naam;{i}"\n' for i in range(100)))
+            f.flush()
+
+            with mock.patch.object(uva2, 'CHUNK_SIZE', 64):
+                rows = list(uva2.process_csv(
+                    None, None, lambda r: r, source=f.name, encoding='utf-8-sig',
+                    convert_row=convert_row, processes=2))
+
+        self.assertEqual(rows, [(i, f'naam;{i}') for i in range(100) if i != 3])
+
+    def test_convert_multiline_rows_in_processes(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', encoding='utf-8-sig') as f:
+            f.write(''.join(f'{i};"naam\n""{i}"";\n"\n' for i in range(100)))
+            f.flush()
+
+            with mock.patch.object(uva2, 'CHUNK_SIZE', 64):
+                rows = list(uva2.process_csv(
+                    None, None, lambda r: r, source=f.name, encoding='utf-8-sig', with_header=False,
+                    convert_row=tuple, processes=2))
+
+        self.assertEqual(rows, [(str(i), f'naam\n"{i}";\n') for i in range(100)])
+
+    def test_chunks_end_on_record_boundaries(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv') as f:
+            f.write('id;"naam\nnaam"\n1;"a\nb\nc"\n2;d\n')
+            f.flush()
+
+            chunks = list(uva2._chunks(f.name, 1))
+
+        self.assertEqual(chunks, [(15, 25), (25, 29)])
@@ -1,16 +1,25 @@
 import csv
 import datetime
 import decimal
+import io
 import logging
+import multiprocessing
 import os
 import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from contextlib import contextmanager
 
+from batch.report import count_rows_read
+
 log = logging.getLogger(__name__)
 
 uva2_date_re = re.compile(r'^.*/[a-zA-Z]+_(\d{8})_N_\d{8}_\d{8}\.uva2$', re.IGNORECASE)
 one_date_re = re.compile(r'^.*?_(\d{8})\.[a-z]{3}$', re.IGNORECASE)
 
+# files are converted in parallel in chunks of this number of bytes
+CHUNK_SIZE = 16 * 1024 * 1024
+
 
 def iso_datum(s):
     if not s:
@@ -78,10 +87,75 @@ def _wrap_row(r, headers):
     return dict(zip(headers, r))
 
 
+class Record(object):
+    """
+    CSV row that looks up columns by name like the dict rows do,
+    but without creating a dict for every row.
+
+    The column indices are resolved once per file, see `record_type`.
+    Like `dict(zip(headers, row))` a short row only has the columns it
+    holds values for.
+    """
+    __slots__ = ('_values',)
+    _headers = ()
+    _index = {}
+    _short = {}
+
+    def __init__(self, values):
+        self._values = values
+
+    def _columns(self):
+        size = len(self._values)
+        if size >= len(self._headers):
+            return self._index
+        index = self._short.get(size)
+        if index is None:
+            index = self._short[size] = _column_index(self._headers[:size])
+        return index
+
+    def __getitem__(self, key):
+        return self._values[self._columns()[key]]
+
+    def __contains__(self, key):
+        return key in self._columns()
+
+    def __iter__(self):
+        return iter(self._columns())
+
+    def __len__(self):
+        return len(self._columns())
+
+    def get(self, key, default=None):
+        i = self._columns().get(key)
+        if i is None:
+            return default
+        return self._values[i]
+
+    def keys(self):
+        return self._columns().keys()
+
+    def items(self):
+        return ((k, self._values[i]) for k, i in self._columns().items())
+
+
+def _column_index(headers):
+    # like dict(zip(headers, r)) the last column wins for duplicate headers
+    return {h: i for i, h in enumerate(headers)}
+
+
+def record_type(headers):
+    """
+    Record class for a CSV file with the given headers
+    """
+    headers = tuple(headers)
+    return type('Record', (Record,), {
+        '__slots__': (), '_headers': headers, '_index': _column_index(headers), '_short': {}})
+
+
 @contextmanager
 def _context_reader(
         source, skip=3, quotechar=None, quoting=csv.QUOTE_NONE,
-        with_header=True, encoding='cp1252'):
+        with_header=True, encoding='cp1252', records=False):
 
     if not os.path.exists(source):
         raise ValueError("File not found: {}".format(source))
@@ -92,7 +166,9 @@ def _context_reader(
         for i in range(skip):
             next(rows)
 
-        if with_header:
+        if with_header and records:
+            yield map(record_type(next(rows)), rows)
+        elif with_header:
             headers = next(rows)
             yield (_wrap_row(r, headers) for r in rows)
         else:
@@ -148,7 +224,7 @@ def logging_callback(source_path, original_callback):
             return original_callback(r)
         except:  # noqa we reraise the exception.
             log.error("Could not process row while parsing %s", source_path)
-            for k, v in r.items():
+            for k, v in (r.items() if hasattr(r, 'items') else enumerate(r)):
                 log.error("%s: '%s'", k, v)
             raise
 
@@ -198,34 +274,178 @@ def process_uva2(path, file_code, process_row_callback):
     cb = logging_callback(source, process_row_callback)
 
     with _context_reader(source) as rows:
+        count = 0
         for row in rows:
+            count += 1
             result = cb(row)
             if result:
                 yield result
 
+    count_rows_read(count)
+
 
 def process_csv(
         path, file_code, process_row_callback,
-        with_header=True, quotechar='"', source=None, encoding='cp1252', max_rows=None):
-
+        with_header=True, quotechar='"', source=None, encoding='cp1252', max_rows=None,
+        records=False, convert_row=None, processes=1):
+    """
+    Process a CSV file
+
+    With `convert_row` every row is first converted by that function, and
+    process_row_callback is called with its result instead of the row.
+    convert_row should be a pure (module level, so picklable) function
+    returning a compact tuple, or None to skip the row. Rows are always
+    passed to it as `Record`. With more than one process the conversion
+    of large files is done in parallel, in chunks split on record
+    boundaries.
+
+    :param path: path containing the CSV file
+    :param file_code: code identifying the file
+    :param process_row_callback: function taking one parameter that is called on every row
+    :param source: the CSV file, resolved from path and file_code when not given
+    :param max_rows: stop after this number of rows
+    :param records: pass rows as `Record` instead of dict, saves a dict per row for large files
+    :param convert_row: function converting a row before process_row_callback is called
+    :param processes: number of processes converting rows, needs convert_row
+    :return: an iterable over the results of process_row_callback
+    """
     if not source:
         source = resolve_file(path, file_code, extension='csv')
 
     cb = logging_callback(source, process_row_callback)
 
+    if convert_row and processes > 1 and not max_rows and os.path.getsize(source) > CHUNK_SIZE:
+        yield from _process_csv_parallel(source, convert_row, cb, with_header, quotechar, encoding, processes)
+        return
+
+    convert = None
+    if convert_row:
+        convert = logging_callback(source, convert_row)
+        records = True
+
     with _context_reader(
             source, skip=0, quotechar=quotechar,
-            quoting=csv.QUOTE_MINIMAL, with_header=with_header, encoding=encoding) as rows:
+            quoting=csv.QUOTE_MINIMAL, with_header=with_header, encoding=encoding,
+            records=records) as rows:
         count = 0
         for row in rows:
             count += 1
             if max_rows and count > max_rows:
+                count -= 1
                 break
+            if convert:
+                row = convert(row)
+                if not row:
+                    continue
             result = cb(row)
             if result:
 
                 yield result
 
+    count_rows_read(count)
+
+
+def _process_csv_parallel(source, convert_row, cb, with_header, quotechar, encoding, processes):
+    headers = None
+    if with_header:
+        with open(source, encoding=encoding, newline='') as f:
+            headers = next(csv.reader(f, delimiter=';', quotechar=quotechar))
+
+    # spawn instead of fork, the batch jobs run tasks in threads
+    context = multiprocessing.get_context('spawn')
+    count = 0
+
+    with ProcessPoolExecutor(processes, mp_context=context, initializer=_init_worker) as executor:
+        # a bounded number of chunks in progress, results in file order
+        pending = deque()
+        chunks = _chunks(source, CHUNK_SIZE, with_header, quotechar)
+
+        for chunk in chunks:
+            pending.append(executor.submit(
+                _convert_chunk, source, chunk, headers, convert_row, quotechar, encoding))
+            if len(pending) < 2 * processes:
+                continue
+
+            chunk_count, converted = pending.popleft().result()
+            count += chunk_count
+            yield from filter(None, map(cb, converted))
+
+        while pending:
+            chunk_count, converted = pending.popleft().result()
+            count += chunk_count
+            yield from filter(None, map(cb, converted))
+
+    count_rows_read(count)
+
+
+def _init_worker():
+    # convert_row functions of the datasets need django (models, geos)
+    if os.getenv('DJANGO_SETTINGS_MODULE'):
+        import django
+        django.setup()
+
+
+def _chunks(source, chunk_size, with_header=True, quotechar='"'):
+    """
+    (start, end) byte ranges of the rows after the header, ending on a
+    record boundary: the end of a line outside quoted values, where the
+    number of quote characters since the start of the range is even
+    """
+    size = os.path.getsize(source)
+    quote = quotechar.encode() if quotechar else None
+
+    with open(source, 'rb') as f:
+
+        def read_record(data=b''):
+            # complete a partly read line and any lines of a quoted value it opens
+            quotes = data.count(quote) if quote else 0
+            while True:
+                line = f.readline()
+                if quote:
+                    quotes += line.count(quote)
+                if not line or quotes % 2 == 0:
+                    return
+
+        start = 0
+        if with_header:
+            read_record()
+            start = f.tell()
+
+        while start < size:
+            f.seek(start)
+            read_record(f.read(chunk_size))
+            end = min(f.tell(), size)
+            yield start, end
+            start = end
+
+
+def _convert_chunk(source, chunk, headers, convert_row, quotechar, encoding):
+    """
+    Convert the rows in a chunk of a CSV file, runs in a worker process
+
+    :returns: (number of rows, converted rows)
+    """
+    start, end = chunk
+    with open(source, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start).decode(encoding)
+
+    rows = csv.reader(io.StringIO(data, newline=''), delimiter=';', quotechar=quotechar, quoting=csv.QUOTE_MINIMAL)
+    convert = logging_callback(source, convert_row)
+
+    count = 0
+    converted = []
+    if headers is not None:
+        rows = map(record_type(headers), rows)
+
+    for row in rows:
+        count += 1
+        result = convert(row)
+        if result:
+            converted.append(result)
+
+    return count, converted
+
 
 def read_landelijk_id_mapping(path, file_code):
     source = resolve_file(path, file_code, extension='dat')
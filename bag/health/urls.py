@@ -5,5 +5,6 @@ from health import views
 urlpatterns = [
     url(r'^health$', views.health),
     url(r'^data$', views.check_data),
+    url(r'^elastic$', views.elastic_pool),
 
 ]
\ No newline at end of file
@@ -3,12 +3,12 @@ import logging
 # Packages
 from django.conf import settings
 from django.db import connection
-from django.http import HttpResponse
-from elasticsearch import Elasticsearch
+from django.http import HttpResponse, JsonResponse
 from elasticsearch.exceptions import TransportError, NotFoundError
 from elasticsearch_dsl import Search
 # Project
 from datasets.bag.models import Verblijfsobject
+from search.client import get_client, pool_stats
 
 
 log = logging.getLogger(__name__)
@@ -28,8 +28,7 @@ def health(request):
 
     # check elasticsearch
     try:
-        client = Elasticsearch(settings.ELASTIC_SEARCH_HOSTS)
-        assert client.info()
+        assert get_client().info()
     except:
         log.exception("Elasticsearch connectivity failed")
         return HttpResponse(
@@ -58,7 +57,7 @@ def check_data(request):
             content_type="text/plain", status=500)
 
     # check elastic
-    client = Elasticsearch(settings.ELASTIC_SEARCH_HOSTS)
+    client = get_client()
     for index in settings.ELASTIC_INDICES.values():
         try:
             assert (
@@ -73,3 +72,8 @@ def check_data(request):
                 content_type="text/plain", status=500)
 
     return HttpResponse("Data OK", content_type='text/plain', status=200)
+
+
+def elastic_pool(request):
+    """Connection pool totals of the elastic client of this process"""
+    return JsonResponse(pool_stats())
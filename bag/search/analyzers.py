@@ -186,6 +186,14 @@ straat_no_ws = es.analyzer(
     filter=['lowercase', 'asciifolding', synonym_filter, whitespace_stripper],
 )
 
+# input and query analyzer of completion (suggest) fields
+suggest = es.analyzer(
+    'suggest',
+    tokenizer='standard',
+    filter=['lowercase', 'asciifolding'],
+    char_filter=[naam_stripper],
+)
+
 autocomplete = es.analyzer(
     'autocomplete',
     tokenizer='standard',
@@ -0,0 +1,107 @@
+"""
+Cache of search and typeahead responses
+
+Responses are stored in the `search` cache of CACHES (in process
+memory by default, memcached or redis by configuring that cache), keyed
+by the view, the normalized query, the selected labels and other query
+parameters, the page, the scopes of the caller and the host the links
+are built for:
+
+    key = cache.key(request, self, analyzer, labels, page)
+    data = cache.cache_get(key)
+    if data is None:
+        data = ... search elastic ...
+        cache.cache_set(key, data)
+
+The key also contains the physical indexes behind the ELASTIC_INDICES
+aliases. When a new generation is swapped in or an index is rebuilt the
+keys change, so stale entries are no longer used and expire with their
+timeout. The indexes are looked up at most every
+SEARCH_CACHE['generation_check'] seconds per process.
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from elasticsearch.exceptions import TransportError
+
+from bag import authorization_levels
+from search.client import get_client
+
+log = logging.getLogger(__name__)
+
+# query parameters that are part of the key in another way or do not change the data
+IGNORED_PARAMS = {'q', 'page', 'format'}
+
+_lock = threading.Lock()
+_generation = None
+_generation_checked = 0.0
+
+
+def index_generation() -> str:
+    """Identity of the indexes that are searched, changes when one is replaced"""
+    global _generation, _generation_checked
+
+    now = time.time()
+    if _generation is not None and now - _generation_checked < settings.SEARCH_CACHE['generation_check']:
+        return _generation
+
+    with _lock:
+        if _generation is not None and _generation_checked > now - settings.SEARCH_CACHE['generation_check']:
+            # looked up by another thread meanwhile
+            return _generation
+        try:
+            indexes = get_client().indices.get_settings(
+                index=','.join(settings.ELASTIC_INDICES.values()), name='index.uuid',
+                ignore_unavailable=True)
+            generation = hashlib.blake2b(
+                json.dumps(sorted((name, s['settings']['index']['uuid']) for name, s in indexes.items())).encode(),
+                digest_size=8).hexdigest()
+        except TransportError:
+            log.exception("Could not get the search indexes, not using the search cache")
+            generation = None
+
+        _generation, _generation_checked = generation, now
+    return generation
+
+
+def scopes(request) -> list:
+    is_authorized_for = getattr(request, 'is_authorized_for', None)
+    if not is_authorized_for:
+        return []
+    return [scope for scope in sorted(authorization_levels.all_options) if is_authorized_for(scope)]
+
+
+def key(request, view, analyzer, labels=(), page=1):
+    """Cache key of a response, None when the response should not be cached"""
+    if not settings.SEARCH_CACHE['enabled'] or settings.DEBUG:
+        return None
+
+    generation = index_generation()
+    if generation is None:
+        return None
+
+    params = sorted(
+        (name, value) for name, values in request.query_params.lists()
+        if name not in IGNORED_PARAMS for value in values)
+
+    parts = [
+        generation, type(view).__name__, analyzer._cleaned_query, sorted(labels), params, page,
+        scopes(request), request.build_absolute_uri('/'),
+    ]
+    return 'search:' + hashlib.blake2b(json.dumps(parts).encode(), digest_size=16).hexdigest()
+
+
+def cache_get(key):
+    if key is None:
+        return None
+    return caches['search'].get(key)
+
+
+def cache_set(key, data):
+    if key is not None:
+        caches['search'].set(key, data, settings.SEARCH_CACHE['timeout'])
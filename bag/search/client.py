@@ -0,0 +1,91 @@
+"""
+Shared elasticsearch client
+
+One client per process, created on first use with the
+ELASTIC_CLIENT settings, so all search, typeahead, health and index
+code reuses the pooled (keep-alive) connections to elastic:
+
+    from search.client import get_client
+
+    search.using(get_client()).execute()
+
+The client is also the default elasticsearch_dsl connection. A forked
+process (gunicorn worker) creates its own client, pooled sockets can
+not be shared between processes.
+"""
+import logging
+import os
+import threading
+
+import elasticsearch
+from django.conf import settings
+from elasticsearch_dsl.connections import connections
+
+log = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_client = None
+_pid = None
+
+
+def get_client() -> elasticsearch.Elasticsearch:
+    global _client, _pid
+
+    if _client is None or _pid != os.getpid():
+        with _lock:
+            if _client is None or _pid != os.getpid():
+                options = settings.ELASTIC_CLIENT
+                log.info("Connecting to elastic %s with a pool of %d connections",
+                         settings.ELASTIC_SEARCH_HOSTS, options['maxsize'])
+                _client = elasticsearch.Elasticsearch(hosts=settings.ELASTIC_SEARCH_HOSTS, **options)
+                _pid = os.getpid()
+                connections.add_connection('default', _client)
+    return _client
+
+
+def maintenance_client() -> elasticsearch.Elasticsearch:
+    """
+    New client for long running index maintenance requests (refresh,
+    forcemerge), with one connection and without retries: a retried
+    forcemerge starts again next to the one still running in elastic.
+    Close it with `transport.close()` when done.
+    """
+    options = dict(settings.ELASTIC_CLIENT, maxsize=1, max_retries=0, retry_on_timeout=False)
+    return elasticsearch.Elasticsearch(hosts=settings.ELASTIC_SEARCH_HOSTS, **options)
+
+
+def reset_client():
+    """Drop the client, the next get_client uses the current settings"""
+    global _client
+    with _lock:
+        if _client is not None:
+            _client.transport.close()
+        _client = None
+
+
+def pool_stats() -> dict:
+    """
+    Connection counts of the client over all elastic nodes, empty
+    before first use. Only totals, the status endpoint is public.
+    """
+    if _client is None:
+        return {}
+
+    pool = _client.transport.connection_pool
+    # a single node pool has no dead connections
+    connections_ = getattr(pool, 'orig_connections', pool.connections)
+    stats = dict(nodes=len(connections_), alive=0, opened=0, requests=0, available=0, maxsize=0)
+
+    for connection in connections_:
+        stats['alive'] += connection in pool.connections
+        http = getattr(connection, 'pool', None)
+        if http is not None:
+            # connections opened and requests sent since the start
+            stats['opened'] += http.num_connections
+            stats['requests'] += http.num_requests
+            if http.pool:
+                # slots free for a request, idle or not yet opened
+                stats['available'] += http.pool.qsize()
+                stats['maxsize'] += http.pool.maxsize
+
+    return stats
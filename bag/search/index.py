@@ -1,19 +1,283 @@
+import hashlib
+import json
 import logging
+import queue
+import re
+import threading
+import time
+from contextlib import contextmanager
+from itertools import islice
 
-import elasticsearch
 import elasticsearch_dsl as es
 from django.conf import settings
-from django.db.models import BigIntegerField, F
+from django.db.models import BigIntegerField, F, Func, prefetch_related_objects
 from django.db.models.functions import Cast
 from elasticsearch import helpers
 from elasticsearch.client import IndicesClient
 from elasticsearch.exceptions import NotFoundError, RequestError
-from elasticsearch_dsl.connections import connections
 
+from batch.report import count_rows_read, count_rows_written, record_index_metrics
+from datasets.generic import delta
+from search.client import get_client, maintenance_client
 from datasets.generic.database import count_qs
 
 log = logging.getLogger(__name__)
 
+BULK_LOAD_SETTINGS = {'refresh_interval': '-1', 'number_of_replicas': 0}
+# The indexes do not define these settings, null resets them to the defaults
+PRODUCTION_SETTINGS = {'refresh_interval': None, 'number_of_replicas': None}
+
+
+@contextmanager
+def bulk_load(client, index: str):
+    """
+    Disable refreshes and replicas of index while it is filled.
+
+    The production settings are restored and the index is refreshed,
+    also when loading fails. After a successful load the index is
+    merged to one segment when ELASTIC_BULK['forcemerge'] is set.
+
+    Entered once per index around all tasks filling it, by the
+    elastic_indices command.
+    """
+    log.info("Bulk loading index %s", index)
+    # a job that recreates the index creates it with these settings
+    client.indices.put_settings(index=index, body={'index': BULK_LOAD_SETTINGS}, ignore=404)
+    try:
+        yield
+    except BaseException:
+        restore_settings(client, index, forcemerge=False)
+        raise
+
+    restore_settings(client, index)
+
+
+def restore_settings(client, index: str, forcemerge: bool = None):
+    """
+    Production settings for an index filled in bulk load mode, also
+    for indexes filled by several (--partial) processes
+
+    The refresh and forcemerge take much longer than a search, they are
+    sent with ELASTIC_MAINTENANCE_TIMEOUT_SECONDS and not retried.
+    """
+    client.indices.put_settings(index=index, body={'index': PRODUCTION_SETTINGS})
+
+    maintenance = maintenance_client()
+    try:
+        maintenance.indices.refresh(index=index, request_timeout=settings.ELASTIC_MAINTENANCE_TIMEOUT_SECONDS)
+        log.info("Restored settings of index %s", index)
+
+        if settings.ELASTIC_BULK['forcemerge'] if forcemerge is None else forcemerge:
+            maintenance.indices.forcemerge(
+                index=index, max_num_segments=1, request_timeout=settings.ELASTIC_MAINTENANCE_TIMEOUT_SECONDS)
+    finally:
+        maintenance.transport.close()
+
+
+def generations(client, alias: str) -> list:
+    """Physical indexes built behind alias, oldest first"""
+    pattern = re.compile(re.escape(alias) + r'_\d{14}$')
+    return sorted(name for name in client.indices.get(index=f'{alias}_*') if pattern.match(name))
+
+
+def live_index(client, alias: str):
+    """Index the alias points to, None when there is no such alias"""
+    try:
+        return next(iter(client.indices.get_alias(name=alias)), None)
+    except NotFoundError:
+        return None
+
+
+def building_index(client, alias: str):
+    """Newest generation of alias that is not live yet"""
+    live = live_index(client, alias)
+    newer = [name for name in generations(client, alias) if live is None or name > live]
+    return newer[-1] if newer else None
+
+
+def new_generation(alias: str) -> str:
+    return f"{alias}_{time.strftime('%Y%m%d%H%M%S')}"
+
+
+def _update_alias(client, alias: str, index: str):
+    live = live_index(client, alias)
+    actions = [{'add': {'index': index, 'alias': alias}}]
+    if live:
+        actions.append({'remove': {'index': live, 'alias': alias}})
+    elif client.indices.exists(index=alias):
+        # the index built before aliases were used
+        actions.append({'remove_index': {'index': alias}})
+
+    client.indices.update_aliases(body={'actions': actions})
+    log.info("Alias %s now points to %s (was %s)", alias, index, live or alias)
+
+
+def swap_alias(client, alias: str):
+    """
+    Point alias to the generation that was built last, in one atomic
+    alias update, when its document count is close enough to the count
+    of the live index. Generations older than the previous ones kept
+    for rollback are deleted.
+    """
+    new = building_index(client, alias)
+    if not new:
+        log.info("No new generation of %s to swap", alias)
+        return None
+
+    client.indices.refresh(index=new)
+    count = client.count(index=new)['count']
+    previous = count
+    if client.indices.exists(index=alias):
+        previous = client.count(index=alias)['count']
+
+    min_count = settings.ELASTIC_BLUE_GREEN['min_count_ratio'] * previous
+    if not count or count < min_count:
+        raise ValueError(f"Index {new} has {count} documents, expected at least {int(min_count)} for {alias}")
+
+    _update_alias(client, alias, new)
+
+    old = [name for name in generations(client, alias) if name < new]
+    for name in old[:max(len(old) - settings.ELASTIC_BLUE_GREEN['keep'], 0)]:
+        log.info("Deleting old generation %s", name)
+        client.indices.delete(index=name)
+
+    return new
+
+
+def rollback_alias(client, alias: str):
+    """Point alias back to the previous generation, the current one is deleted"""
+    live = live_index(client, alias)
+    older = [name for name in generations(client, alias) if live and name < live]
+    if not older:
+        raise ValueError(f"No previous generation of {alias} to roll back to")
+
+    _update_alias(client, alias, older[-1])
+    client.indices.delete(index=live)
+    return older[-1]
+
+
+def doc_hash(doc: dict) -> str:
+    """Stable hash of the content of an elastic document"""
+    source = json.dumps(doc.get('_source', doc), sort_keys=True, default=str)
+    return hashlib.blake2b(source.encode(), digest_size=8).hexdigest()
+
+
+def doc_bytes(docs) -> int:
+    """Approximate size of the documents in a bulk request"""
+    return sum(len(json.dumps(doc.get('_source', doc), default=str)) for doc in docs)
+
+
+class IndexMetrics(object):
+    """
+    Throughput of an index task.
+
+    Seconds spent fetching batches from the database, converting them
+    to documents, waiting for a free sender and in bulk requests, with
+    the documents, bytes and errors sent. The bulk time is summed over
+    the sender threads.
+    """
+
+    def __init__(self, name: str, threads: int = 1):
+        self.name = name
+        self.threads = threads
+        self.started = time.time()
+        # objects to read, for the ETA
+        self.total = None
+        self.read = 0
+        self.batches = 0
+        self.docs = 0
+        self.bytes = 0
+        self.errors = 0
+        self.seconds = {'fetch': 0.0, 'convert': 0.0, 'queue_wait': 0.0, 'send': 0.0}
+        self.send_max = 0.0
+        self.requests = 0
+        self.last_progress = self.started
+        # sends are recorded by the sender threads
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def timed(self, name: str):
+        start = time.time()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.seconds[name] += time.time() - start
+
+    @contextmanager
+    def sending(self, docs):
+        size = doc_bytes(docs)
+        start = time.time()
+        try:
+            yield
+        except helpers.BulkIndexError as e:
+            with self._lock:
+                self.errors += len(e.errors)
+            raise
+        finally:
+            elapsed = time.time() - start
+            with self._lock:
+                self.seconds['send'] += elapsed
+                self.send_max = max(self.send_max, elapsed)
+                self.requests += 1
+                self.docs += len(docs)
+                self.bytes += size
+
+    def elapsed(self) -> float:
+        return time.time() - self.started
+
+    def docs_per_second(self) -> float:
+        return self.docs / max(self.elapsed(), 0.001)
+
+    def eta(self):
+        """Seconds until all (total) objects are read, None when unknown"""
+        if not self.total or not self.read:
+            return None
+        rate = self.read / max(self.elapsed(), 0.001)
+        return max(self.total - self.read, 0) / rate
+
+    def bottleneck(self) -> str:
+        """The stage most of the time went to"""
+        stages = {
+            'database': self.seconds['fetch'],
+            'conversion': self.seconds['convert'],
+            'elastic': self.seconds['send'] / self.threads,
+        }
+        return max(stages, key=stages.get)
+
+    def batch_done(self, read: int):
+        """Count a batch of read objects, logs progress every progress_interval seconds"""
+        self.batches += 1
+        self.read += read
+
+        now = time.time()
+        if now - self.last_progress >= settings.ELASTIC_BULK['progress_interval']:
+            self.last_progress = now
+            eta = self.eta()
+            log.info(
+                '%s: %d%s objects read, %d docs sent, %.0f docs/s, %.1f MB, %d errors, ETA %s '
+                '(db %.0fs, convert %.0fs, queue %.0fs, send %.0fs)',
+                self.name, self.read, f'/{self.total}' if self.total else '', self.docs,
+                self.docs_per_second(), self.bytes / 1e6, self.errors,
+                time.strftime('%H:%M:%S', time.gmtime(eta)) if eta is not None else '-',
+                self.seconds['fetch'], self.seconds['convert'], self.seconds['queue_wait'], self.seconds['send'])
+
+    def to_dict(self) -> dict:
+        return {
+            'threads': self.threads,
+            'batches': self.batches,
+            'objects_read': self.read,
+            'docs': self.docs,
+            'bytes': self.bytes,
+            'errors': self.errors,
+            'requests': self.requests,
+            'docs_per_second': round(self.docs_per_second(), 1),
+            'seconds': {name: round(value, 3) for name, value in self.seconds.items()},
+            'send_avg': round(self.seconds['send'] / self.requests, 3) if self.requests else 0.0,
+            'send_max': round(self.send_max, 3),
+            'bottleneck': self.bottleneck(),
+        }
+
 
 class DeleteIndexTask(object):
     index = ''
@@ -28,14 +292,15 @@ class DeleteIndexTask(object):
         if not self.doc_types:
             raise ValueError("No doc_types specified")
 
-        connections.create_connection(
-            hosts=settings.ELASTIC_SEARCH_HOSTS,
-            # sniff_on_start=True,
-            retry_on_timeout=True,
-        )
+        # registers the shared client as the default connection
+        get_client()
 
     def execute(self):
 
+        if settings.ELASTIC_BLUE_GREEN['enabled']:
+            self.create_generation()
+            return
+
         idx = es.Index(self.index)
 
         try:
@@ -49,6 +314,10 @@ class DeleteIndexTask(object):
         for dt in self.doc_types:
             idx.doc_type(dt)
 
+        if settings.ELASTIC_BULK['bulk_load']:
+            # restored by the elastic_indices command when the index is filled
+            idx.settings(**BULK_LOAD_SETTINGS)
+
         try:
             idx.create()
         except RequestError as e:
@@ -58,11 +327,45 @@ class DeleteIndexTask(object):
                 raise
 
 
+    def create_generation(self):
+        """
+        Create a new generation of the index, the live index stays
+        in use until `swap_alias`
+        """
+        client = get_client()
+
+        # left behind by a failed or not swapped build
+        live = live_index(client, self.index)
+        for name in generations(client, self.index):
+            if live is None or name > live:
+                log.info("Deleting unfinished generation %s", name)
+                client.indices.delete(index=name)
+
+        idx = es.Index(new_generation(self.index))
+        for dt in self.doc_types:
+            idx.doc_type(dt)
+        if settings.ELASTIC_BULK['bulk_load']:
+            idx.settings(**BULK_LOAD_SETTINGS)
+
+        idx.create()
+        log.info("Created index %s for %s", idx._name, self.index)
+
+
 class ImportIndexTask(object):
     name = None
     queryset = None
     sequential = False  # Non integer PK
     last_id = None
+    # indexes the documents are sent to
+    indices = None
+    # physical index of each alias when building a new generation
+    targets = None
+    # incremental mode: per index the stored and the new hashes, the ids seen and the doc type
+    previous = None
+    hashes = None
+    seen = None
+    doc_types = None
+    metrics = None
 
     def get_queryset(self):
         return self.queryset.order_by('id')
@@ -73,9 +376,8 @@ class ImportIndexTask(object):
 
     def batch_qs(self):
         """
-        Returns a (queryset, progress) tuple
-        for each batch in the given queryset.
-        by filtering out records by
+        Returns the batches of objects of the part of the
+        queryset this process indexes, by filtering out records by
 
             id % modulo = modulo_value
 
@@ -84,17 +386,20 @@ class ImportIndexTask(object):
         Usage:
             # Make sure to order your querset!
             article_qs = Article.objects.order_by('id')
-            for qs progress in batch_qs(article_qs):
-                do_someting_with_batch(qs)
+            for batch in batch_qs(article_qs):
+                do_someting_with_batch(batch)
 
         """
         qs = self.get_queryset()
-        log.info('ITEMS %d', count_qs(qs))
+        total = count_qs(qs)
+        log.info('ITEMS %d', total)
 
         numerator = settings.PARTIAL_IMPORT['numerator']
         denominator = settings.PARTIAL_IMPORT['denominator']
 
         log.info("PART: %s OF %s" % (numerator+1, denominator))
+        if self.metrics:
+            self.metrics.total = total // denominator
 
         return self.return_qs_parts(qs, denominator, numerator)
 
@@ -106,31 +411,73 @@ class ImportIndexTask(object):
         batch = list()
 
         for obj in qs:
-            batch.append(self.convert(obj).to_dict(include_meta=True))
+            doc = self.convert(obj)
+            if 'id' in doc._doc_type.mapping and doc.id is None:
+                # keyword copy of the document id, sort key of search_after paging
+                doc.id = doc.meta.id
+            batch.append(doc.to_dict(include_meta=True))
             # store last id
             self.last_id = obj.id
 
+        count_rows_read(len(batch))
+
         return batch
 
+    def timed_batches(self):
+        """batch_qs, recording the time spent fetching each batch"""
+        batches = self.batch_qs()
+        while True:
+            with self.metrics.timed('fetch'):
+                qs = next(batches, None)
+            if qs is None:
+                return
+            yield qs
+
+    def convert_batch(self, client, qs) -> list:
+        """The documents of a batch that have to be sent"""
+        with self.metrics.timed('convert'):
+            docs = self.convert_model_to_dict(qs)
+            self.use_indices(client, docs)
+            docs = self.changed_docs(docs)
+        self.metrics.batch_done(len(qs))
+        return docs
+
+    def send_timed(self, client, docs, refresh=False) -> int:
+        with self.metrics.sending(docs):
+            return self.send(client, docs, refresh=refresh)
+
     def execute(self):
         """
         Index data of specified queryset
         """
-        client = elasticsearch.Elasticsearch(
-            hosts=settings.ELASTIC_SEARCH_HOSTS,
-            retry_on_timeout=True,
-            refresh=True
-        )
+        threads = settings.ELASTIC_BULK['threads']
 
-        for qs in self.batch_qs():
+        client = get_client()
 
-            helpers.bulk(
-                client,
-                self.convert_model_to_dict(qs),
-                raise_on_error=True,
-                refresh=True,
-                request_timeout=settings.ELASTIC_INDEXING_TIMEOUT_SECONDS
-            )
+        refresh = not settings.ELASTIC_BULK['bulk_load']
+        self.indices = set()
+        self.targets = dict()
+        self.previous, self.hashes, self.seen, self.doc_types = dict(), dict(), dict(), dict()
+        self.metrics = IndexMetrics(self.name, threads)
+
+        try:
+            if threads > 1:
+                self.execute_parallel(client, threads)
+            else:
+                for qs in self.timed_batches():
+                    docs = self.convert_batch(client, qs)
+                    if docs:
+                        count_rows_written(self.send_timed(client, docs, refresh=refresh))
+
+            if settings.ELASTIC_BULK['incremental']:
+                self.delete_removed_docs(client)
+        finally:
+            metrics = self.metrics.to_dict()
+            record_index_metrics(metrics)
+            log.info(
+                '%s: %d docs in %.0fs, %.0f docs/s, %d errors, bottleneck %s',
+                self.name, self.metrics.docs, self.metrics.elapsed(), metrics['docs_per_second'],
+                self.metrics.errors, metrics['bottleneck'])
 
         # When testing put all docs in one shard to make sure we have
         # correct scores/doc counts and test will succeed
@@ -139,80 +486,201 @@ class ImportIndexTask(object):
             es_index = IndicesClient(client)
             es_index.forcemerge('*test', max_num_segments=1)
 
-    def return_qs_parts(self, qs, modulo, modulo_value):
+    def use_indices(self, client, docs):
         """
-        Build qs
+        Registers the indexes of docs.
 
-        modulo and modulo_value determin which chuncks
-        are teturned.
+        With blue/green builds the docs are sent to the generation
+        that is being built instead of to the live alias.
+        """
+        if settings.ELASTIC_BLUE_GREEN['enabled']:
+            for doc in docs:
+                if '_index' in doc:
+                    doc['_index'] = self.target_index(client, doc['_index'])
+
+        self.indices.update(doc['_index'] for doc in docs if '_index' in doc)
+
+    def target_index(self, client, alias: str) -> str:
+        if alias not in self.targets:
+            self.targets[alias] = building_index(client, alias)
+            if not self.targets[alias]:
+                log.warning("No new generation of %s, indexing into the live index", alias)
+                self.targets[alias] = alias
+        return self.targets[alias]
+
+    def changed_docs(self, docs) -> list:
+        """
+        In incremental mode only the docs that are new or changed since
+        the previous run are returned, by comparing a hash of their
+        content with the hash stored by that run
+        """
+        if not settings.ELASTIC_BULK['incremental']:
+            return docs
+
+        changed = []
+        for doc in docs:
+            index = doc.get('_index')
+            if index not in self.previous:
+                self.previous[index] = delta.load_hashes(self.hash_source(index))
+                self.hashes[index] = dict()
+                self.seen[index] = set()
+                self.doc_types[index] = doc.get('_type')
+
+            doc_id = str(doc['_id'])
+            hash_ = doc_hash(doc)
+            self.seen[index].add(doc_id)
+            if self.previous[index].get(doc_id) != hash_:
+                self.hashes[index][doc_id] = hash_
+                changed.append(doc)
+
+        return changed
+
+    def hash_source(self, index: str) -> str:
+        """
+        Hashes are stored per task, an index can be filled by several
+        tasks that each only know (and delete) their own docs
+        """
+        return f'es.{index}.{type(self).__name__}'
 
-        if partial = 1/3
+    def delete_removed_docs(self, client):
+        """
+        Delete the docs of the previous run of this task that were not
+        produced again and store the hashes of the changed docs
+        """
+        for index, previous in self.previous.items():
+            removed = set(previous) - self.seen[index]
+            if removed:
+                # docs that are already gone (404) are no error
+                helpers.bulk(
+                    client,
+                    ({'_op_type': 'delete', '_index': index, '_type': self.doc_types[index], '_id': doc_id}
+                     for doc_id in removed),
+                    raise_on_error=False,
+                    request_timeout=settings.ELASTIC_INDEXING_TIMEOUT_SECONDS
+                )
 
-        then this function only returns chuncks index id for which
-        modulo id % 3 == 1
+            delta.save_hashes(self.hash_source(index), self.hashes[index], removed=removed)
+            log.info(
+                '%s: %d changed, %d deleted, %d unchanged', index, len(self.hashes[index]), len(removed),
+                len(self.seen[index]) - len(self.hashes[index]))
 
-        Sometimes the ID field is a string with a number.
-        In that case the Indexer can define a substring
-        which will extract the number part of the ID field
+    def send(self, client, docs, refresh=False) -> int:
+        """
+        Bulk index docs in chunks, retrying rejected documents
         """
+        indexed, _ = helpers.bulk(
+            client,
+            docs,
+            chunk_size=settings.ELASTIC_BULK['chunk_size'],
+            max_chunk_bytes=settings.ELASTIC_BULK['max_chunk_bytes'],
+            max_retries=settings.ELASTIC_BULK['max_retries'],
+            initial_backoff=settings.ELASTIC_BULK['initial_backoff'],
+            raise_on_error=True,
+            refresh=refresh,
+            request_timeout=settings.ELASTIC_INDEXING_TIMEOUT_SECONDS
+        )
+        return indexed
 
-        if modulo != 1:
-            if self.sequential:
-                total = count_qs(qs)
-                chunk_size = int(total / modulo)
-                start = chunk_size * modulo_value
-                all_ids = qs.all().values('id')
-                start_id = all_ids[start]['id']
-                qs_s = qs.filter(id__gte=start_id)
-
-                if modulo > modulo_value + 1:
-                    end = chunk_size * (modulo_value + 1)
-                    end_id = all_ids[end]['id']
-                    qs_s = qs_s.filter(id__lt=end_id)
-                    log.info('PART %d/%d start_id : %s end_id : %s', modulo_value + 1, modulo, start_id, end_id)
-                else:
-                    log.info('PART %d/%d start_id : %s ', modulo_value + 1, modulo, start_id)
+    def execute_parallel(self, client, threads: int):
+        """
+        Convert the batches on this thread and send them on `threads`
+        sender threads. The queue between them is bounded, so conversion
+        waits when elastic can not keep up. The indexes are refreshed
+        once at the end instead of after every request (by `bulk_load`
+        in bulk load mode).
+        """
+        batches = queue.Queue(maxsize=settings.ELASTIC_BULK['queue_size'])
+        indexed = []
+        errors = []
+
+        def sender():
+            while True:
+                docs = batches.get()
+                try:
+                    if docs is None:
+                        return
+                    if not errors:
+                        indexed.append(self.send_timed(client, docs))
+                except Exception as e:
+                    errors.append(e)
+                finally:
+                    batches.task_done()
+
+        workers = [threading.Thread(target=sender, daemon=True) for _ in range(threads)]
+        for worker in workers:
+            worker.start()
 
-            else:
-                qs_s = (
-                    qs.annotate(idmod=Cast('id', BigIntegerField()))
-                    .annotate(idmod=F('idmod') % modulo)
-                    .filter(idmod=modulo_value)
-                )
-        else:
-            qs_s = qs
+        try:
+            for qs in self.timed_batches():
+                if errors:
+                    break
+                docs = self.convert_batch(client, qs)
+                if docs:
+                    # waiting here means elastic can not keep up
+                    with self.metrics.timed('queue_wait'):
+                        batches.put(docs)
+        finally:
+            for _ in workers:
+                batches.put(None)
+            for worker in workers:
+                worker.join()
+
+        if errors:
+            raise errors[0]
+
+        count_rows_written(sum(indexed))
+        if self.indices and not settings.ELASTIC_BULK['bulk_load']:
+            client.indices.refresh(index=','.join(sorted(self.indices)))
 
-        qs_count = count_qs(qs_s)
+    def return_qs_parts(self, qs, modulo, modulo_value):
+        """
+        Yield the objects of part modulo_value of modulo in batches
 
-        log.debug('PART %d/%d Count: %d', modulo_value + 1, modulo, qs_count)
+        if partial = 1/3
 
-        if not qs_count:
-            return
+        then this function only returns objects for which
+        id % 3 == 1
+
+        The part is selected in the query and all batches are read from
+        one server side cursor, ordered by id. String ids (sequential)
+        are divided over the parts by their hash.
+        """
+
+        if modulo != 1:
+            if self.sequential:
+                part = Func(
+                    F('id'), template='mod(abs(hashtext(%(expressions)s::text)), {})'.format(modulo),
+                    output_field=BigIntegerField())
+            else:
+                part = Cast('id', BigIntegerField()) % modulo
+            qs = qs.annotate(idmod=part).filter(idmod=modulo_value)
 
         batch_size = settings.BATCH_SETTINGS['batch_size']
-        loopidx = 0
+        # prefetch_related is ignored by iterator(), it is done per batch
+        prefetch = qs._prefetch_related_lookups
+        objects = qs.iterator(chunk_size=batch_size)
 
         # gets updates when we save object in es
         self.last_id = None
+        loopidx = 0
 
         while True:
-            loopidx += 1
+            batch = list(islice(objects, batch_size))
+            if not batch:
+                break
 
-            if not self.last_id:
-                qs_ss = qs_s[:batch_size]
-            else:
-                qs_ss = qs_s.filter(id__gt=self.last_id)[:batch_size]
+            loopidx += 1
+            if prefetch:
+                prefetch_related_objects(batch, *prefetch)
 
-            percentage = int(min(qs_count, (loopidx * batch_size - 1)) / qs_count * 100)
             log.debug(
-                'Batch %4d %6d %3d%% %s  %s',
-                loopidx, min(qs_count, loopidx * batch_size), percentage, self.name,
+                'PART %d/%d Batch %4d %8d %s  %s',
+                modulo_value + 1, modulo, loopidx, (loopidx - 1) * batch_size + len(batch), self.name,
                 self.last_id if loopidx > 1 else ''
             )
 
-            yield qs_ss
+            yield batch
 
-            # QuerySet is materialized, len can be used
-            if len(qs_ss) < batch_size:
+            if len(batch) < batch_size:
                 # no more data
                 break
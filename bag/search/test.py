@@ -0,0 +1,34 @@
+from unittest import mock
+
+from django.conf import settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+class IndexTaskMixin(object):
+    """
+    Checks that the queryset of an index task loads everything its
+    converter needs, so converting a batch takes a fixed number of
+    queries however many objects it holds.
+
+    Mix in with a TestCase that defines `task()`, returning the index
+    task, and `create(count)`, creating count objects the task indexes:
+
+        class IndexPandQueriesTest(IndexTaskMixin, TestCase):
+    """
+
+    def conversion_queries(self) -> int:
+        """Queries to read and convert all objects in one batch"""
+        task = self.task()
+        with mock.patch.dict(settings.BATCH_SETTINGS, batch_size=1000):
+            with CaptureQueriesContext(connection) as queries:
+                for qs in task.return_qs_parts(task.get_queryset(), 1, 0):
+                    task.convert_model_to_dict(qs)
+        return len(queries)
+
+    def test_constant_queries_per_batch(self):
+        self.create(2)
+        few = self.conversion_queries()
+
+        self.create(8)
+        self.assertEqual(self.conversion_queries(), few)
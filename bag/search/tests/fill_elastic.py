@@ -126,11 +126,13 @@ def load_docs(cls):
     batch.execute(datasets.bag.batch.DeleteIndexBagJob())
     batch.execute(datasets.bag.batch.DeleteIndexGebiedJob())
     batch.execute(datasets.bag.batch.DeleteIndexPandJob())
+    batch.execute(datasets.bag.batch.DeleteIndexSuggestJob())
     batch.execute(datasets.brk.batch.DeleteIndexKadasterJob())
 
     batch.execute(datasets.bag.batch.IndexBagJob())
     batch.execute(datasets.bag.batch.IndexGebiedenJob())
     batch.execute(datasets.bag.batch.IndexPandJob())
+    batch.execute(datasets.bag.batch.BuildIndexSuggestJob())
     batch.execute(datasets.brk.batch.IndexKadasterJob())
 
     es = Elasticsearch(hosts=settings.ELASTIC_SEARCH_HOSTS)
@@ -0,0 +1,56 @@
+from unittest import mock
+
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from rest_framework.request import Request
+
+from search import cache
+from search.query_analyzer import QueryAnalyzer
+
+
+def request(path='/typeahead/', scopes=(), **params):
+    r = Request(RequestFactory().get(path, params))
+    r.is_authorized_for = lambda scope: scope in scopes
+    return r
+
+
+class View:
+    pass
+
+
+@override_settings(SEARCH_CACHE={'enabled': True, 'timeout': 60, 'generation_check': 30}, DEBUG=False)
+@mock.patch.object(cache, 'index_generation', return_value='1')
+class SearchCacheTest(SimpleTestCase):
+
+    def key(self, q, r=None, labels=(), page=1):
+        return cache.key(r or request(q=q), View(), QueryAnalyzer(q), labels, page)
+
+    def test_normalized_query(self, generation):
+        self.assertEqual(self.key('Dam'), self.key('dam'))
+        self.assertNotEqual(self.key('dam'), self.key('damrak'))
+
+    def test_labels_page_and_params(self, generation):
+        self.assertNotEqual(self.key('dam', labels={'bag'}), self.key('dam', labels={'brk'}))
+        self.assertNotEqual(self.key('dam', page=1), self.key('dam', page=2))
+        self.assertNotEqual(self.key('dam'), self.key('dam', request(q='dam', subtype='weg')))
+        self.assertEqual(self.key('dam'), self.key('dam', request(q='dam', format='json')))
+
+    def test_scopes(self, generation):
+        self.assertNotEqual(self.key('dam'), self.key('dam', request(q='dam', scopes={'BRK/RO'})))
+
+    def test_index_generation(self, generation):
+        key = self.key('dam')
+        generation.return_value = '2'
+        self.assertNotEqual(self.key('dam'), key)
+
+        generation.return_value = None
+        self.assertIsNone(self.key('dam'))
+
+    def test_disabled(self, generation):
+        with self.settings(SEARCH_CACHE={'enabled': False}):
+            self.assertIsNone(self.key('dam'))
+
+    def test_get_set(self, generation):
+        key = self.key('dam')
+        self.assertIsNone(cache.cache_get(key))
+        cache.cache_set(key, ['result'])
+        self.assertEqual(cache.cache_get(key), ['result'])
@@ -0,0 +1,38 @@
+from unittest import TestCase, mock
+
+from elasticsearch_dsl.connections import connections
+
+from search import client
+
+
+class SharedClientTest(TestCase):
+
+    def setUp(self):
+        client.reset_client()
+        self.addCleanup(client.reset_client)
+
+    def test_one_client_per_process(self):
+        shared = client.get_client()
+
+        self.assertIs(client.get_client(), shared)
+        self.assertIs(connections.get_connection(), shared)
+
+        with mock.patch.object(client.os, 'getpid', return_value=-1):
+            self.assertIsNot(client.get_client(), shared)
+
+    def test_pool_stats(self):
+        self.assertEqual(client.pool_stats(), {})
+
+        with mock.patch.dict(client.settings.ELASTIC_CLIENT, maxsize=3):
+            client.get_client()
+
+        self.assertEqual(client.pool_stats(), {
+            'nodes': 1, 'alive': 1, 'opened': 0, 'requests': 0, 'available': 3, 'maxsize': 3})
+
+    def test_maintenance_client_does_not_retry(self):
+        maintenance = client.maintenance_client()
+        self.addCleanup(maintenance.transport.close)
+
+        self.assertIsNot(maintenance, client.get_client())
+        self.assertEqual(maintenance.transport.max_retries, 0)
+        self.assertFalse(maintenance.transport.retry_on_timeout)
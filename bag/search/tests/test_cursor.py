@@ -0,0 +1,24 @@
+from django.test import SimpleTestCase
+from elasticsearch_dsl import Search
+
+from search import views
+
+
+class CursorTest(SimpleTestCase):
+
+    def test_cursor(self):
+        after = ['prinsengracht', 12, '0363200000000001']
+        self.assertEqual(views.decode_cursor(views.encode_cursor(after)), after)
+        self.assertEqual(views.decode_cursor(''), [])
+
+        for cursor in ('invalid!', views.encode_cursor({'a': 1})[:-2], 'eyJhIjogMX0='):
+            with self.assertRaises(ValueError):
+                views.decode_cursor(cursor)
+
+    def test_stable_sort(self):
+        tie_breaker = {'id': {'unmapped_type': 'keyword'}}
+        self.assertEqual(views.stable_sort(Search()), ['_score', tie_breaker])
+        self.assertEqual(
+            views.stable_sort(Search().sort({'aanduiding.raw': {'unmapped_type': 'long'}})),
+            [{'aanduiding.raw': {'unmapped_type': 'long'}}, tie_breaker])
+        self.assertEqual(views.stable_sort(Search().sort('id')), ['id'])
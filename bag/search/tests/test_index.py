@@ -0,0 +1,244 @@
+import threading
+from unittest import TestCase, mock
+
+import elasticsearch_dsl as es
+
+from search import index
+
+
+class BatchIndexTask(index.ImportIndexTask):
+    name = 'batches'
+
+    def __init__(self, batches, fail=False):
+        self.batches = batches
+        self.fail = fail
+        self.sent = []
+        self.threads = set()
+        self.indices = set()
+        self.metrics = index.IndexMetrics(self.name)
+
+    def batch_qs(self):
+        return iter(self.batches)
+
+    def convert_model_to_dict(self, qs):
+        return [{'_index': 'test_index', '_id': i, '_source': {}} for i in qs]
+
+    def send(self, client, docs, refresh=False):
+        if self.fail:
+            raise ValueError('rejected')
+        self.sent.extend(doc['_id'] for doc in docs)
+        self.threads.add(threading.current_thread().name)
+        return len(docs)
+
+
+class ParallelIndexTest(TestCase):
+
+    def test_execute_parallel(self):
+        client = mock.Mock()
+        task = BatchIndexTask([[1, 2], [3], [4, 5]])
+
+        task.execute_parallel(client, threads=2)
+
+        self.assertEqual(sorted(task.sent), [1, 2, 3, 4, 5])
+        self.assertNotIn(threading.current_thread().name, task.threads)
+        client.indices.refresh.assert_called_once_with(index='test_index')
+
+    def test_failed_request_stops_indexing(self):
+        client = mock.Mock()
+        task = BatchIndexTask([[1], [2]], fail=True)
+
+        with self.assertRaises(ValueError):
+            task.execute_parallel(client, threads=2)
+        client.indices.refresh.assert_not_called()
+
+
+class IdDoc(es.DocType):
+    id = es.Keyword()
+    naam = es.Text()
+
+
+class ConvertTest(TestCase):
+
+    def test_id_is_filled(self):
+        class ConvertTask(index.ImportIndexTask):
+            def __init__(self):
+                pass
+
+            def convert(self, obj):
+                return IdDoc(_id=f'opr_{obj.id}', naam='a')
+
+        docs = ConvertTask().convert_model_to_dict([mock.Mock(id=1)])
+
+        self.assertEqual(docs[0]['_source'], {'id': 'opr_1', 'naam': 'a'})
+
+
+class IndexMetricsTest(TestCase):
+
+    def test_metrics(self):
+        client = mock.Mock()
+        task = BatchIndexTask([[1, 2], [3], [4, 5]])
+
+        task.execute_parallel(client, threads=2)
+
+        metrics = task.metrics.to_dict()
+        self.assertEqual((metrics['batches'], metrics['objects_read'], metrics['docs']), (3, 5, 5))
+        self.assertEqual(metrics['requests'], 3)
+        self.assertEqual(metrics['bytes'], 10)
+        self.assertEqual(metrics['errors'], 0)
+        self.assertIn(metrics['bottleneck'], ('database', 'conversion', 'elastic'))
+
+    def test_errors_are_counted(self):
+        metrics = index.IndexMetrics('test')
+
+        with self.assertRaises(index.helpers.BulkIndexError):
+            with metrics.sending([{'_source': {}}] * 3):
+                raise index.helpers.BulkIndexError('2 document(s) failed to index.', [{}, {}])
+
+        self.assertEqual((metrics.errors, metrics.docs, metrics.requests), (2, 3, 1))
+
+    def test_eta(self):
+        metrics = index.IndexMetrics('test')
+        self.assertIsNone(metrics.eta())
+
+        metrics.total = 100
+        metrics.started -= 10
+        metrics.batch_done(25)
+        self.assertAlmostEqual(metrics.eta(), 30, delta=1)
+
+
+class BulkLoadTest(TestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(index, 'maintenance_client')
+        self.maintenance = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+
+    def test_settings_are_restored_on_failure(self):
+        client = mock.Mock()
+
+        with mock.patch.dict(index.settings.ELASTIC_BULK, forcemerge=True):
+            with self.assertRaises(ValueError):
+                with index.bulk_load(client, 'test_index'):
+                    raise ValueError('failed')
+
+        self.assertEqual(client.indices.put_settings.call_args_list, [
+            mock.call(index='test_index', body={'index': index.BULK_LOAD_SETTINGS}, ignore=404),
+            mock.call(index='test_index', body={'index': index.PRODUCTION_SETTINGS}),
+        ])
+        self.maintenance.indices.refresh.assert_called_once_with(
+            index='test_index', request_timeout=index.settings.ELASTIC_MAINTENANCE_TIMEOUT_SECONDS)
+        self.maintenance.indices.forcemerge.assert_not_called()
+        self.maintenance.transport.close.assert_called_once_with()
+
+    def test_restore_settings(self):
+        client = mock.Mock()
+
+        with mock.patch.dict(index.settings.ELASTIC_BULK, forcemerge=True):
+            with index.bulk_load(client, 'test_index'):
+                pass
+
+        timeout = index.settings.ELASTIC_MAINTENANCE_TIMEOUT_SECONDS
+        self.maintenance.indices.refresh.assert_called_once_with(index='test_index', request_timeout=timeout)
+        self.maintenance.indices.forcemerge.assert_called_once_with(
+            index='test_index', max_num_segments=1, request_timeout=timeout)
+
+
+def generations_client(names, live):
+    client = mock.Mock()
+    client.indices.get.side_effect = lambda index: {name: {} for name in names}
+    client.indices.get_alias.return_value = {live: {}}
+    client.indices.exists.return_value = True
+    client.count.return_value = {'count': 100}
+    return client
+
+
+@mock.patch.dict(index.settings.ELASTIC_BLUE_GREEN, keep=1, min_count_ratio=0.9)
+class BlueGreenTest(TestCase):
+
+    def test_swap_alias(self):
+        client = generations_client(
+            ['bag_20200101000000', 'bag_20200201000000', 'bag_20200301000000', 'bag_other'],
+            live='bag_20200201000000')
+
+        self.assertEqual(index.swap_alias(client, 'bag'), 'bag_20200301000000')
+
+        client.indices.update_aliases.assert_called_once_with(body={'actions': [
+            {'add': {'index': 'bag_20200301000000', 'alias': 'bag'}},
+            {'remove': {'index': 'bag_20200201000000', 'alias': 'bag'}},
+        ]})
+        # the previous generation is kept for a rollback
+        client.indices.delete.assert_called_once_with(index='bag_20200101000000')
+
+    def test_swap_checks_document_count(self):
+        client = generations_client(['bag_20200101000000', 'bag_20200201000000'], live='bag_20200101000000')
+        client.count.side_effect = [{'count': 10}, {'count': 100}]
+
+        with self.assertRaises(ValueError):
+            index.swap_alias(client, 'bag')
+        client.indices.update_aliases.assert_not_called()
+
+    def test_rollback_alias(self):
+        client = generations_client(['bag_20200101000000', 'bag_20200201000000'], live='bag_20200201000000')
+
+        self.assertEqual(index.rollback_alias(client, 'bag'), 'bag_20200101000000')
+        client.indices.delete.assert_called_once_with(index='bag_20200201000000')
+
+
+@mock.patch.dict(index.settings.ELASTIC_BULK, incremental=True)
+class IncrementalIndexTest(TestCase):
+
+    def test_doc_hash(self):
+        self.assertEqual(index.doc_hash({'_source': {'a': 1, 'b': 2}}), index.doc_hash({'_source': {'b': 2, 'a': 1}}))
+        self.assertNotEqual(index.doc_hash({'_source': {'a': 1}}), index.doc_hash({'_source': {'a': 2}}))
+
+    @mock.patch.object(index.delta, 'save_hashes')
+    @mock.patch.object(index.helpers, 'bulk')
+    def test_only_changed_docs_are_sent(self, bulk, save_hashes):
+        task = BatchIndexTask([])
+        task.previous, task.hashes, task.seen, task.doc_types = {}, {}, {}, {}
+
+        docs = [
+            {'_index': 'test_index', '_type': 'doc', '_id': 1, '_source': {'naam': 'a'}},
+            {'_index': 'test_index', '_type': 'doc', '_id': 2, '_source': {'naam': 'b'}},
+        ]
+        previous = {'1': index.doc_hash(docs[0]), '2': 'changed', '3': 'removed'}
+
+        with mock.patch.object(index.delta, 'load_hashes', return_value=previous):
+            self.assertEqual(task.changed_docs(docs), [docs[1]])
+
+        task.delete_removed_docs(mock.Mock())
+
+        actions = list(bulk.call_args[0][1])
+        self.assertEqual(actions, [{'_op_type': 'delete', '_index': 'test_index', '_type': 'doc', '_id': '3'}])
+        save_hashes.assert_called_once_with(
+            'es.test_index.BatchIndexTask', {'2': index.doc_hash(docs[1])}, removed={'3'})
+
+    @mock.patch.object(index.helpers, 'bulk')
+    def test_tasks_sharing_an_index(self, bulk):
+        class OtherIndexTask(BatchIndexTask):
+            pass
+
+        stored = {}
+
+        def save_hashes(source, hashes, removed=()):
+            stored[source] = {k: v for k, v in stored.get(source, {}).items() if k not in removed}
+            stored[source].update(hashes)
+
+        def run(task, ids):
+            task.previous, task.hashes, task.seen, task.doc_types = {}, {}, {}, {}
+            docs = [{'_index': 'test_index', '_type': 'doc', '_id': i, '_source': {}} for i in ids]
+            task.changed_docs(docs)
+            task.delete_removed_docs(mock.Mock())
+
+        with mock.patch.object(index.delta, 'load_hashes', side_effect=lambda source: dict(stored.get(source, {}))), \
+                mock.patch.object(index.delta, 'save_hashes', side_effect=save_hashes):
+            run(BatchIndexTask([]), [1, 2])
+            run(OtherIndexTask([]), [3])
+            run(BatchIndexTask([]), [1, 2])
+            run(OtherIndexTask([]), [3])
+
+        # no task deletes the docs of the other one
+        bulk.assert_not_called()
+        self.assertEqual(
+            {source: set(hashes) for source, hashes in stored.items()},
+            {'es.test_index.BatchIndexTask': {'1', '2'}, 'es.test_index.OtherIndexTask': {'3'}})
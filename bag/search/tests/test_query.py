@@ -53,6 +53,17 @@ class QueryTest(APITransactionTestCase):
         self.assertEqual(
             response.data['results'][0]['code'], "RN35")
 
+    def test_cursor_paging(self):
+        response = self.client.get(
+            "/atlas/search/openbareruimte/", {'q': "Prinsengracht", 'cursor': ''})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('results', response.data)
+        self.assertIsNone(response.data['_links']['prev']['href'])
+
+        response = self.client.get(
+            "/atlas/search/openbareruimte/", {'q': "Prinsengracht", 'cursor': 'invalid'})
+        self.assertEqual(response.status_code, 400)
+
     def test_adres(self):
         response = self.client.get(
             "/atlas/search/postcode/", {'q': "1016 SZ 228 a 1"})
@@ -115,6 +126,26 @@ class QueryTest(APITransactionTestCase):
 
         self.assertIn('Rozenstraat', str(response.data))
 
+    def test_typeahead_bag_suggest(self):
+        response = self.client.get(
+            "/atlas/typeahead/bag/", {'q': "Rozenstr", 'suggest': 'true'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Rozenstraat 228', str(response.data))
+
+        response = self.client.get(
+            "/atlas/typeahead/bag/", {'q': "1016 SZ 229", 'suggest': 'true'})
+        self.assertIn('Rozenstraat 229', str(response.data))
+
+    def test_typeahead_bag_suggest_keeps_queries(self):
+        q = self.pand1.landelijk_id[0:9]
+        res = self.client.get('/atlas/typeahead/bag/', {'q': q, 'suggest': 'true'})
+        self.assertEqual(200, res.status_code)
+        self.assertEqual(f'bag/v1.1/pand/{self.pand1.landelijk_id}/', res.data[0]['content'][0]['uri'])
+
+        res = self.client.get('/atlas/typeahead/bag/', {'q': "Rozenstraat 228", 'suggest': 'true'})
+        uris = [item['uri'] for group in res.data for item in group['content']]
+        self.assertEqual(len(uris), len(set(uris)))
+
     def test_typeahead_bag_adres(self):
 
         for fmt, content_type in self.formats:
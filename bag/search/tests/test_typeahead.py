@@ -0,0 +1,66 @@
+from unittest import TestCase, mock
+
+from elasticsearch.exceptions import TransportError
+from elasticsearch_dsl import Search
+
+from search import views
+
+
+class MultiSearchTypeaheadTest(TestCase):
+
+    def typeahead(self, client, view=None, suggest=False):
+        view = view or views.TypeaheadViewSet()
+        view.client = client
+        queries = [Search(index='bag').query('match', naam='a'), Search(index='brk').query('match', naam='a')]
+
+        with mock.patch.object(views, 'select_queries', return_value=queries) as select_queries:
+            results = view.autocomplete_queries(mock.Mock(), 'a', set(), suggest)
+        self.replaced = select_queries.call_args[1]['replaced']
+        return results
+
+    def test_one_request(self):
+        client = mock.Mock()
+        client.msearch.return_value = {'responses': [
+            {'hits': {'total': 1, 'hits': [{'_index': 'bag', '_source': {'naam': 'a'}}]}},
+            {'hits': {'total': 0, 'hits': []}},
+        ]}
+
+        results = self.typeahead(client)
+
+        client.msearch.assert_called_once()
+        self.assertEqual([len(result) for result in results], [1, 0])
+
+    def test_suggestions_in_the_same_request(self):
+        client = mock.Mock()
+        client.msearch.return_value = {'responses': [
+            {'hits': {'total': 1, 'hits': [{'_index': 'bag', '_source': {'naam': 'a'}}]}},
+            {'hits': {'total': 0, 'hits': []}},
+            {'hits': {'total': 0, 'hits': []}, 'suggest': {'suggestions': [{
+                'text': 'a', 'offset': 0, 'length': 1,
+                'options': [{'text': 'ab', '_index': 'suggest', '_source': {'naam': 'ab'}}]}]}},
+        ]}
+
+        results = self.typeahead(client, views.TypeAheadBagViewSet(), suggest=True)
+
+        client.msearch.assert_called_once()
+        self.assertEqual(self.replaced, views.TypeAheadBagViewSet.suggested_queries)
+        self.assertEqual([len(result) for result in results], [1, 0, 1])
+        self.assertEqual(results[2][0].naam, 'ab')
+
+    def test_failed_query_is_skipped(self):
+        client = mock.Mock()
+        client.msearch.return_value = {'responses': [
+            {'error': {'type': 'search_phase_execution_exception'}},
+            {'hits': {'total': 1, 'hits': [{'_index': 'brk', '_source': {'naam': 'a'}}]}},
+        ]}
+
+        results = self.typeahead(client)
+
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0][0].naam, 'a')
+
+    def test_failed_request(self):
+        client = mock.Mock()
+        client.msearch.side_effect = TransportError(503, 'unavailable')
+
+        self.assertEqual(self.typeahead(client), [])
@@ -6,6 +6,8 @@ Views that are querying Elasticsearch
 """
 from __future__ import annotations
 
+import base64
+import binascii
 import json
 import logging
 import re
@@ -19,9 +21,9 @@ from urllib.parse import quote, urlparse
 from django.conf import settings
 from django.utils.encoding import force_text
 
-from elasticsearch import Elasticsearch
 from elasticsearch.exceptions import TransportError
-from elasticsearch_dsl import Search
+from elasticsearch_dsl import MultiSearch, Search
+from elasticsearch_dsl.response import Hit
 from rest_framework import viewsets, metadata
 from rest_framework.request import Request
 from rest_framework.response import Response
@@ -33,6 +35,8 @@ from bag import authorization_levels
 from datasets.bag import queries as bag_qs  # noqa
 from datasets.brk import queries as brk_qs  # noqa
 from datasets.generic import rest
+from search import cache
+from search.client import get_client
 from search.query_analyzer import QueryAnalyzer
 
 
@@ -257,13 +261,15 @@ def select_queries(
         query_string: str,
         analyzer: QueryAnalyzer,
         q_select: AbstractSet[str] = None,
-        features: int = 0) -> List[Search]:
+        features: int = 0,
+        replaced: AbstractSet[CallableQueryFunction] = frozenset()) -> List[Search]:
     """
     Looks at the query string being filled and tries
     to make conclusions about what is actually being searched.
     This is useful to reduce the number of queries and reduce the result size
 
-    Returns a list of queries that should be used
+    Returns a list of queries that should be used, without the
+    replaced queries (answered by the completion suggester)
     """
 
     # Too little information to search on
@@ -279,7 +285,7 @@ def select_queries(
         log.debug("No specialized queries for '%s', using defaults", query_string)
         queries = find_default_queries(q_select, features)
 
-    return [q(analyzer, features) for q in queries]
+    return [q(analyzer, features) for q in queries if q not in replaced]
 
 
 def _get_doc_attr(hit, attribute, default):
@@ -322,6 +328,37 @@ def _get_url(request, hit):
         kwargs={'pk': pk}, request=request)
 
 
+def encode_cursor(after: list) -> str:
+    """Opaque cursor of the sort values of the last hit of a page"""
+    return base64.urlsafe_b64encode(json.dumps(after).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> list:
+    """The sort values to search after, an empty cursor starts at the first hit"""
+    if not cursor:
+        return []
+    try:
+        after = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (binascii.Error, ValueError):
+        raise ValueError(f"Invalid cursor {cursor}")
+    if not isinstance(after, list):
+        raise ValueError(f"Invalid cursor {cursor}")
+    return after
+
+
+# keyword copy of the document id, set by the index tasks, unlike
+# _id it has doc values to sort on
+ID_FIELD = 'id'
+
+
+def stable_sort(search: Search) -> list:
+    """The sort of search, with the document id to order the ties"""
+    sort = list(search._sort) or ['_score']
+    if not any(field == ID_FIELD or (isinstance(field, dict) and ID_FIELD in field) for field in sort):
+        sort.append({ID_FIELD: {'unmapped_type': 'keyword'}})
+    return sort
+
+
 class QueryMetadata(metadata.SimpleMetadata):
     def determine_metadata(self, request, view):
         result = super().determine_metadata(request, view)
@@ -393,10 +430,16 @@ class TypeaheadViewSet(viewsets.ViewSet):
     metadata_class = QueryMetadata
     renderer_classes = rest.DEFAULT_RENDERERS
     features = 0
+    # completion suggester index of the suggest mode, None when there is none
+    suggestions_index = None
+    suggestions_size = 30
+    # queries answered by the completion suggester in suggest mode
+    suggested_queries = frozenset()
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
-        self.client = Elasticsearch(settings.ELASTIC_SEARCH_HOSTS)
+        self.client = get_client()
+        self.failed = False
 
     def authorized_queries(self, request: Request, analyzer) -> List[Search]:
         """
@@ -406,12 +449,19 @@ class TypeaheadViewSet(viewsets.ViewSet):
         return []
 
     def autocomplete_queries(
-            self, request, query: str, q_select: AbstractSet[str]):
-        """provide autocomplete suggestions"""
+            self, request, query: str, q_select: AbstractSet[str], suggest: bool = False):
+        """
+        provide autocomplete suggestions
+
+        With suggest the completion suggester replaces the
+        suggested_queries, in the same (_msearch) request
+        """
 
         # get the relevant queries
         analyzer = QueryAnalyzer(query)
-        query_components = select_queries(query, analyzer, q_select or set(), self.features)
+        query_components = select_queries(
+            query, analyzer, q_select or set(), self.features,
+            replaced=self.suggested_queries if suggest else frozenset())
 
         authorized_queries = self.authorized_queries(request, analyzer)
         # if you are authorized to look for names
@@ -419,55 +469,96 @@ class TypeaheadViewSet(viewsets.ViewSet):
         if authorized_queries:
             query_components.extend(authorized_queries)
 
-        result_data = []
+        suggestions = None
+        if suggest:
+            # after the query results, which hold the exact matches
+            suggestions = self.suggestions(query)
+            query_components.append(suggestions)
 
-        # Ignoring cache in case debug is on
-        ignore_cache = settings.DEBUG
+        self.failed = False
+        if not query_components:
+            return []
 
-        # create elk queries
+        # all queries in one (_msearch) request
+        multi_search = MultiSearch(using=self.client)
         for search in query_components:  # type: Search
-            search = search.using(self.client)
+            multi_search = multi_search.add(search)
 
-            log.debug(
-                "Running query at %s: %s", search._index,
-                json.dumps(search.to_dict(), indent=4)
-            )
+        log.debug(
+            "Running queries at %s: %s", [search._index for search in multi_search],
+            json.dumps(multi_search.to_dict(), indent=4)
+        )
 
-            # get the result from elastic
-            try:
-                result = search.execute(ignore_cache=ignore_cache)
-            except TransportError as t:
-                log.exception(
+        # get the result from elastic
+        try:
+            # Ignoring cache in case debug is on
+            responses = multi_search.execute(ignore_cache=settings.DEBUG, raise_on_error=False)
+        except TransportError:
+            log.exception('FAILED ELK MULTI SEARCH: %s', json.dumps(multi_search.to_dict(), indent=4))
+            self.failed = True
+            return []
+
+        result_data = []
+        for search, result in zip(multi_search, responses):
+            # a failed query does not fail the others
+            if result is None:
+                self.failed = True
+                log.error(
                     'FAILED ELK SEARCH: at %s %s', search._index,
                     json.dumps(search.to_dict(), indent=4))
                 continue
 
+            if search is suggestions:
+                result = [Hit(option.to_dict()) for option in result.suggest.suggestions[0].options]
+
             # Get the datas!
             result_data.append(result)
 
         return result_data
 
+    def use_suggestions(self, request) -> bool:
+        if not self.suggestions_index:
+            return False
+        suggest = request.query_params.get('suggest')
+        if suggest is None:
+            return settings.TYPEAHEAD_SUGGEST
+        return suggest.lower() in ('1', 'true', 'yes')
+
+    def suggestions(self, query: str) -> Search:
+        """Completion suggester search for query, its options are the hits"""
+        weesp = ['true', 'false'] if self.features else ['false']
+        return Search(index=self.suggestions_index).extra(size=0).suggest(
+            'suggestions', query,
+            completion={'field': 'suggest', 'size': self.suggestions_size, 'contexts': {'weesp': weesp}})
+
     def _get_uri(self, request, hit):
         # Retrieves the uri part for an item
         url = _get_url(request, hit)['self']['href']
         uri = urlparse(url).path[1:]
         return uri
 
-    def _group_elk_results(self, request, results):
+    def _group_elk_results(self, request, results, unique=False):
         """
-        Group the elk results in their pretty name groups
+        Group the elk results in their pretty name groups, with unique
+        only the first result of an uri is kept
         """
         flat_results = (hit for r in results for hit in r)
         result_groups = defaultdict(list)
+        seen = set()
 
         for hit in flat_results:
+            uri = self._get_uri(request, hit)
+            if unique:
+                if uri in seen:
+                    continue
+                seen.add(uri)
             group = _subtype_mapping[hit.subtype]
             display = hit._display
             if hit.subtype in _add_subtype_display:
                 display += f' ({hit.subtype})'
             result_groups[group].append({
                 '_display': display,
-                'uri': self._get_uri(request, hit)
+                'uri': uri
             })
 
         return result_groups
@@ -484,7 +575,7 @@ class TypeaheadViewSet(viewsets.ViewSet):
                 new_list.append(item)
         return new_list
 
-    def _order_results(self, results, request):
+    def _order_results(self, results, request, unique=False):
         """
         Group the elastic search results and order these groups
 
@@ -492,10 +583,11 @@ class TypeaheadViewSet(viewsets.ViewSet):
         result - the elastic search result object
         query_string - the query string used to search for. This is for exact
                        match recognition
+        unique - drop repeated uris, the suggestions can repeat hits of the queries
         """
 
         # put the elk results in subtype groups
-        result_groups = self._group_elk_results(request, results)
+        result_groups = self._group_elk_results(request, results, unique)
 
         ordered_results = []
 
@@ -538,8 +630,15 @@ class TypeaheadViewSet(viewsets.ViewSet):
         if not query:
             return Response([])
 
-        results = self.autocomplete_queries(request, query, q_select)
-        response = self._order_results(results, request)
+        key = cache.key(request, self, QueryAnalyzer(query), q_select)
+        response = cache.cache_get(key)
+        if response is None:
+            suggest = self.use_suggestions(request)
+            results = self.autocomplete_queries(request, query, q_select, suggest)
+            response = self._order_results(results, request, unique=suggest)
+            # partial results are not cached
+            if not self.failed:
+                cache.cache_set(key, response)
 
         return Response(response)
 
@@ -551,8 +650,19 @@ class BagQ(QFilter):
 
 
 class TypeAheadBagViewSet(TypeaheadViewSet):
+    """
+    With ?suggest=true (or the TYPEAHEAD_SUGGEST setting) the adressen
+    and openbare ruimtes are suggested by the suggestion index instead
+    of the straatnaam, postcode huisnummer and openbare ruimte queries.
+    """
 
     filter_backends = [BagQ]
+    suggestions_index = settings.ELASTIC_INDICES['BAG_SUGGEST']
+    suggested_queries = frozenset({
+        bag_qs.straatnaam_huisnummer_query,
+        bag_qs.postcode_huisnummer_query,
+        bag_qs.openbare_ruimte_query,
+    })
 
     def list(self, request):
         return self._abstr_list(request, {'bag', 'nummeraanduiding', 'pand'})
@@ -654,7 +764,7 @@ class SearchViewSet(viewsets.ViewSet):
         """
         raise NotImplementedError
 
-    def _set_followup_url(self, request, result, end,
+    def _set_followup_url(self, request, count, end,
                           response, query, page):
         """
         Add paging links for result set to response object
@@ -675,7 +785,7 @@ class SearchViewSet(viewsets.ViewSet):
         ])
 
         # Finding and setting prev and next pages
-        if end < result.hits.total:
+        if end < count:
             if end < (self.page_size * self.page_limit):
                 # There should be a next
                 response['_links']['next']['href'] = f"{followup_url}{separator}q={url_query}&page={page + 1}"
@@ -684,15 +794,37 @@ class SearchViewSet(viewsets.ViewSet):
         elif page > 2:
             response['_links']['prev']['href'] = f"{followup_url}{separator}q={url_query}&page={page - 1}"
 
+    def _set_cursor_url(self, request, response, query, cursor, after):
+        """
+        Add the links of cursor paging, next continues after the last
+        hit of this page. There is no previous page.
+        """
+        followup_url = reverse(self.url_name, request=request)
+        separator = '&' if '?' in followup_url else '?'
+        url = f"{followup_url}{separator}q={quote(query)}&cursor="
+
+        response['_links'] = OrderedDict([
+            ('self', {'href': url + quote(cursor)}),
+            ('next', {'href': url + quote(encode_cursor(after)) if after else None}),
+            ('prev', {'href': None})
+        ])
+
     def list(self, request, *args, **kwargs):
         """
         Create a response list of search items
 
+        Pages are limited to page_limit, with the `cursor` parameter
+        (empty for the first page) all hits can be paged through with
+        the next links, using search_after.
+
         ---
         parameters:
             - name: q
               description: Zoek object
               required: true
+            - name: cursor
+              description: Cursor of the next link, empty for the first page
+              required: false
         """
 
         if 'q' not in request.query_params:
@@ -700,8 +832,16 @@ class SearchViewSet(viewsets.ViewSet):
 
         self.features = settings.ENABLE_WEESP_TYPEAHEAD
 
+        cursor = request.query_params.get('cursor')
+        after = None
+        if cursor is not None:
+            try:
+                after = decode_cursor(cursor)
+            except ValueError:
+                return Response({'detail': 'Invalid cursor'}, 400)
+
         page = 1
-        if 'page' in request.query_params:
+        if cursor is None and 'page' in request.query_params:
             # limit search results pageing in elastic is slow
             page = int(request.query_params['page'])
             if page > self.page_limit:
@@ -713,46 +853,62 @@ class SearchViewSet(viewsets.ViewSet):
         query = request.query_params['q']
         analyzer = QueryAnalyzer(query)
 
-        elk_client = Elasticsearch(
-            settings.ELASTIC_SEARCH_HOSTS,
-            raise_on_error=True
-        )
+        # the links are added per request, they contain the query as given
+        key = cache.key(request, self, analyzer, page=page)
+        cached = cache.cache_get(key)
+        if cached is None:
+            elk_client = get_client()
 
-        # get the result from elastic
-        elk_query = self.search_query(request, elk_client, analyzer)
+            # get the result from elastic
+            elk_query = self.search_query(request, elk_client, analyzer)
 
-        search = elk_query[start:end]
+            search = elk_query[start:end]
 
-        if not search:
-            log.debug('no elk query')
-            return Response([])
+            if not search:
+                log.debug('no elk query')
+                return Response([])
 
-        ignore_cache = settings.DEBUG
+            if after is not None:
+                # constant cost per page, unlike from/size
+                search = search.sort(*stable_sort(search))
+                if after:
+                    search = search.extra(search_after=after)
 
-        log.debug(
-            "Running query at %s: %s", search._index,
-            json.dumps(search.to_dict(), indent=4)
-        )
+            ignore_cache = settings.DEBUG
 
-        try:
-            result = search.execute(ignore_cache=ignore_cache)
-        except TransportError:
-            log.exception("Could not execute search query at %s: %s", search._index, query)
-            log.debug(json.dumps(search.to_dict(), indent=4))
-            return Response([], 500)
+            log.debug(
+                "Running query at %s: %s", search._index,
+                json.dumps(search.to_dict(), indent=4)
+            )
 
-        response = OrderedDict()
+            try:
+                result = search.execute(ignore_cache=ignore_cache)
+            except TransportError:
+                log.exception("Could not execute search query at %s: %s", search._index, query)
+                log.debug(json.dumps(search.to_dict(), indent=4))
+                return Response([], 500)
+
+            # log.exception(json.dumps(result.to_dict(), indent=4))
+
+            next_after = None
+            if after is not None and len(result.hits) == self.page_size:
+                next_after = list(result.hits[-1].meta.sort)
 
-        # log.exception(json.dumps(result.to_dict(), indent=4))
+            results = [self.normalize_hit(h, request) for h in result.hits]
+            cached = (result.hits.total, self.list_results(results), next_after)
+            cache.cache_set(key, cached)
 
-        self._set_followup_url(request, result, end, response, query, page)
+        count, results, next_after = cached
+        response = OrderedDict()
+
+        if after is None:
+            self._set_followup_url(request, count, end, response, query, page)
+        else:
+            self._set_cursor_url(request, response, query, cursor, next_after)
 
-        count = result.hits.total
         response['count_hits'] = count
         response['count'] = count
-
-        results = [self.normalize_hit(h, request) for h in result.hits]
-        response['results'] = self.list_results(results)
+        response['results'] = results
 
         return Response(response)
 
@@ -773,6 +929,8 @@ class SearchViewSet(viewsets.ViewSet):
         result['_links'] = self.get_url(request, hit)
         if 'order' in hit:
             del(hit['order'])
+        if ID_FIELD in hit:
+            del(hit[ID_FIELD])
 
         if hit.subtype:
             result['type'] = hit.subtype